@@ -1,11 +1,16 @@
 # backend/admin_auth.py
 from __future__ import annotations
 
-import os, secrets, httpx, jwt, logging
+import os, time, secrets, asyncio, threading, httpx, jwt, logging
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, HTTPException, Response, Request, status
 from pydantic import BaseModel
-from supabase import create_client, Client
+
+from supabase_client import sb_table
+from db import db_acursor
+from event_hub import add_channel_handler, notify
+from nonce_store import get_nonce_store, NonceError, NonceRecord
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("admin_auth")
@@ -18,6 +23,7 @@ ADMIN_JWT_SECRET = os.getenv("ADMIN_JWT_SECRET", "change-me")
 ADMIN_COOKIE_NAME = os.getenv("ADMIN_COOKIE_NAME", "uv_admin")
 TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "")
 ENV = os.getenv("ENV", "").lower()  # "" (dev) | "prod"
+NONCE_TTL = timedelta(minutes=5)
 
 # dev-флаг (можно выключить, но с нашим новым require_admin он уже не обязателен)
 DEV_ADMIN = os.getenv("DEV_ADMIN", "0") == "1"
@@ -40,7 +46,6 @@ else:
     COOKIE_SECURE = False          # главная правка
     COOKIE_SAMESITE = "lax"        # главная правка
 
-sb: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 router = APIRouter(prefix="/admin/auth", tags=["admin-auth"])
 
 
@@ -59,32 +64,48 @@ def _issue_session_cookie(res: Response, payload: dict, hours=24):
     )
 
 
-def _read_session(req: Request):
-    token = req.cookies.get(ADMIN_COOKIE_NAME)
-    if not token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No session")
+# Проверенные токены: token -> (exp, payload). Сессия stateless (HS256), так что
+# повторно проверять подпись до exp незачем. require_admin — sync-зависимость,
+# FastAPI гоняет её в threadpool, поэтому кэш под локом.
+SESSION_CACHE_SIZE = 1024
+_session_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_session_lock = threading.Lock()
+
+
+def _decode_session(token: str) -> dict:
+    now = time.time()
+    with _session_lock:
+        hit = _session_cache.get(token)
+        if hit and hit[0] > now:
+            _session_cache.move_to_end(token)
+            return dict(hit[1])
+        if hit:
+            _session_cache.pop(token, None)
+    if hit:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
+
     try:
-        return jwt.decode(token, ADMIN_JWT_SECRET, algorithms=["HS256"])
+        data = jwt.decode(token, ADMIN_JWT_SECRET, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session")
 
+    exp = data.get("exp")
+    if isinstance(exp, (int, float)):
+        with _session_lock:
+            _session_cache[token] = (float(exp), data)
+            _session_cache.move_to_end(token)
+            while len(_session_cache) > SESSION_CACHE_SIZE:
+                _session_cache.popitem(last=False)
+    return dict(data)
 
-def _parse_ts(ts):
-    """Принимает str или datetime; возвращает tz-aware UTC datetime."""
-    if ts is None:
-        raise ValueError("empty timestamp")
-    if isinstance(ts, datetime):
-        dt = ts
-    else:
-        s = str(ts)
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        dt = datetime.fromisoformat(s)
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(timezone.utc)
+
+def _read_session(req: Request):
+    token = req.cookies.get(ADMIN_COOKIE_NAME)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No session")
+    return _decode_session(token)
 
 
 def _resp_data(resp):
@@ -113,69 +134,136 @@ def _row_or_none(data):
 
 # --- обёртки над supabase с автоподбором схемы ---
 def _table(schema: str, name: str):
-    return sb.schema(schema).table(name)
+    return sb_table(name, schema)
 
 
-def _find_admin_by_email(email: str):
-    last_err = None
-    for schema in ADMIN_SCHEMAS:
-        try:
-            data, err = _resp_data(
-                _table(schema, "admin_users").select("*").eq("email", email).execute()
-            )
-            if err:
-                last_err = f"{schema}: {err}"
-                continue
-            row = _row_or_none(data)
-            if row:
-                log.info("admin_users hit schema=%s", schema)
-                return row
-        except Exception as e:
-            last_err = f"{schema}: {e}"
-    if last_err:
-        log.error("admin_users(by email) not found; last_err=%s", last_err)
-    return None
+# --- admin_users: схема запоминается после первого попадания, записи кэшируются ---
+# Кэш сбрасывается по NOTIFY uv_admin_users (триггер из migrations/007_admin_users_notify.sql)
+# при изменении is_active/role/email/tg_id, а в худшем случае живёт ADMIN_CACHE_TTL секунд.
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", "60"))
+ADMIN_USERS_CHANNEL = "uv_admin_users"
+
+_admin_schema: str | None = None
+_admin_cache: dict[tuple[str, str], tuple[float, dict]] = {}
+
+
+def _cache_admin(row: dict) -> None:
+    expires = time.monotonic() + ADMIN_CACHE_TTL
+    for field in ("id", "email", "tg_id"):
+        if row.get(field) is not None:
+            _admin_cache[(field, str(row[field]))] = (expires, row)
+
+
+def invalidate_admin_cache(payload: dict | None = None) -> None:
+    """Сбросить кэш admin_users (целиком — записей там единицы)."""
+    _admin_cache.clear()
+
+
+add_channel_handler(ADMIN_USERS_CHANNEL, invalidate_admin_cache)
+
+
+async def _query_admin(schema: str, field: str, value):
+    """(row, err) из <schema>.admin_users по одному полю."""
+    try:
+        data, err = _resp_data(
+            await _table(schema, "admin_users").select("*").eq(field, value).execute()
+        )
+    except Exception as e:
+        return None, e
+    if err:
+        if "406" in str(err).lower() or "not acceptable" in str(err).lower():
+            return None, "406"
+        return None, err
+    return _row_or_none(data), None
+
+
+async def _find_admin(field: str, value):
+    global _admin_schema
+    if value is None:
+        return None
 
+    key = (field, str(value))
+    hit = _admin_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+
+    # схема уже известна — один запрос
+    if _admin_schema:
+        row, err = await _query_admin(_admin_schema, field, value)
+        if not err:
+            if row:
+                _cache_admin(row)
+            return row
+        log.warning("admin_users schema=%s failed (%s), rediscovering", _admin_schema, err)
+        _admin_schema = None
 
-def _find_admin_by_tg_id(tg_id: int):
     last_err = None
     for schema in ADMIN_SCHEMAS:
-        try:
-            data, err = _resp_data(
-                _table(schema, "admin_users").select("*").eq("tg_id", tg_id).execute()
-            )
-            if err:
-                if "406" in str(err).lower() or "not acceptable" in str(err).lower():
-                    last_err = f"{schema}: 406"
-                    continue
-                last_err = f"{schema}: {err}"
-                continue
-            row = _row_or_none(data)
-            if row:
-                log.info("admin_users hit schema=%s", schema)
-                return row
-        except Exception as e:
-            last_err = f"{schema}: {e}"
+        row, err = await _query_admin(schema, field, value)
+        if err:
+            last_err = f"{schema}: {err}"
+            continue
+        if row:
+            log.info("admin_users hit schema=%s (by %s), remembered", schema, field)
+            _admin_schema = schema
+            _cache_admin(row)
+            return row
     if last_err:
-        log.error("admin_users(by tg_id) not found; last_err=%s", last_err)
+        log.error("admin_users(by %s) not found; last_err=%s", field, last_err)
     return None
 
 
+async def _find_admin_by_email(email: str):
+    return await _find_admin("email", email)
+
+
+async def _find_admin_by_tg_id(tg_id: int):
+    return await _find_admin("tg_id", tg_id)
+
+
 # ---------- dependency: require_admin ----------
 # РОВНО три разрешённые роли:
 ALLOWED_ADMIN_ROLES = {"admin", "manager", "operator"}
 
 
+# ранги для require_role(min_role)
+ROLE_RANK = {"operator": 1, "manager": 2, "admin": 3}
+
+
 def require_admin(req: Request):
     """
     Достаёт и валидирует нашу админ-сессию из httpOnly cookie.
     Разрешаем только роли из ALLOWED_ADMIN_ROLES.
     Возвращает payload (dict) при успехе.
+    Результат кэшируется на request.state: роутерная зависимость и
+    Depends(require_admin)/require_role в хендлере не декодируют JWT повторно.
 
     В DEV-режиме (ENV != prod) НЕ ломаемся из-за куки:
     - если сессия ок — используем её;
     - если сессии нет/битая/просрочена — логируем и пускаем как dev-admin.
     """
+    cached = getattr(req.state, "admin_user", None)
+    if cached is not None:
+        return cached
+    user = _resolve_admin(req)
+    req.state.admin_user = user
+    return user
+
+
+def require_role(min_role: str = "operator"):
+    """Зависимость для роутов, которым нужна роль не ниже min_role."""
+    need = ROLE_RANK[min_role]
+
+    def dependency(req: Request):
+        user = require_admin(req)
+        if ROLE_RANK.get(user.get("role"), 0) < need:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+        return user
+
+    return dependency
+
+
+def _resolve_admin(req: Request):
     # Не-prod: максимально дружелюбный режим разработки
     if ENV != "prod":
         try:
@@ -235,7 +323,7 @@ async def email_session(body: EmailLoginIn, res: Response):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Auth failed")
 
     # 2) проверяем, что email — админ и активен (автоподбор схемы)
-    row = _find_admin_by_email(body.email)
+    row = await _find_admin_by_email(body.email)
     if not row or not row.get("is_active", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not an admin or inactive")
 
@@ -265,21 +353,10 @@ async def telegram_start():
             detail="Bot username not configured",
         )
     nonce = secrets.token_urlsafe(24)
-    expires_at = datetime.now(timezone.utc) + timedelta(minutes=5)
     try:
-        resp = sb.table("telegram_nonces").insert({
-            "nonce": nonce,
-            "expires_at": expires_at.isoformat(),
-            "used": False
-        }).execute()
-        _, err = _resp_data(resp)
-        if err:
-            log.error("Supabase insert error: telegram_nonces: %s", err)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error")
-    except HTTPException:
-        raise
+        await get_nonce_store().create(nonce, NONCE_TTL)
     except Exception:
-        log.exception("Supabase insert exception: telegram_nonces")
+        log.exception("nonce store: create failed")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error")
     deep_link = f"https://t.me/{TELEGRAM_BOT_USERNAME}?start={nonce}"
     return {"nonce": nonce, "deep_link": deep_link}
@@ -291,154 +368,170 @@ class TgCallbackIn(BaseModel):
     tg_username: str | None = None
 
 
-@router.post("/telegram/callback")
-async def telegram_callback(body: TgCallbackIn):
-    # 1) читаем nonce
+_NONCE_ERRORS = {
+    "not_found": "nonce not found",
+    "used": "nonce already used",
+    "expired": "nonce expired",
+}
+
+
+async def confirm_telegram_login(nonce: str, tg_id: int, tg_username: str | None = None) -> dict:
+    """
+    Подтверждение входа по nonce из /start в боте.
+    Зовётся из HTTP-callback (бот в режиме polling) и напрямую из routes/tg_webhook.py.
+    """
+    store = get_nonce_store()
+
+    # 1) читаем nonce и проверяем срок/состояние
     try:
-        resp = (
-            sb.table("telegram_nonces")
-            .select("*")
-            .eq("nonce", body.nonce)
-            .maybe_single()
-            .execute()
-        )
-        data, err = _resp_data(resp)
-        q = _row_or_none(data)
+        q = await store.get(nonce)
     except Exception:
-        log.exception("Supabase read telegram_nonces failed")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (read nonce)")
-    if err:
-        log.error("Supabase error telegram_nonces (read): %s", err)
+        log.exception("nonce store: read failed")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (read nonce)")
     if not q:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="nonce not found")
-
-    # 2) проверяем срок/состояние
-    try:
-        expires_at = _parse_ts(q.get("expires_at"))
-    except Exception:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bad expires_at")
-    now = datetime.now(timezone.utc)
-    if q.get("used"):
+    if q.used:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="nonce already used")
-    if expires_at < now:
+    if q.expired():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="nonce expired")
 
-    # 3) ищем админа по tg_id (автоподбор схемы)
-    adm = _find_admin_by_tg_id(body.tg_id)
+    # 2) ищем админа по tg_id (автоподбор схемы)
+    adm = await _find_admin_by_tg_id(tg_id)
     if not adm or not adm.get("is_active", False):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Telegram ID is not allowed")
 
-    # 4) помечаем nonce как used; если нет admin_user_id — фоллбэк
-    update_payload = {"used": True, "tg_id": body.tg_id}
+    # 3) атомарно помечаем nonce как used (+ admin_user_id, exchange_token)
+    exchange_token = secrets.token_urlsafe(32)
     try:
-        resp = sb.table("telegram_nonces").update({
-            **update_payload, "admin_user_id": adm.get("id")
-        }).eq("nonce", body.nonce).execute()
-        _, err = _resp_data(resp)
-        if err:
-            # попробуем без admin_user_id
-            resp2 = sb.table("telegram_nonces").update(update_payload).eq("nonce", body.nonce).execute()
-            _, err2 = _resp_data(resp2)
-            if err2:
-                log.error("Supabase update nonce failed (without admin_user_id): %s", err2)
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (update nonce)")
-    except HTTPException:
-        raise
-    except Exception as e:
-        log.warning("Update with admin_user_id failed, retrying without: %s", e)
-        try:
-            resp2 = sb.table("telegram_nonces").update(update_payload).eq("nonce", body.nonce).execute()
-            _, err2 = _resp_data(resp2)
-            if err2:
-                log.error("Supabase update nonce failed (without admin_user_id): %s", err2)
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (update nonce)")
-        except Exception:
-            log.exception("Supabase update nonce exception (without admin_user_id)")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (update nonce)")
-
-    # 5) (опционально) exchange_token
-    exchange_token = None
+        await store.mark_used(nonce, tg_id, adm.get("id"), exchange_token)
+    except NonceError as e:
+        # кто-то успел раньше (повторный /start) или истёк между проверкой и записью
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=_NONCE_ERRORS[e.reason])
+    except Exception:
+        log.exception("nonce store: mark_used failed")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (update nonce)")
+
+    log.info("TG login confirmed: tg_id=%s admin_id=%s", tg_id, adm.get("id"))
+    await _signal_login(nonce)
+    return {"ok": True, "exchange_token": exchange_token, "role": adm["role"]}
+
+
+@router.post("/telegram/callback")
+async def telegram_callback(body: TgCallbackIn):
+    return await confirm_telegram_login(body.nonce, body.tg_id, body.tg_username)
+
+
+# ---------- long-poll ожидание подтверждения ----------
+# telegram_wait паркуется на asyncio.Event по nonce; telegram_callback будит его
+# локально и через NOTIFY (если callback пришёл в другой воркер).
+LOGIN_CHANNEL = "uv_admin_login"
+WAIT_TIMEOUT_MAX = 55
+
+_login_waiters: dict[str, tuple[asyncio.Event, int]] = {}
+
+
+def _wake_login(nonce: str) -> None:
+    item = _login_waiters.get(nonce)
+    if item:
+        item[0].set()
+
+
+def _register_login_waiter(nonce: str) -> asyncio.Event:
+    ev, refs = _login_waiters.get(nonce) or (asyncio.Event(), 0)
+    _login_waiters[nonce] = (ev, refs + 1)
+    return ev
+
+
+def _release_login_waiter(nonce: str) -> None:
+    item = _login_waiters.get(nonce)
+    if not item:
+        return
+    ev, refs = item
+    if refs <= 1:
+        _login_waiters.pop(nonce, None)
+    else:
+        _login_waiters[nonce] = (ev, refs - 1)
+
+
+async def _wait_login(ev: asyncio.Event, timeout: float) -> None:
     try:
-        exchange_token = secrets.token_urlsafe(32)
-        resp = sb.table("telegram_nonces").update({"exchange_token": exchange_token}).eq("nonce", body.nonce).execute()
-        _, err = _resp_data(resp)
-        if err:
-            log.warning("Failed to store exchange_token: %s", err)
+        await asyncio.wait_for(ev.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _signal_login(nonce: str) -> None:
+    _wake_login(nonce)
+    try:
+        async with db_acursor() as cur:
+            await notify(cur, LOGIN_CHANNEL, {"nonce": nonce})
     except Exception as e:
-        log.warning("Exchange token update exception: %s", e)
+        # другие воркеры дождутся своего таймаута и перечитают nonce
+        log.warning("login NOTIFY failed: %s", e)
 
-    log.info("TG login confirmed: tg_id=%s admin_id=%s", body.tg_id, adm.get("id"))
-    return {"ok": True, "exchange_token": exchange_token, "role": adm["role"]}
+
+add_channel_handler(LOGIN_CHANNEL, lambda p: _wake_login(str(p.get("nonce") or "")))
+
+
+async def _read_nonce(nonce: str) -> NonceRecord:
+    try:
+        row = await get_nonce_store().get(nonce)
+    except Exception:
+        log.exception("nonce store: read (wait) failed")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (read nonce)")
+    if not row:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown nonce")
+    return row
 
 
 class WaitIn(BaseModel):
     nonce: str
+    # long-poll: сколько секунд держать запрос до ответа {"ready": false}; 0 — сразу
+    timeout: int = 25
 
 
 @router.post("/telegram/wait")
 async def telegram_wait(body: WaitIn, res: Response):
-    # читаем nonce
+    # Event регистрируем до первого чтения nonce: callback между чтением и
+    # ожиданием иначе не нашёл бы кого будить, и запрос висел бы весь таймаут
+    ev = _register_login_waiter(body.nonce)
     try:
-        resp = (
-            sb.table("telegram_nonces")
-            .select("*")
-            .eq("nonce", body.nonce)
-            .maybe_single()
-            .execute()
-        )
-        data, err = _resp_data(resp)
-        row = _row_or_none(data)
-    except Exception:
-        log.exception("Supabase read telegram_nonces (wait) failed")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (read nonce)")
-    if err:
-        log.error("Supabase error telegram_nonces (wait): %s", err)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="DB error (read nonce)")
-    if not row:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown nonce")
+        row = await _read_nonce(body.nonce)
 
-    # Не подтверждён — просто ждём (и мягко отмечаем просрочку)
-    if not row.get("used"):
-        try:
-            if _parse_ts(row.get("expires_at")) < datetime.now(timezone.utc):
+        # Не подтверждён — ждём сигнала от callback (и мягко отмечаем просрочку)
+        if not row.used:
+            now = datetime.now(timezone.utc)
+            if row.expired(now):
                 return {"ready": False, "expired": True}
-        except Exception:
-            pass
-        return {"ready": False}
 
-    # Подтверждён — найдём админа по admin_user_id или tg_id (автоподбор схемы)
-    adm = None
-    if row.get("admin_user_id"):
-        for schema in ADMIN_SCHEMAS:
-            try:
-                data, err = _resp_data(
-                    sb.schema(schema).table("admin_users").select("*").eq("id", row["admin_user_id"]).execute()
-                )
-                cand = _row_or_none(data)
-                if cand:
-                    adm = cand
-                    log.info("admin_users hit schema=%s (by id)", schema)
-                    break
-            except Exception:
-                continue
+            timeout = max(0, min(body.timeout, WAIT_TIMEOUT_MAX))
+            timeout = min(timeout, (row.expires_at - now).total_seconds())
+            if timeout > 0:
+                await _wait_login(ev, timeout)
+                row = await _read_nonce(body.nonce)
+            if not row.used:
+                return {"ready": False}
+    finally:
+        _release_login_waiter(body.nonce)
 
+    # Подтверждён — найдём админа по admin_user_id или tg_id (автоподбор схемы)
+    adm = await _find_admin("id", row.admin_user_id)
     if not adm:
-        adm = _find_admin_by_tg_id(row.get("tg_id"))
+        adm = await _find_admin_by_tg_id(row.tg_id)
 
     if not adm:
-        log.error("Admin not found on wait: nonce=%s tg_id=%s", body.nonce, row.get("tg_id"))
+        log.error("Admin not found on wait: nonce=%s tg_id=%s", body.nonce, row.tg_id)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin record not found")
 
     payload = {
         "sub": str(adm.get("id")),
-        "tg_id": row.get("tg_id"),
+        "tg_id": row.tg_id,
         "role": adm["role"],
         "kind": "telegram",
         "email": adm.get("email"),
     }
     _issue_session_cookie(res, payload, hours=24)
-    return {"ready": True, "user": {"tg_id": row.get("tg_id"), "role": adm["role"]}}
+    return {"ready": True, "user": {"tg_id": row.tg_id, "role": adm["role"]}}
 
 
 @router.post("/logout")
@@ -465,4 +558,4 @@ def me(req: Request):
     }
 
 
-__all__ = ["router", "require_admin"]
\ No newline at end of file
+__all__ = ["router", "require_admin", "require_role", "confirm_telegram_login"]
\ No newline at end of file
@@ -1,33 +1,32 @@
 # backend/admin_requests.py
 from __future__ import annotations
 
-import os
 from typing import Optional, List, Literal, Any, Tuple
 from datetime import datetime
 import logging
 import json
-import httpx
+import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Response
+from psycopg.rows import dict_row
 from pydantic import BaseModel, Field, validator
-from supabase import create_client, Client
 
 # главная защита админки
 from admin_auth import require_admin
+from supabase_client import sb_table
+from db import db_acursor
+from utils.pagination import decode_cursor, next_cursor, NEXT_CURSOR_HEADER
+from request_search import ids_filter_sql, ranked_sql
+from schema_cache import get_schema
+from notifier import stage_chats, dispatch_staged, status_changed_text
+from media import thumb_urls
+from chat_sync import fetch_messages, mark_read, set_sync_headers, DEFAULT_LIMIT, MAX_LIMIT
+from status_history import set_actor, fetch_history
+from request_status import can_transition
+from admin_requests_mat import ADMIN_VIEW, ADMIN_MAT
 
 log = logging.getLogger("admin_requests")
 
-# ─── env / supabase ─────────────────────────────────────────────────────────────
-SUPABASE_URL = os.getenv("SUPABASE_URL", "")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    raise RuntimeError("Supabase env is missing")
-
-sb: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-
-# Telegram notifications (optional)
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
-
 # ───────────────────────────────────────────────────────────────────────────────
 # ✔ ГЛАВНОЕ: глобальная защита ВСЕЙ админки
 # Все роуты теперь всегда авторизованы (dev-mode уже работает в require_admin)
@@ -97,16 +96,6 @@ def _to_db_status(status: str) -> str:
     return _STATUS_WRITE_MAP.get(key, key)
 
 
-async def _send_tg(chat_id: int, text: str):
-    if not TELEGRAM_BOT_TOKEN or not chat_id:
-        return
-    async with httpx.AsyncClient(timeout=10) as client:
-        await client.post(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-            json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
-        )
-
-
 def _parse_tg_id(resident: Optional[str]) -> Optional[int]:
     if not resident:
         return None
@@ -118,17 +107,113 @@ def _parse_tg_id(resident: Optional[str]) -> Optional[int]:
     return None
 
 
-def _human_status(s: str) -> str:
-    s = (s or "").lower()
-    mapping = {
-        "pending": "New",
-        "confirmed": "Confirmed",
-        "in_progress": "Confirmed",
-        "done": "Done",
-        "cancelled": "Canceled",
-        "cancelled_by_user": "Canceled by user",
-    }
-    return mapping.get(s, s)
+# ─── projections ────────────────────────────────────────────────────────────────
+# Колонки admin_requests_v, которые вообще можно запросить через ?select=
+# (совпадает с FULL_SELECT во frontend/src/admin/api.ts, включая алиасы-опечатки).
+# Отсутствующие во вьюхе колонки молча отбрасываются.
+SELECTABLE_COLUMNS = (
+    "id", "status", "category", "service", "service_code", "service_title",
+    "name", "username", "resident", "phone", "resident_phone", "contact_name",
+    "contact_phone", "unit", "resident_unit_text", "unit_number", "address",
+    "property_name", "title", "description", "details", "desritption", "desc",
+    "preferred_time", "due_at", "priority", "internal_only", "auto_assign",
+    "assignee", "photos", "photo_paths", "photo_urls", "attachments", "photo",
+    "image", "created_at", "updated_at",
+    # из request_chat_state (см. _admin_source)
+    "last_message_at", "last_author_role", "last_message_preview",
+    "unread_by_staff", "unread_by_resident",
+)
+
+# То, что рисует таблица RequestsDashboard
+LIST_COLUMNS = (
+    "id", "status", "category", "service_title", "name", "username", "resident",
+    "unit", "address", "priority", "assignee", "preferred_time", "due_at",
+    "created_at", "updated_at", "last_message_at", "last_author_role", "unread_by_staff",
+)
+
+PROJECTIONS = {
+    "list": LIST_COLUMNS,
+    "detail": SELECTABLE_COLUMNS,
+}
+
+# без них не работают курсор и ключи строк
+_REQUIRED_COLUMNS = ("id", "created_at")
+
+# Строки админки = admin_requests_mat (хранимая копия admin_requests_v, migrations/014)
+# + состояние чата (migrations/011_request_chat_state.sql). Пока 014 не применена — сама вьюха.
+# Подзапрос, а не вьюха-обёртка: v.* во вьюхе зафиксировался бы на момент создания.
+CHAT_COLUMNS = (
+    "last_message_at", "last_author_role", "last_message_preview",
+    "unread_by_staff", "unread_by_resident",
+)
+
+
+def _chat_source(base: str) -> str:
+    return f"""(
+    select av.*, cs.last_message_at, cs.last_author_role, cs.last_message_preview,
+           coalesce(cs.unread_by_staff, 0) as unread_by_staff,
+           coalesce(cs.unread_by_resident, 0) as unread_by_resident
+    from {base} av
+    left join request_chat_state cs on cs.request_id = av.id
+)"""
+
+
+def _admin_base(snap) -> str:
+    return ADMIN_MAT if snap.has_table(ADMIN_MAT) else ADMIN_VIEW
+
+
+async def _admin_source() -> str:
+    """FROM-выражение для строк админки (без join, пока миграция 011 не применена)."""
+    snap = await get_schema()
+    base = _admin_base(snap)
+    return _chat_source(base) if snap.has_table("request_chat_state") else base
+
+# список вместо photos отдаёт thumbs — URL превью (media.py), полноразмерные фото только в detail
+_THUMB_SOURCE = "photos"
+
+
+def _wants_thumbs(select: Optional[str], projection: str) -> bool:
+    return not select and projection == "list"
+
+
+def _attach_thumbs(rows: List[dict]) -> List[dict]:
+    for row in rows:
+        row["thumbs"] = thumb_urls(row.pop(_THUMB_SOURCE, None))
+    return rows
+
+
+async def _resolve_columns(select: Optional[str], projection: str) -> List[str]:
+    if select:
+        wanted = [c.strip() for c in select.split(",") if c.strip()]
+        wanted = [c for c in wanted if c in SELECTABLE_COLUMNS]
+    else:
+        wanted = list(PROJECTIONS.get(projection, LIST_COLUMNS))
+        if _wants_thumbs(select, projection):
+            wanted.append(_THUMB_SOURCE)
+    for c in reversed(_REQUIRED_COLUMNS):
+        if c not in wanted:
+            wanted.insert(0, c)
+
+    snap = await get_schema()
+    existing = snap.table_columns(_admin_base(snap))
+    if not existing:
+        # снимка схемы нет (холодный старт, БД не ответила) — не знаем, каких колонок
+        # нет во вьюхе, поэтому v.*, а не список, который может упасть на отсутствующей
+        return [ALL_COLUMNS]
+    if snap.has_table("request_chat_state"):
+        existing = existing | set(CHAT_COLUMNS)
+    wanted = [c for c in wanted if c in existing]
+    return list(dict.fromkeys(wanted))
+
+
+ALL_COLUMNS = "*"
+
+
+def _columns_sql(cols: List[str], alias: str = "") -> str:
+    prefix = f"{alias}." if alias else ""
+    if cols == [ALL_COLUMNS]:
+        return f"{prefix}*"
+    return ", ".join(f'{prefix}"{c}"' for c in cols)
 
 
 # ─── models ─────────────────────────────────────────────────────────────────────
@@ -145,110 +230,389 @@ class AdminRequestMessageOut(BaseModel):
     created_at: datetime
 
 
+BULK_MAX_IDS = 500
+
+
+class AdminStatusIn(BaseModel):
+    status: str
+
+
+class AdminBulkIn(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=BULK_MAX_IDS)
+    op: Literal["status", "assign", "delete"]
+    status: Optional[str] = None
+    assignee: Optional[str] = None
+    projection: Optional[Literal["list", "detail"]] = None
+
+    @validator("status", always=True)
+    def _status_for_op(cls, v, values):
+        if values.get("op") == "status" and not (v or "").strip():
+            raise ValueError("status required for op=status")
+        return v
+
+
 # ─── list requests ───────────────────────────────────────────────────────────────
+# Читаем напрямую из Postgres (пул db.py): keyset-пагинация по (created_at, id)
+# через PostgREST не сочетается с or-фильтром поиска.
 @router.get("", response_model=List[Any])
-def list_requests(
+async def list_requests(
+    response: Response,
     status: Optional[StatusView | Literal["all"]] = Query(None),
     q: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor предыдущей страницы"),
+    select: Optional[str] = Query(None, description="колонки через запятую (whitelist SELECTABLE_COLUMNS)"),
+    projection: Literal["list", "detail"] = Query("list"),
 ):
+    cols = await _resolve_columns(select, projection)
+    after = decode_cursor(cursor)
+    where: List[str] = []
+    params: dict = {}
+
+    if status and status != "all":
+        where.append("status::text = %(status)s")
+        params["status"] = status
+
+    if q and q.strip():
+        # индекс request_search вместо ilike по четырём колонкам вьюхи
+        cond, search_params = ids_filter_sql(q.strip())
+        where.append(cond)
+        params.update(search_params)
+
+    if after:
+        where.append("(created_at, id) < (%(after_ts)s, %(after_id)s)")
+        params["after_ts"], params["after_id"] = after
+
+    sql = f"select {_columns_sql(cols)} from {await _admin_source()} v"
+    if where:
+        sql += " where " + " and ".join(where)
+    sql += " order by created_at desc, id desc limit %(limit)s"
+    params["limit"] = limit + 1
+    if offset and not after:
+        # старый режим (offset) оставлен для совместимости
+        sql += " offset %(offset)s"
+        params["offset"] = offset
+
     try:
-        qr = sb.table("admin_requests_v").select("*").order("created_at", desc=True)
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
-        if status and status != "all":
-            qr = qr.eq("status", status)
+    nxt = next_cursor(rows, limit)
+    if nxt:
+        response.headers[NEXT_CURSOR_HEADER] = nxt
+    if _wants_thumbs(select, projection):
+        _attach_thumbs(rows)
+    return rows
 
-        if q:
-            like = f"%{q}%"
-            qr = qr.or_(
-                "name.ilike.{0},address.ilike.{0},resident.ilike.{0},category.ilike.{0}".format(
-                    like
-                )
-            )
 
-        qr = qr.range(offset, offset + limit - 1)
-        data, err = _resp_data(qr.execute())
-        if err:
-            raise HTTPException(status_code=500, detail=str(err))
-        return data or []
+# ─── search (command palette) ───────────────────────────────────────────────────
+@router.get("/search", response_model=List[Any])
+async def search_requests(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Ранжированный поиск с префиксами слов; рассчитан на debounce-запросы с фронта."""
+    cols = await _resolve_columns(None, "list")
+    sql, params = ranked_sql(q.strip(), await _admin_source(), limit, columns=_columns_sql(cols, "v"))
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            return _attach_thumbs(await cur.fetchall())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
 
 # ─── get one ────────────────────────────────────────────────────────────────────
 @router.get("/{id}")
-def get_request(id: str):
-    data, err = _resp_data(
-        sb.table("admin_requests_v").select("*").eq("id", id).maybe_single().execute()
-    )
-    row = _row_or_none(data)
-    if err:
-        raise HTTPException(status_code=500, detail=str(err))
+async def get_request(
+    id: str,
+    select: Optional[str] = Query(None, description="колонки через запятую (whitelist SELECTABLE_COLUMNS)"),
+    projection: Literal["list", "detail"] = Query("detail"),
+):
+    cols = await _resolve_columns(select, projection)
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                f"select {_columns_sql(cols)} from {await _admin_source()} v where id = %(id)s",
+                {"id": request_id},
+            )
+            row = await cur.fetchone()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
     if not row:
         raise HTTPException(status_code=404, detail="Not found")
+    if _wants_thumbs(select, projection):
+        _attach_thumbs([row])
     return row
 
 
+# ─── bulk ───────────────────────────────────────────────────────────────────────
+# Переходы — request_status.TRANSITIONS (статусы в терминах БД, после _to_db_status).
+# Переход в тот же статус — не ошибка, строка просто не трогается.
+
+
+def _split_ids(ids: List[str]) -> Tuple[List[str], List[dict]]:
+    # битый uuid уронил бы весь запрос с ::uuid[] — отсекаем заранее
+    ok, failed, seen = [], [], set()
+    for raw in ids:
+        try:
+            norm = str(uuid.UUID(str(raw).strip()))
+        except ValueError:
+            failed.append({"id": raw, "error": "bad id"})
+            continue
+        if norm not in seen:
+            seen.add(norm)
+            ok.append(norm)
+    return ok, failed
+
+
+def _plan_status(
+    ids: List[str], current: dict, target: str
+) -> Tuple[List[str], List[str], List[dict]]:
+    """
+    Разбор op=status по текущим статусам (id → status):
+    (уже в target, к смене, отказы {id, error}) — порядок ids сохраняется.
+    """
+    unchanged, to_change, refused = [], [], []
+    for rid in ids:
+        src = current[rid]
+        if src == target:
+            unchanged.append(rid)
+        elif can_transition(src, target):
+            to_change.append(rid)
+        else:
+            refused.append({"id": rid, "error": f"transition {src} -> {target} not allowed"})
+    return unchanged, to_change, refused
+
+
+@router.post("/bulk")
+async def bulk_requests(body: AdminBulkIn, user=Depends(require_admin)):
+    """
+    Массовая операция над заявками одной транзакцией.
+    Ответ: {"updated": [строки админки (_admin_source)], "deleted": [id], "failed": [{id, error}]}.
+    """
+    ids, failed = _split_ids(body.ids)
+    updated_ids: List[str] = []
+    deleted: List[str] = []
+    staged: list = []
+    rows: List[dict] = []
+
+    snap = await get_schema()
+    if body.op == "assign" and snap.table_columns("requests") and not snap.has_column("requests", "assignee"):
+        raise HTTPException(status_code=400, detail="assignee column is not available")
+    projection = body.projection or "list"
+    cols = await _resolve_columns(None, projection)
+    source = await _admin_source()
+
+    async with db_acursor(row_factory=dict_row) as cur:
+        await set_actor(cur, user.get("sub"))
+        if ids:
+            # блокируем строки, чтобы проверка перехода и запись видели одно состояние
+            await cur.execute(
+                "select r.id::text as id, r.status::text as status, u.tg_id"
+                " from requests r left join users u on u.id = r.user_id"
+                " where r.id = any(%(ids)s::uuid[]) for update of r",
+                {"ids": ids},
+            )
+            current = {r["id"]: r for r in await cur.fetchall()}
+            for rid in ids:
+                if rid not in current:
+                    failed.append({"id": rid, "error": "not found"})
+            ids = [rid for rid in ids if rid in current]
+
+        if ids and body.op == "status":
+            target = _to_db_status(body.status)
+            statuses = {rid: r["status"] for rid, r in current.items()}
+            unchanged, to_change, refused = _plan_status(ids, statuses, target)
+            updated_ids.extend(unchanged)
+            failed.extend(refused)
+            if to_change:
+                await cur.execute(
+                    "update requests set status = %(status)s, updated_at = now()"
+                    " where id = any(%(ids)s::uuid[])",
+                    {"status": target, "ids": to_change},
+                )
+                updated_ids.extend(to_change)
+                # строки outbox — в этой же транзакции
+                staged = await stage_chats(
+                    cur, [(current[rid]["tg_id"], status_changed_text(target)) for rid in to_change]
+                )
+
+        elif ids and body.op == "assign":
+            await cur.execute(
+                "update requests set assignee = %(assignee)s, updated_at = now()"
+                " where id = any(%(ids)s::uuid[])",
+                {"assignee": body.assignee, "ids": ids},
+            )
+            updated_ids = ids
+
+        elif ids and body.op == "delete":
+            await cur.execute(
+                "delete from requests where id = any(%(ids)s::uuid[]) returning id::text as id",
+                {"ids": ids},
+            )
+            deleted = [r["id"] for r in await cur.fetchall()]
+
+        if updated_ids:
+            # одно чтение вьюхи на весь батч, внутри той же транзакции
+            await cur.execute(
+                f"select {_columns_sql(cols)} from {source} v"
+                " where id = any(%(ids)s::uuid[]) order by created_at desc, id desc",
+                {"ids": updated_ids},
+            )
+            rows = await cur.fetchall()
+    if _wants_thumbs(None, projection):
+        _attach_thumbs(rows)
+
+    # в очередь notifier.py — только после коммита
+    dispatch_staged(staged)
+    return {"updated": rows, "deleted": deleted, "failed": failed}
+
+
 # ─── update status ───────────────────────────────────────────────────────────────
 @router.post("/{id}/status")
-def update_status(id: str, body: dict):
-    target_status = _to_db_status(body.get("status"))
-    data, err = _resp_data(
-        sb.table("requests")
-        .update({"status": target_status, "updated_at": datetime.utcnow().isoformat()})
-        .eq("id", id).execute()
-    )
-    if err:
-        raise HTTPException(status_code=500, detail=f"DB error: {err}")
-    if not _row_or_none(data):
+async def update_status(id: str, body: AdminStatusIn, user=Depends(require_admin)):
+    # как и раньше, без проверки перехода: одиночная смена — ручная правка админа;
+    # граф переходов (request_status.py) проверяет только bulk
+    target_status = _to_db_status(body.status)
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
         raise HTTPException(status_code=404, detail="Not found")
-
-    data2, err2 = _resp_data(
-        sb.table("admin_requests_v").select("*").eq("id", id).maybe_single().execute()
-    )
-    row2 = _row_or_none(data2)
-    if err2:
-        raise HTTPException(status_code=500, detail=str(err2))
+    source = await _admin_source()
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            # прежний статус и чат жителя — тем же join, что и в bulk
+            await cur.execute(
+                "select r.status::text as status, u.tg_id"
+                " from requests r left join users u on u.id = r.user_id"
+                " where r.id = %(id)s for update of r",
+                {"id": request_id},
+            )
+            current = await cur.fetchone()
+            if not current:
+                raise HTTPException(status_code=404, detail="Not found")
+            # update и событие в request_status_events — одной транзакцией
+            await set_actor(cur, user.get("sub"))
+            await cur.execute(
+                "update requests set status = %(status)s, updated_at = now() where id = %(id)s",
+                {"status": target_status, "id": request_id},
+            )
+            staged = []
+            if current["status"] != target_status:
+                staged = await stage_chats(cur, [(current["tg_id"], status_changed_text(target_status))])
+            await cur.execute(f"select * from {source} v where id = %(id)s", {"id": request_id})
+            row2 = await cur.fetchone()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
     if not row2:
         raise HTTPException(status_code=404, detail="Not found (view)")
+    dispatch_staged(staged)
     return row2
 
 
+@router.get("/{id}/history")
+async def request_status_history(id: str):
+    """Переходы статуса по возрастанию времени (request_status_events)."""
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            return await fetch_history(cur, request_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+
 # ─── assign ─────────────────────────────────────────────────────────────────────
 @router.post("/{id}/assign")
-def assign_request(id: str, body: dict):
-    payload = {"assignee": body.get("assignee"), "updated_at": datetime.utcnow().isoformat()}
-    data, err = _resp_data(sb.table("requests").update(payload).eq("id", id).execute())
-    if err:
-        raise HTTPException(status_code=500, detail=f"DB error: {err}")
-    data2, err2 = _resp_data(
-        sb.table("admin_requests_v").select("*").eq("id", id).maybe_single().execute()
-    )
-    row2 = _row_or_none(data2)
-    if err2:
-        raise HTTPException(status_code=500, detail=str(err2))
-    return row2
+async def assign_request(id: str, body: dict):
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    source = await _admin_source()
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                "update requests set assignee = %(assignee)s, updated_at = now() where id = %(id)s",
+                {"assignee": body.get("assignee"), "id": request_id},
+            )
+            # строка admin_requests_mat уже пересчитана триггером в этой транзакции
+            await cur.execute(f"select * from {source} v where id = %(id)s", {"id": request_id})
+            return await cur.fetchone()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
 
 # ─── chat: list messages ────────────────────────────────────────────────────────
+# Инкрементально: after=<id|iso> — только новые, before — история (см. chat_sync.py)
 @router.get("/{id}/messages", response_model=List[AdminRequestMessageOut])
-def list_request_messages_admin(id: str):
-    data, err = _resp_data(
-        sb.table("request_messages")
-        .select("*")
-        .eq("request_id", id)
-        .order("created_at", desc=False)
-        .execute()
-    )
-    if err:
-        raise HTTPException(status_code=500, detail=str(err))
-    return data or []
+async def list_request_messages_admin(
+    id: str,
+    response: Response,
+    after: Optional[str] = Query(None, description="id или iso-время последнего полученного сообщения"),
+    before: Optional[str] = Query(None, description="id или iso-время: страница истории до него"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description=f"без него и без курсора — вся история; с курсором — {DEFAULT_LIMIT}"),
+):
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            rows, has_older, has_more = await fetch_messages(
+                cur, request_id,
+                "m.id::text as id, m.request_id::text as request_id, m.author_id::text as author_id,"
+                " m.author_role, m.body, m.created_at",
+                after=after, before=before, limit=limit,
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    set_sync_headers(response, has_older, has_more)
+    return rows
+
+
+# ─── chat: mark read ────────────────────────────────────────────────────────────
+class AdminMarkReadIn(BaseModel):
+    # id или iso-время последнего показанного сообщения; пусто — всё до текущего момента
+    upto: Optional[str] = None
+
+
+@router.post("/{id}/messages/read")
+async def mark_request_messages_read_admin(id: str, body: AdminMarkReadIn = Body(default=AdminMarkReadIn())):
+    try:
+        request_id = str(uuid.UUID(id))
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute("select 1 from requests where id = %s", (request_id,))
+            if not await cur.fetchone():
+                raise HTTPException(status_code=404, detail="Not found")
+            return await mark_read(cur, request_id, "staff", body.upto)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
 
 
 # ─── chat: create message ───────────────────────────────────────────────────────
 @router.post("/{id}/messages", response_model=AdminRequestMessageOut)
-def create_request_message_admin(id: str, body: AdminRequestMessageIn, user=Depends(require_admin)):
+async def create_request_message_admin(id: str, body: AdminRequestMessageIn, user=Depends(require_admin)):
     text = body.body.strip()
     if not text:
         raise HTTPException(status_code=400, detail="body required")
@@ -264,7 +628,7 @@ def create_request_message_admin(id: str, body: AdminRequestMessageIn, user=Depe
         "created_at": datetime.utcnow().isoformat(),
     }
 
-    data, err = _resp_data(sb.table("request_messages").insert(payload).execute())
+    data, err = _resp_data(await sb_table("request_messages").insert(payload).execute())
     if err:
         raise HTTPException(status_code=500, detail=f"DB error: {err}")
 
@@ -274,8 +638,8 @@ def create_request_message_admin(id: str, body: AdminRequestMessageIn, user=Depe
 
 # ─── delete ─────────────────────────────────────────────────────────────────────
 @router.delete("/{id}")
-def delete_request(id: str):
-    data, err = _resp_data(sb.table("requests").delete().eq("id", id).execute())
+async def delete_request(id: str):
+    data, err = _resp_data(await sb_table("requests").delete().eq("id", id).execute())
     if err:
         raise HTTPException(status_code=500, detail=f"DB error: {err}")
     return {"ok": True, "id": id}
\ No newline at end of file
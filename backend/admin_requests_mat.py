@@ -0,0 +1,96 @@
+# backend/admin_requests_mat.py
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List
+
+# Сверка admin_requests_mat с логической вьюхой admin_requests_v
+# (migrations/014_admin_requests_mat.sql). Используется из /admin/system и как CLI:
+#   python -m admin_requests_mat            — отчёт
+#   python -m admin_requests_mat --fix      — пересчитать разошедшиеся строки
+ADMIN_VIEW = "admin_requests_v"
+ADMIN_MAT = "admin_requests_mat"
+
+# Порядок колонок важен: строки пересчитываются через insert ... select *
+_COLUMNS_SQL = """
+    select table_name, array_agg(column_name::text order by ordinal_position)
+    from information_schema.columns
+    where table_schema = 'public' and table_name in (%s, %s)
+    group by table_name
+"""
+
+# Полное сравнение строк через jsonb; на таблице заявок это один hash join
+_DIFF_SQL = f"""
+    select coalesce(v.id, m.id)::text as id,
+           case when m.id is null then 'missing'
+                when v.id is null then 'extra'
+                else 'stale' end as problem
+    from (select x.id, to_jsonb(x) as j from {ADMIN_VIEW} x) v
+    full join (select y.id, to_jsonb(y) as j from {ADMIN_MAT} y) m on m.id = v.id
+    where v.j is distinct from m.j
+    order by 1
+"""
+
+_FIX_SQL = "select public.admin_requests_mat_refresh_ids(%s::uuid[])"
+
+
+async def check_consistency(cur, fix: bool = False, limit: int = 50) -> Dict[str, Any]:
+    """Сверка на async-курсоре с кортежами (db_acursor()). fix — пересчитать расхождения."""
+    await cur.execute(_COLUMNS_SQL, (ADMIN_VIEW, ADMIN_MAT))
+    columns = {t: list(cols) for t, cols in await cur.fetchall()}
+    if ADMIN_MAT not in columns:
+        return {"ok": False, "error": f"{ADMIN_MAT} does not exist (apply migrations/014)"}
+    view_cols, mat_cols = columns.get(ADMIN_VIEW, []), columns[ADMIN_MAT]
+    diff: List[Any] = []
+    if view_cols == mat_cols:
+        await cur.execute(_DIFF_SQL)
+        diff = await cur.fetchall()
+
+    problems: Dict[str, int] = {}
+    for _, problem in diff:
+        problems[problem] = problems.get(problem, 0) + 1
+    report: Dict[str, Any] = {
+        "ok": not diff and view_cols == mat_cols,
+        "columns_match": view_cols == mat_cols,
+        "missing_columns": [c for c in view_cols if c not in mat_cols],
+        "extra_columns": [c for c in mat_cols if c not in view_cols],
+        "mismatched": len(diff),
+        "problems": problems,
+        "sample": [{"id": i, "problem": p} for i, p in diff[:limit]],
+    }
+    if fix and diff:
+        await cur.execute(_FIX_SQL, ([i for i, _ in diff],))
+        report["fixed"] = len(diff)
+    return report
+
+
+async def _run(fix: bool, limit: int) -> Dict[str, Any]:
+    from db import open_pool, close_pool, db_acursor
+
+    await open_pool()
+    try:
+        async with db_acursor() as cur:
+            return await check_consistency(cur, fix=fix, limit=limit)
+    finally:
+        await close_pool()
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=f"Сверка {ADMIN_MAT} с {ADMIN_VIEW}")
+    ap.add_argument("--fix", action="store_true", help="пересчитать разошедшиеся строки")
+    ap.add_argument("--limit", type=int, default=50, help="сколько id показать в отчёте")
+    args = ap.parse_args(argv)
+
+    report = asyncio.run(_run(args.fix, args.limit))
+    if "error" in report:
+        print(report["error"], file=sys.stderr)
+        return 2
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["ok"] or report.get("fixed") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
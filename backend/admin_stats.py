@@ -0,0 +1,264 @@
+# backend/admin_stats.py
+from __future__ import annotations
+
+import asyncio, logging, os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from psycopg.rows import dict_row
+
+from admin_auth import require_admin, require_role
+from db import db_acursor
+
+log = logging.getLogger("admin_stats")
+
+# Статистика для дашборда. Читает только роллапы (migrations/012_request_stats_rollups.sql),
+# стоимость запроса зависит от числа бакетов, а не от объёма истории. Триггер на requests
+# пишет дельты в request_stats_delta; в роллапы их сворачивает фоновая задача
+# (раз в STATS_FOLD_INTERVAL секунд) и сам запрос статистики перед чтением.
+STATS_FOLD_INTERVAL = float(os.getenv("STATS_FOLD_INTERVAL", "10"))
+
+router = APIRouter(
+    prefix="/admin/stats",
+    tags=["admin-stats"],
+    dependencies=[Depends(require_admin)]
+)
+
+EVENTS = ("created", "confirmed", "done", "cancelled")
+
+# granularity → (таблица, шаг, тип бакета, максимум бакетов в ответе)
+_GRAIN = {
+    "hour": ("request_stats_hourly", timedelta(hours=1), "timestamptz", 24 * 31),
+    "day": ("request_stats_daily", timedelta(days=1), "date", 366 * 3),
+}
+
+_EVENT_SUMS = ",\n".join(
+    f"coalesce(sum(s.n) filter (where s.event = '{e}'), 0)::int as {e}" for e in EVENTS
+)
+
+
+def _parse_ts(value: Optional[str], name: str) -> Optional[datetime]:
+    raw = (value or "").strip()
+    if not raw:
+        return None
+    try:
+        ts = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(400, f"bad {name}: expected ISO date/time")
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _window(granularity: str, since: Optional[str], until: Optional[str], buckets: Optional[int]):
+    """Границы [since, until) выровнены по бакетам (UTC)."""
+    _, step, _, max_buckets = _GRAIN[granularity]
+    end = _parse_ts(until, "to") or datetime.now(timezone.utc)
+    if granularity == "hour":
+        end = end.replace(minute=0, second=0, microsecond=0) + step
+    else:
+        end = end.replace(hour=0, minute=0, second=0, microsecond=0) + step
+    start = _parse_ts(since, "from")
+    if start is None:
+        start = end - step * (buckets or (24 if granularity == "hour" else 30))
+    elif granularity == "hour":
+        start = start.replace(minute=0, second=0, microsecond=0)
+    else:
+        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if start >= end:
+        raise HTTPException(400, "from must be before to")
+    if (end - start) / step > max_buckets:
+        raise HTTPException(400, f"range too large for granularity={granularity} (max {max_buckets} buckets)")
+    return start, end
+
+
+# ─── dashboard ──────────────────────────────────────────────────────────────────
+@router.get("")
+async def get_stats(
+    granularity: Literal["hour", "day"] = Query("day"),
+    since: Optional[str] = Query(None, alias="from", description="ISO, включительно"),
+    until: Optional[str] = Query(None, alias="to", description="ISO, включительно (бакет целиком)"),
+    buckets: Optional[int] = Query(None, ge=1, le=1098, description="если from не задан: число последних бакетов"),
+    category: Optional[str] = Query(None),
+):
+    """
+    series — ряд по бакетам без пропусков (нули для пустых), totals/by_category — суммы за окно,
+    status_counts — текущее число заявок по (категория, статус).
+    """
+    table, step, bucket_type, _ = _GRAIN[granularity]
+    start, end = _window(granularity, since, until, buckets)
+    params: Dict[str, Any] = {
+        "start": start,
+        "last": end - step,
+        "end": end,
+        "step": step,
+        "cat": category,
+    }
+    if bucket_type == "date":
+        params["start"], params["last"], params["end"] = start.date(), (end - step).date(), end.date()
+
+    cat_filter = "and s.category = %(cat)s" if category is not None else ""
+    await fold_stats()
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                f"""
+                select g.bucket::{bucket_type} as bucket, {_EVENT_SUMS}
+                from generate_series(%(start)s::{bucket_type}, %(last)s::{bucket_type}, %(step)s::interval) as g(bucket)
+                left join {table} s on s.bucket = g.bucket::{bucket_type} {cat_filter}
+                group by 1
+                order by 1
+                """,
+                params,
+            )
+            series = await cur.fetchall()
+
+            await cur.execute(
+                f"""
+                select s.category, {_EVENT_SUMS}
+                from {table} s
+                where s.bucket >= %(start)s and s.bucket < %(end)s {cat_filter}
+                group by s.category
+                order by created desc, s.category
+                """,
+                params,
+            )
+            by_category = await cur.fetchall()
+
+            await cur.execute(
+                "select category, status, n from request_status_counts s"
+                f" where n <> 0 {cat_filter} order by category, status",
+                params,
+            )
+            status_counts = await cur.fetchall()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+    totals = {e: sum(r[e] for r in by_category) for e in EVENTS}
+    return {
+        "granularity": granularity,
+        "from": start,
+        "to": end,
+        "category": category,
+        "series": series,
+        "totals": totals,
+        "by_category": by_category,
+        "status_counts": status_counts,
+    }
+
+
+# ─── SLA / время в статусах ─────────────────────────────────────────────────────
+# Длительности по заявке ведёт триггер (migrations/013_request_status_events.sql),
+# здесь только перцентили по окну created_at.
+_SLA_AGGS = """
+    count(*)::int as requests,
+    count(d.time_to_confirm_s)::int as confirmed,
+    count(d.time_to_done_s)::int as done,
+    percentile_cont(0.5) within group (order by d.time_to_confirm_s) as confirm_p50_s,
+    percentile_cont(0.9) within group (order by d.time_to_confirm_s) as confirm_p90_s,
+    percentile_cont(0.5) within group (order by d.time_to_done_s) as done_p50_s,
+    percentile_cont(0.9) within group (order by d.time_to_done_s) as done_p90_s
+"""
+
+
+@router.get("/sla")
+async def get_sla(
+    since: Optional[str] = Query(None, alias="from", description="ISO, по created_at заявки"),
+    until: Optional[str] = Query(None, alias="to", description="ISO, включительно (день целиком)"),
+    days: Optional[int] = Query(None, ge=1, le=1098, description="если from не задан: последние N дней"),
+    category: Optional[str] = Query(None),
+):
+    """
+    Медиана и p90 времени до взятия в работу и до выполнения (секунды) —
+    всего, по категориям и по исполнителям. Незакрытые заявки в перцентили не входят.
+    """
+    start, end = _window("day", since, until, days)
+    params: Dict[str, Any] = {"start": start, "end": end, "cat": category}
+    cat_filter = "and d.category = %(cat)s" if category is not None else ""
+    try:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                f"""
+                select grouping(d.category) as g_cat, grouping(d.assignee) as g_asg,
+                       d.category, d.assignee, {_SLA_AGGS}
+                from request_status_durations d
+                where d.created_at >= %(start)s and d.created_at < %(end)s {cat_filter}
+                group by grouping sets ((), (d.category), (d.assignee))
+                order by requests desc
+                """,
+                params,
+            )
+            rows = await cur.fetchall()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+    overall: Dict[str, Any] = {}
+    by_category, by_assignee = [], []
+    for r in rows:
+        g_cat, g_asg = r.pop("g_cat"), r.pop("g_asg")
+        if g_cat and g_asg:
+            r.pop("category")
+            r.pop("assignee")
+            overall = r
+        elif g_asg:
+            r.pop("assignee")
+            by_category.append(r)
+        else:
+            r.pop("category")
+            by_assignee.append(r)
+    return {
+        "from": start,
+        "to": end,
+        "category": category,
+        "overall": overall,
+        "by_category": by_category,
+        "by_assignee": by_assignee,
+    }
+
+
+@router.post("/rebuild", dependencies=[Depends(require_role("admin"))])
+async def rebuild_stats():
+    """Полный пересчёт роллапов из requests (после ручных правок/импорта в обход триггера)."""
+    try:
+        async with db_acursor() as cur:
+            await cur.execute("select public.request_stats_rebuild()")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    return {"ok": True}
+
+
+# ─── свёртка дельт ──────────────────────────────────────────────────────────────
+_fold_task: Optional[asyncio.Task] = None
+
+
+async def fold_stats() -> int:
+    """Свернуть request_stats_delta в роллапы; ошибки только логируем (отдадим чуть старые цифры)."""
+    try:
+        async with db_acursor() as cur:
+            await cur.execute("select public.request_stats_fold()")
+            return (await cur.fetchone())[0] or 0
+    except Exception as e:
+        log.warning("stats fold failed: %s", e)
+        return 0
+
+
+async def _fold_forever() -> None:
+    while True:
+        await asyncio.sleep(STATS_FOLD_INTERVAL)
+        await fold_stats()
+
+
+async def start_stats_folder() -> None:
+    global _fold_task
+    if _fold_task is None:
+        _fold_task = asyncio.create_task(_fold_forever(), name="stats-fold")
+
+
+async def stop_stats_folder() -> None:
+    global _fold_task
+    if _fold_task is not None:
+        _fold_task.cancel()
+        try:
+            await _fold_task
+        except asyncio.CancelledError:
+            pass
+        _fold_task = None
@@ -0,0 +1,52 @@
+# backend/admin_system.py
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from admin_auth import require_role
+from admin_requests_mat import check_consistency
+from db import db_acursor
+from schema_cache import load_schema, get_schema
+
+router = APIRouter(
+    prefix="/admin/system",
+    tags=["admin-system"],
+    dependencies=[Depends(require_role("admin"))]
+)
+
+
+# ─── schema cache ───────────────────────────────────────────────────────────────
+@router.get("/schema")
+async def schema_info():
+    snap = await get_schema()
+    return snap.as_dict()
+
+
+@router.post("/schema/refresh")
+async def schema_refresh():
+    try:
+        snap = await load_schema()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    return {"ok": True, "loaded_at": snap.loaded_at, "tables": len(snap.columns), "views": len(snap.views)}
+
+
+# ─── admin_requests_mat ─────────────────────────────────────────────────────────
+@router.get("/admin-requests-mat/check")
+async def admin_requests_mat_check(fix: bool = Query(False), limit: int = Query(50, ge=1, le=1000)):
+    """Сверка admin_requests_mat с admin_requests_v; fix=true пересчитывает расхождения."""
+    try:
+        async with db_acursor() as cur:
+            return await check_consistency(cur, fix=fix, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+
+
+@router.post("/admin-requests-mat/rebuild")
+async def admin_requests_mat_rebuild():
+    try:
+        async with db_acursor() as cur:
+            await cur.execute("select public.admin_requests_mat_refresh_all()")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {e}")
+    return {"ok": True}
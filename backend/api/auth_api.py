@@ -2,10 +2,11 @@ from __future__ import annotations
 
 from typing import Optional, Any, Dict, List, Tuple
 
-from fastapi import APIRouter, Request, Header, HTTPException, Response
+from fastapi import APIRouter, Depends, Request, HTTPException, Response
 
-from utils.telegram import extract_user_from_request
-from db import db_cursor
+from utils.telegram import extract_user_from_request, current_tg_user, init_data_from_headers
+from db import db_acursor
+from schema_cache import get_schema
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -20,44 +21,7 @@ def _pick_init_header(request: Request, x_telegram_init_data: Optional[str]) ->
     """
     Берём initData из заголовка (приоритет) или из вариаций заголовков.
     """
-    if x_telegram_init_data:
-        return x_telegram_init_data
-    h = request.headers
-    return (
-        h.get("X-Telegram-Init-Data")
-        or h.get("x-telegram-init-data")
-        or h.get("X-INIT-DATA")
-        or h.get("x-init-data")
-    )
-
-
-def _table_has_column(cur, table_name: str, column_name: str) -> bool:
-    cur.execute(
-        """
-        select 1
-        from information_schema.columns
-        where table_schema = 'public'
-          and table_name = %s
-          and column_name = %s
-        limit 1
-        """,
-        (table_name, column_name),
-    )
-    return cur.fetchone() is not None
-
-
-def _view_exists(cur, view_name: str) -> bool:
-    cur.execute(
-        """
-        select 1
-        from information_schema.views
-        where table_schema = 'public'
-          and table_name = %s
-        limit 1
-        """,
-        (view_name,),
-    )
-    return cur.fetchone() is not None
+    return init_data_from_headers(request, x_telegram_init_data) or None
 
 
 def _normalize_roles(raw: List[str]) -> List[str]:
@@ -79,60 +43,70 @@ def _normalize_roles(raw: List[str]) -> List[str]:
     return roles
 
 
-def _fetch_profile_by_tgid(cur, tg_id: int) -> Tuple[Dict[str, Any], List[str]]:
+def _upsert_user_sql(has_avatar: bool) -> str:
     """
-    Возвращает (user_dict, roles) по tg_id.
-    user_dict поля: tg_id, username, name, email, phone, language, unit, avatar_url (если есть)
-    roles: собраны из admin_users + resident по умолчанию, потом нормализованы и resident скрыт при наличии staff
+    INSERT ... ON CONFLICT для users. Колонка avatar_url есть не во всех инсталляциях,
+    её наличие берём из schema_cache.
     """
-    # Базовый профиль из users (+ avatar_url если столбец существует)
-    has_avatar = _table_has_column(cur, "users", "avatar_url")
     if has_avatar:
-        cur.execute(
-            """
-            select tg_id, username, name, email, phone, language, unit,
-                   coalesce(nullif(avatar_url,''), null) as avatar_url
-            from users
-            where tg_id = %s
-            limit 1
-            """,
-            (tg_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
-        tg_id_v, username_v, name_v, email_v, phone_v, lang_v, unit_v, avatar_v = row
-    else:
-        cur.execute(
-            """
-            select tg_id, username, name, email, phone, language, unit
-            from users
-            where tg_id = %s
-            limit 1
-            """,
-            (tg_id,),
-        )
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="User not found")
-        tg_id_v, username_v, name_v, email_v, phone_v, lang_v, unit_v = row
-        avatar_v = None
-
-    # Роли из admin_users по tg_id
-    cur.execute(
+        return """
+            insert into users (tg_id, username, name, email, phone, language, unit, avatar_url, created_at, updated_at)
+            values (%(tg_id)s, %(username)s, %(name)s, null, null, %(language)s, null, %(avatar_url)s, now(), now())
+            on conflict (tg_id) do update
+              set username   = excluded.username,
+                  name       = coalesce(excluded.name, users.name),
+                  language   = coalesce(excluded.language, users.language),
+                  avatar_url = coalesce(excluded.avatar_url, users.avatar_url),
+                  updated_at = now()
         """
-        select array_agg(distinct
-                 case lower(trim(role))
-                   when 'owner' then 'admin'
-                   else lower(trim(role))
-                 end
-               ) filter (where role is not null) as staff_roles
-        from admin_users
-        where is_active = true and tg_id = %s
-        """,
-        (tg_id,),
-    )
-    staff_roles = cur.fetchone()[0] or []
+    return """
+        insert into users (tg_id, username, name, email, phone, language, unit, created_at, updated_at)
+        values (%(tg_id)s, %(username)s, %(name)s, null, null, %(language)s, null, now(), now())
+        on conflict (tg_id) do update
+          set username   = excluded.username,
+              name       = coalesce(excluded.name, users.name),
+              language   = coalesce(excluded.language, users.language),
+              updated_at = now()
+    """
+
+
+def _login_sql(has_avatar: bool) -> str:
+    """
+    Один round trip на логин: upsert в users с RETURNING + роли из admin_users.
+    Колонки: tg_id, username, name, email, phone, language, unit, avatar_url, staff_roles
+    """
+    avatar_col = "nullif(u.avatar_url, '')" if has_avatar else "null::text"
+    returning = "tg_id, username, name, email, phone, language, unit"
+    if has_avatar:
+        returning += ", avatar_url"
+    return f"""
+        with u as (
+            {_upsert_user_sql(has_avatar)}
+            returning {returning}
+        )
+        select u.tg_id, u.username, u.name, u.email, u.phone, u.language, u.unit,
+               {avatar_col} as avatar_url,
+               s.staff_roles
+        from u
+        left join lateral (
+            select array_agg(distinct
+                     case lower(trim(a.role))
+                       when 'owner' then 'admin'
+                       else lower(trim(a.role))
+                     end
+                   ) filter (where a.role is not null) as staff_roles
+            from admin_users a
+            where a.is_active = true and a.tg_id = u.tg_id
+        ) s on true
+    """
+
+
+def _user_from_row(row: Tuple[Any, ...]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    (user_dict, roles) из строки _login_sql.
+    roles: admin_users + resident по умолчанию, потом нормализованы и resident скрыт при наличии staff
+    """
+    tg_id_v, username_v, name_v, email_v, phone_v, lang_v, unit_v, avatar_v, staff_roles = row
 
     # Добавим resident “по умолчанию”, затем нормализуем
     raw_roles = (staff_roles or []) + ["resident"]
@@ -191,17 +165,14 @@ def _cookie_tg_id(request: Request) -> Optional[int]:
 
 @router.post("/me", response_model=Dict[str, Any])
 async def me(
-    request: Request,
     response: Response,
-    x_telegram_init_data: Optional[str] = Header(default=None, alias="X-Telegram-Init-Data"),
+    tg_user: Dict[str, Any] = Depends(current_tg_user),
 ):
     """
     Принимаем Telegram initData, валидируем, апсертим пользователя, читаем роли.
     Дополнительно выставляем httpOnly-куку с tg_id, чтобы последующие запросы
     (например, /api/uploads с FormData) не падали из-за отсутствия заголовков.
     """
-    init_header = _pick_init_header(request, x_telegram_init_data)
-    tg_user = await extract_user_from_request(request, init_header)
     if not tg_user or "id" not in tg_user:
         raise HTTPException(status_code=401, detail="Invalid Telegram user")
 
@@ -216,71 +187,53 @@ async def me(
     if last_name:
         display_name = f"{display_name} {last_name}".strip()
 
-    # 1) UPSERT в users
+    params = {
+        "tg_id": tg_id,
+        "username": username,
+        "name": display_name,
+        "language": language_code,
+        "avatar_url": photo_url,
+    }
+    has_avatar = (await get_schema()).has_column("users", "avatar_url")
+    row, read_error = None, None
+
+    # UPSERT + профиль + РОЛИ одним запросом на одном соединении из пула
     try:
-        with db_cursor() as cur:
-            has_avatar = _table_has_column(cur, "users", "avatar_url")
-            if has_avatar:
-                cur.execute(
-                    """
-                    insert into users (tg_id, username, name, email, phone, language, unit, avatar_url, created_at, updated_at)
-                    values (%s, %s, %s, null, null, %s, null, %s, now(), now())
-                    on conflict (tg_id) do update
-                      set username   = excluded.username,
-                          name       = coalesce(excluded.name, users.name),
-                          language   = coalesce(excluded.language, users.language),
-                          avatar_url = coalesce(excluded.avatar_url, users.avatar_url),
-                          updated_at = now()
-                    """,
-                    (tg_id, username, display_name, language_code, photo_url),
-                )
-            else:
-                cur.execute(
-                    """
-                    insert into users (tg_id, username, name, email, phone, language, unit, created_at, updated_at)
-                    values (%s, %s, %s, null, null, %s, null, now(), now())
-                    on conflict (tg_id) do update
-                      set username   = excluded.username,
-                          name       = coalesce(excluded.name, users.name),
-                          language   = coalesce(excluded.language, users.language),
-                          updated_at = now()
-                    """,
-                    (tg_id, username, display_name, language_code),
-                )
+        async with db_acursor() as cur:
+            try:
+                await cur.execute(_login_sql(has_avatar), params)
+                row = await cur.fetchone()
+            except Exception as e:
+                # fallback: хотя бы сохраняем пользователя, отдаём минимальный профиль (resident)
+                await cur.connection.rollback()
+                await cur.execute(_upsert_user_sql(has_avatar), params)
+                row, read_error = None, e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upsert failed: {e}")
 
-    # 2) ЧТЕНИЕ профиля + РОЛИ
-    try:
-        with db_cursor() as cur:
-            user, roles = _fetch_profile_by_tgid(cur, tg_id)
-
-        # Выставляем сессию (куку)
-        _set_session_cookie(response, tg_id)
+    # Выставляем сессию (куку)
+    _set_session_cookie(response, tg_id)
 
+    if row is not None:
+        user, roles = _user_from_row(row)
         return {"user": user, "roles": roles}
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        # fallback: минимальный профиль, resident
-        _set_session_cookie(response, tg_id)
-        return {
-            "user": {
-                "id": tg_id,
-                "tg_id": tg_id,
-                "username": username,
-                "name": display_name,
-                "email": None,
-                "phone": None,
-                "language": language_code,
-                "unit": None,
-                "avatar_url": photo_url,
-                "roles": ["resident"],
-            },
+    return {
+        "user": {
+            "id": tg_id,
+            "tg_id": tg_id,
+            "username": username,
+            "name": display_name,
+            "email": None,
+            "phone": None,
+            "language": language_code,
+            "unit": None,
+            "avatar_url": photo_url,
             "roles": ["resident"],
-            "warning": f"profile read failed: {e}",
-        }
+        },
+        "roles": ["resident"],
+        "warning": f"profile read failed: {read_error}",
+    }
 
 
 @router.get("/check", response_model=Dict[str, Any])
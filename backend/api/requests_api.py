@@ -5,7 +5,7 @@ from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 import json
 
-from fastapi import APIRouter, Body, Header, HTTPException, Request
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
 from models.requests import (
     RequestCreate,
     RequestCancel,
@@ -13,9 +13,17 @@ from models.requests import (
     RequestItem,
     RequestMessageCreate,
     RequestMessageItem,
+    RequestMarkRead,
 )
-from utils.telegram import extract_user_from_request
-from db import db_cursor
+from utils.telegram import current_tg_user
+from db import db_acursor
+from utils.pagination import decode_cursor, next_cursor, NEXT_CURSOR_HEADER
+from notifier import stage_chats, dispatch_staged, status_changed_text
+from chat_sync import fetch_messages, mark_read, set_sync_headers, DEFAULT_LIMIT, MAX_LIMIT
+from status_history import set_actor
+from request_status import sources_for
+from schema_cache import get_schema
+from media import photo_file_id, file_url
 
 router = APIRouter(prefix="/requests", tags=["requests"])
 
@@ -23,13 +31,7 @@ router = APIRouter(prefix="/requests", tags=["requests"])
 # Статусы и переходы
 # ────────────────────────────────────────────────────────────────────
 ALLOWED = ("pending", "confirmed", "done", "cancelled", "cancelled_by_user")
-TRANSITIONS = {
-    "pending": {"confirmed", "cancelled", "cancelled_by_user"},
-    "confirmed": {"done", "cancelled"},
-    "done": set(),
-    "cancelled": set(),
-    "cancelled_by_user": set(),
-}
+# таблица переходов — request_status.TRANSITIONS (общая с админкой)
 
 
 def _ts(v: Any) -> Any:
@@ -51,7 +53,7 @@ def _row_to_dict(row: Tuple[Any, ...]) -> Dict[str, Any]:
     # 7: updated_at
     # 8: preferred_time
     # 9: photos
-    return {
+    item = {
         "id": str(row[0]),
         "tg_id": int(row[1]),
         "category": row[2],
@@ -63,27 +65,87 @@ def _row_to_dict(row: Tuple[Any, ...]) -> Dict[str, Any]:
         "preferred_time": _ts(row[8]),
         "photos": row[9],
     }
+    # 10..12 — только если выбраны _CHAT_COLS
+    if len(row) > 10:
+        item["last_message_at"] = _ts(row[10])
+        item["last_author_role"] = row[11]
+        item["unread_count"] = int(row[12] or 0)
+    return item
 
 
-def _normalize_status(s: Optional[str]) -> str:
-    return (s or "").strip().lower()
+# колонки RequestItem в порядке _row_to_dict (r = requests, u = users)
+_ITEM_COLS = """
+                r.id,
+                u.tg_id,
+                r.category,
+                r.unit,
+                r.details,
+                r.status,
+                r.created_at,
+                r.updated_at,
+                r.preferred_time,
+                r.photos
+"""
 
 
-# helper: получить UUID пользователя по tg_id
-def _get_user_uuid_by_tg(cur, tg_id: int) -> str:
-    cur.execute("select id from users where tg_id = %s limit 1", (tg_id,))
-    r = cur.fetchone()
-    if not r:
-        raise HTTPException(404, "user not found for tg_id")
-    return str(r[0])
+# состояние чата для списка резидента (migrations/011_request_chat_state.sql), cs = request_chat_state
+_CHAT_COLS = """,
+                cs.last_message_at,
+                cs.last_author_role,
+                cs.unread_by_resident
+"""
+_CHAT_JOIN = "left join request_chat_state cs on cs.request_id = r.id"
+
+
+def _normalize_status(s: Optional[str]) -> str:
+    return (s or "").strip().lower()
 
 
-def _ensure_request_owner(cur, req_id: str, tg_id: int) -> Tuple[str, str]:
+async def _resolve_photos(cur, photos: List[Any], tg_id: int) -> str:
+    """
+    photos из /requests/create → jsonb. Каждая ссылка должна указывать на файл,
+    загруженный этим пользователем (upload_owners); size/type берём из uploads.
+    """
+    ids = []
+    for item in photos:
+        fid = photo_file_id(item)
+        if not fid:
+            raise HTTPException(422, "photos: expected links returned by /api/uploads")
+        ids.append(fid)
+    found: Dict[str, Tuple[Any, Any]] = {}
+    if ids:
+        await cur.execute(
+            """
+            select u.id, u.size, u.content_type
+            from uploads u
+            join upload_owners o on o.upload_id = u.id and o.tg_id = %s
+            where u.id = any(%s)
+            """,
+            (tg_id, ids),
+        )
+        found = {r[0]: (r[1], r[2]) for r in await cur.fetchall()}
+    out = []
+    for item, fid in zip(photos, ids):
+        if fid not in found:
+            raise HTTPException(422, f"photos: unknown upload {fid}")
+        name = item.get("name") if isinstance(item, dict) else None
+        size, ctype = found[fid]
+        out.append({
+            "id": fid,
+            "url": file_url(fid),
+            "name": str(name)[:255] if name else None,
+            "size": size,
+            "type": ctype,
+        })
+    return json.dumps(out)
+
+
+async def _ensure_request_owner(cur, req_id: str, tg_id: int) -> Tuple[str, str]:
     """
     Проверяем, что заявка принадлежит пользователю с данным tg_id.
     Возвращаем (request_uuid, user_uuid), иначе 404/403.
     """
-    cur.execute(
+    await cur.execute(
         """
         select r.id, r.user_id, u.tg_id
         from requests r
@@ -92,7 +154,7 @@ def _ensure_request_owner(cur, req_id: str, tg_id: int) -> Tuple[str, str]:
         """,
         (req_id,),
     )
-    row = cur.fetchone()
+    row = await cur.fetchone()
     if not row:
         raise HTTPException(404, "request not found")
     req_uuid, user_uuid, owner_tg = str(row[0]), str(row[1]), int(row[2])
@@ -106,45 +168,42 @@ def _ensure_request_owner(cur, req_id: str, tg_id: int) -> Tuple[str, str]:
 # ────────────────────────────────────────────────────────────────────
 @router.get("/my", response_model=List[RequestItem])
 async def my_requests(
-    request: Request,
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor предыдущей страницы"),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
-    tg = await extract_user_from_request(request, x_telegram_init_data)
     tg_id = int(tg["id"])
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            select
-                r.id,
-                u.tg_id,
-                r.category,
-                r.unit,
-                r.details,
-                r.status,
-                r.created_at,
-                r.updated_at,
-                r.preferred_time,
-                r.photos
+    after = decode_cursor(cursor)
+    keyset = "and (r.created_at, r.id) < (%s, %s)" if after else ""
+    params: List[Any] = [tg_id, *(after or ()), limit + 1]
+    has_chat = (await get_schema()).has_table("request_chat_state")
+    async with db_acursor() as cur:
+        await cur.execute(
+            f"""
+            select {_ITEM_COLS}{_CHAT_COLS if has_chat else ""}
             from requests r
             join users u on u.id = r.user_id
+            {_CHAT_JOIN if has_chat else ""}
             where u.tg_id = %s
-            order by r.created_at desc
+            {keyset}
+            order by r.created_at desc, r.id desc
+            limit %s
             """,
-            (tg_id,),
+            params,
         )
-        rows = cur.fetchall()
+        rows = await cur.fetchall()
+    # строки — кортежи в порядке _row_to_dict: 6 = created_at, 0 = id
+    nxt = next_cursor(rows, limit, created_key=6, id_key=0)
+    if nxt:
+        response.headers[NEXT_CURSOR_HEADER] = nxt
     return [_row_to_dict(r) for r in rows]
 
 
 @router.get("/{request_id}", response_model=RequestItem)
 async def get_request(
     request_id: str,
-    request: Request,
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
     """
     Одна заявка для резидента.
@@ -154,17 +213,16 @@ async def get_request(
 
     Плюс проверка, что заявка принадлежит текущему пользователю.
     """
-    tg = await extract_user_from_request(request, x_telegram_init_data)
     tg_id = int(tg["id"])
 
     req_id = (request_id or "").strip()
     if not req_id:
         raise HTTPException(400, "request_id required")
 
-    with db_cursor() as cur:
-        req_uuid, user_uuid = _ensure_request_owner(cur, req_id, tg_id)
+    async with db_acursor() as cur:
+        req_uuid, user_uuid = await _ensure_request_owner(cur, req_id, tg_id)
 
-        cur.execute(
+        await cur.execute(
             """
             select
                 r.id,
@@ -183,7 +241,7 @@ async def get_request(
             """,
             (req_uuid,),
         )
-        row = cur.fetchone()
+        row = await cur.fetchone()
         if not row:
             raise HTTPException(404, "request not found")
 
@@ -192,13 +250,9 @@ async def get_request(
 
 @router.post("/create", response_model=RequestItem)
 async def create_request(
-    request: Request,
     payload: RequestCreate = Body(...),
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
-    tg = await extract_user_from_request(request, x_telegram_init_data)
     tg_id = int(tg["id"])
 
     category = (payload.category or "").strip()
@@ -217,156 +271,91 @@ async def create_request(
         except Exception:
             preferred_dt = None
 
-    # photos: json-совместимая структура → jsonb
-    photos_json = None
-    if getattr(payload, "photos", None) is not None:
-        try:
-            photos_json = json.dumps(payload.photos)
-        except Exception:
-            photos_json = json.dumps([])
-
-    with db_cursor() as cur:
-        user_uuid = _get_user_uuid_by_tg(cur, tg_id)
-        cur.execute(
-            """
-            insert into requests (
-                id,
-                user_id,
-                category,
-                unit,
-                details,
-                status,
-                created_at,
-                updated_at,
-                preferred_time,
-                photos
-            )
-            values (
-                gen_random_uuid(),
-                %s,
-                %s,
-                %s,
-                %s,
-                %s,
-                now(),
-                now(),
-                %s,
-                %s
+    async with db_acursor() as cur:
+        # photos: ссылки на свои загрузки → jsonb
+        photos_json = None
+        if payload.photos is not None:
+            photos_json = await _resolve_photos(cur, payload.photos, tg_id)
+
+        # INSERT ... SELECT из users: заодно проверяем, что пользователь есть,
+        # и сразу отдаём строку в формате _row_to_dict — без повторного select
+        await cur.execute(
+            f"""
+            with ins as (
+                insert into requests (
+                    id,
+                    user_id,
+                    category,
+                    unit,
+                    details,
+                    status,
+                    created_at,
+                    updated_at,
+                    preferred_time,
+                    photos
+                )
+                select gen_random_uuid(), u.id, %s, %s, %s, %s, now(), now(), %s, %s
+                from users u
+                where u.tg_id = %s
+                returning *
             )
-            returning id
-            """,
-            (user_uuid, category, unit, details, "pending", preferred_dt, photos_json),
-        )
-        new_id = cur.fetchone()[0]
-
-        cur.execute(
-            """
-            select
-                r.id,
-                u.tg_id,
-                r.category,
-                r.unit,
-                r.details,
-                r.status,
-                r.created_at,
-                r.updated_at,
-                r.preferred_time,
-                r.photos
-            from requests r
+            select {_ITEM_COLS}
+            from ins r
             join users u on u.id = r.user_id
-            where r.id = %s
             """,
-            (new_id,),
+            (category, unit, details, "pending", preferred_dt, photos_json, tg_id),
         )
-        row = cur.fetchone()
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(404, "user not found for tg_id")
     return _row_to_dict(row)
 
 
 @router.post("/cancel", response_model=RequestItem)
 async def cancel_request_by_user(
-    request: Request,
     payload: RequestCancel = Body(...),
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
-    tg = await extract_user_from_request(request, x_telegram_init_data)
     tg_id = int(tg["id"])
     req_id = (payload.id or "").strip()
     if not req_id:
         raise HTTPException(400, "id required")
 
-    with db_cursor() as cur:
-        # здесь оставляем старый селект, потому что нужен r.user_id (индексы важны)
-        cur.execute(
-            """
-            select
-                r.id,
-                u.tg_id,
-                r.category,
-                r.unit,
-                r.details,
-                r.status,
-                r.created_at,
-                r.updated_at,
-                r.user_id
-            from requests r
+    async with db_acursor() as cur:
+        await set_actor(cur, f"tg:{tg_id}")
+        # проверка владельца и статуса — внутри самого UPDATE, без гонки между чтением и записью
+        await cur.execute(
+            f"""
+            with upd as (
+                update requests r
+                   set status = %s, updated_at = now()
+                  from users u
+                 where r.id = %s
+                   and u.id = r.user_id
+                   and u.tg_id = %s
+                   and r.status = 'pending'
+             returning r.*
+            )
+            select {_ITEM_COLS}
+            from upd r
             join users u on u.id = r.user_id
-            where r.id = %s
             """,
-            (req_id,),
+            ("cancelled_by_user", req_id, tg_id),
         )
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(404, "request not found")
-
-        owner_tg = int(row[1])
-        old_status = _normalize_status(row[5])
-        owner_uuid = str(row[8])
-
-        if owner_tg != tg_id:
-            raise HTTPException(403, "not your request")
-        if old_status != "pending":
-            raise HTTPException(400, f"cannot cancel from '{old_status}'")
+        row = await cur.fetchone()
+        if row:
+            return _row_to_dict(row)
 
-        new_status = "cancelled_by_user"
-        cur.execute(
-            """
-            update requests
-               set status = %s, updated_at = now()
-             where id = %s and user_id = %s
-         returning id
-            """,
-            (new_status, req_id, owner_uuid),
-        )
-
-        # а вот тут уже возвращаем расширенный набор полей
-        cur.execute(
-            """
-            select
-                r.id,
-                u.tg_id,
-                r.category,
-                r.unit,
-                r.details,
-                r.status,
-                r.created_at,
-                r.updated_at,
-                r.preferred_time,
-                r.photos
-            from requests r
-            join users u on u.id = r.user_id
-            where r.id = %s
-            """,
-            (req_id,),
-        )
-        row2 = cur.fetchone()
-    return _row_to_dict(row2)
+        # не обновилось — разбираемся почему (только на пути ошибки)
+        req_uuid, _ = await _ensure_request_owner(cur, req_id, tg_id)
+        await cur.execute("select status from requests where id = %s", (req_uuid,))
+        cur_row = await cur.fetchone()
+    old_status = _normalize_status(cur_row[0] if cur_row else None)
+    raise HTTPException(400, f"cannot cancel from '{old_status}'")
 
 
 @router.post("/update_status", response_model=RequestItem)
 async def admin_update_status(
-    request: Request,
     payload: AdminUpdateStatus = Body(...),
     x_api_key: Optional[str] = Header(default=None),
 ):
@@ -380,63 +369,56 @@ async def admin_update_status(
     if new_status not in ALLOWED:
         raise HTTPException(422, f"invalid status '{new_status}'")
 
-    with db_cursor() as cur:
-        cur.execute("select status from requests where id = %s", (req_id,))
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(404, "request not found")
-
-        old_status = _normalize_status(row[0])
-        if old_status == new_status:
-            # сразу возвращаем заявку с расширенными полями
-            cur.execute(
-                """
-                select
-                    r.id,
-                    u.tg_id,
-                    r.category,
-                    r.unit,
-                    r.details,
-                    r.status,
-                    r.created_at,
-                    r.updated_at,
-                    r.preferred_time,
-                    r.photos
-                from requests r
-                join users u on u.id = r.user_id
-                where r.id = %s
-                """,
-                (req_id,),
+    # из каких статусов сюда можно прийти — проверяется атомарно в WHERE
+    sources = sources_for(new_status)
+
+    async with db_acursor() as cur:
+        # request_status_events пишет триггер в этой же транзакции; вызывающий — по API-ключу
+        await set_actor(cur, "api")
+        await cur.execute(
+            f"""
+            with upd as (
+                update requests
+                   set status = %s, updated_at = now()
+                 where id = %s
+                   and status::text = any(%s)
+             returning *
             )
-            return _row_to_dict(cur.fetchone())
-
-        if new_status not in TRANSITIONS.get(old_status, set()):
-            raise HTTPException(409, f"transition {old_status} -> {new_status} not allowed")
-
-        cur.execute(
-            "update requests set status = %s, updated_at = now() where id = %s",
-            (new_status, req_id),
+            select {_ITEM_COLS}
+            from upd r
+            join users u on u.id = r.user_id
+            """,
+            (new_status, req_id, sources),
         )
-        cur.execute(
-            """
-            select
-                r.id,
-                u.tg_id,
-                r.category,
-                r.unit,
-                r.details,
-                r.status,
-                r.created_at,
-                r.updated_at,
-                r.preferred_time,
-                r.photos
+        row = await cur.fetchone()
+        if row:
+            item = _row_to_dict(row)
+            # строка outbox коммитится вместе со сменой статуса
+            staged = await stage_chats(cur, [(item["tg_id"], status_changed_text(new_status))])
+    if row:
+        # в очередь — уже после коммита
+        dispatch_staged(staged)
+        return item
+
+    async with db_acursor() as cur:
+        # не обновилось: заявки нет, статус уже такой же, или переход запрещён
+        await cur.execute(
+            f"""
+            select {_ITEM_COLS}
             from requests r
             join users u on u.id = r.user_id
             where r.id = %s
             """,
             (req_id,),
         )
-        return _row_to_dict(cur.fetchone())
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(404, "request not found")
+    old_status = _normalize_status(row[5])
+    if old_status == new_status:
+        return _row_to_dict(row)
+    raise HTTPException(409, f"transition {old_status} -> {new_status} not allowed")
+
 
 
 # ────────────────────────────────────────────────────────────────────
@@ -445,30 +427,30 @@ async def admin_update_status(
 @router.get("/{request_id}/messages", response_model=List[RequestMessageItem])
 async def list_request_messages(
     request_id: str,
-    request: Request,
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    response: Response,
+    after: Optional[str] = Query(None, description="id или iso-время последнего полученного сообщения"),
+    before: Optional[str] = Query(None, description="id или iso-время: страница истории до него"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT, description=f"без него и без курсора — вся история; с курсором — {DEFAULT_LIMIT}"),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
-    """Список сообщений по заявке для резидента (только владелец заявки)."""
-    tg = await extract_user_from_request(request, x_telegram_init_data)
+    """
+    Сообщения по заявке для резидента (только владелец заявки).
+    Без after/before/limit — вся история; только limit — последние limit.
+    X-Has-Older / X-Has-More в заголовках.
+    """
     tg_id = int(tg["id"])
     req_id = (request_id or "").strip()
     if not req_id:
         raise HTTPException(400, "request_id required")
 
-    with db_cursor() as cur:
-        _ensure_request_owner(cur, req_id, tg_id)
-        cur.execute(
-            """
-            select id, request_id, author_id, author_role, body, created_at
-            from request_messages
-            where request_id = %s
-            order by created_at asc
-            """,
-            (req_id,),
+    async with db_acursor() as cur:
+        req_uuid, _ = await _ensure_request_owner(cur, req_id, tg_id)
+        rows, has_older, has_more = await fetch_messages(
+            cur, req_uuid,
+            "m.id, m.request_id, m.author_id, m.author_role, m.body, m.created_at",
+            after=after, before=before, limit=limit,
         )
-        rows = cur.fetchall()
+    set_sync_headers(response, has_older, has_more)
 
     items: List[RequestMessageItem] = []
     for r in rows:
@@ -485,17 +467,32 @@ async def list_request_messages(
     return items
 
 
+@router.post("/{request_id}/messages/read")
+async def mark_request_messages_read(
+    request_id: str,
+    payload: Optional[RequestMarkRead] = Body(default=None),
+    tg: Dict[str, Any] = Depends(current_tg_user),
+):
+    """Резидент прочитал чат до payload.upto (по умолчанию — до текущего момента)."""
+    tg_id = int(tg["id"])
+    req_id = (request_id or "").strip()
+    if not req_id:
+        raise HTTPException(400, "request_id required")
+
+    async with db_acursor() as cur:
+        req_uuid, _ = await _ensure_request_owner(cur, req_id, tg_id)
+        state = await mark_read(cur, req_uuid, "resident", payload.upto if payload else None)
+    state["read_at"] = _ts(state["read_at"])
+    return state
+
+
 @router.post("/{request_id}/messages", response_model=RequestMessageItem)
 async def create_request_message(
     request_id: str,
-    request: Request,
     payload: RequestMessageCreate = Body(...),
-    x_telegram_init_data: Optional[str] = Header(
-        default=None, alias="X-Telegram-Init-Data"
-    ),
+    tg: Dict[str, Any] = Depends(current_tg_user),
 ):
     """Отправка сообщения в чат по заявке от резидента (владельца заявки)."""
-    tg = await extract_user_from_request(request, x_telegram_init_data)
     tg_id = int(tg["id"])
     req_id = (request_id or "").strip()
     if not req_id:
@@ -505,9 +502,9 @@ async def create_request_message(
     if not body:
         raise HTTPException(400, "body required")
 
-    with db_cursor() as cur:
-        req_uuid, user_uuid = _ensure_request_owner(cur, req_id, tg_id)
-        cur.execute(
+    async with db_acursor() as cur:
+        req_uuid, user_uuid = await _ensure_request_owner(cur, req_id, tg_id)
+        await cur.execute(
             """
             insert into request_messages (id, request_id, author_id, author_role, body, created_at)
             values (gen_random_uuid(), %s, %s, %s, %s, now())
@@ -515,7 +512,7 @@ async def create_request_message(
             """,
             (req_uuid, user_uuid, "resident", body),
         )
-        r = cur.fetchone()
+        r = await cur.fetchone()
 
     return RequestMessageItem(
         id=str(r[0]),
@@ -0,0 +1,170 @@
+# backend/chat_sync.py
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+
+# Инкрементальная выдача чата по заявке (резидент и админка).
+# Без параметров — вся история (как было до курсоров); limit без якорей — последние limit;
+# after=<id|iso-время> — только новее; before=<id|iso-время> — страница истории перед ним.
+# Порядок всегда по возрастанию (created_at, id), индекс
+# idx_request_messages_request_created_id (migrations/010_request_messages_sync.sql).
+# Тело ответа — массив, флаги в заголовках:
+HAS_OLDER_HEADER = "X-Has-Older"   # есть сообщения старше первого отданного
+HAS_MORE_HEADER = "X-Has-More"     # after-страница обрезана по limit, есть ещё новее
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def _anchor(value: Optional[str], name: str) -> Optional[Tuple[str, Any]]:
+    """('id', uuid) или ('ts', datetime); 400 на мусор."""
+    raw = (value or "").strip()
+    if not raw:
+        return None
+    try:
+        return "id", str(uuid.UUID(raw))
+    except ValueError:
+        pass
+    try:
+        return "ts", datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(400, f"bad {name}: expected message id or ISO timestamp")
+
+
+def _anchor_cond(anchor: Tuple[str, Any], op: str, key: str, params: Dict[str, Any]) -> str:
+    kind, value = anchor
+    params[key] = value
+    if kind == "ts":
+        return f"m.created_at {op} %({key})s"
+    # сообщение-якорь ищем в той же заявке; чужой/удалённый id даёт пустую выборку
+    return (
+        f"(m.created_at, m.id) {op} (select a.created_at, a.id from request_messages a"
+        f" where a.id = %({key})s and a.request_id = m.request_id)"
+    )
+
+
+async def fetch_messages(
+    cur,
+    request_id: Any,
+    columns: str,
+    *,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[Any], bool, bool]:
+    """
+    Выполняет выборку на переданном курсоре (любой row_factory).
+    Возвращает (rows по возрастанию, has_older, has_more).
+    """
+    if after and before:
+        raise HTTPException(400, "use either after or before")
+    where = ["m.request_id = %(rid)s"]
+    if limit is None and not after and not before:
+        # старые клиенты без курсора получают весь чат
+        await cur.execute(
+            f"select {columns} from request_messages m where {where[0]}"
+            " order by m.created_at asc, m.id asc",
+            {"rid": request_id},
+        )
+        return await cur.fetchall(), False, False
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    params: Dict[str, Any] = {"rid": request_id, "lim": limit + 1}
+
+    a = _anchor(after, "after")
+    if a:
+        where.append(_anchor_cond(a, ">", "after", params))
+        await cur.execute(
+            f"select {columns} from request_messages m where {' and '.join(where)}"
+            " order by m.created_at asc, m.id asc limit %(lim)s",
+            params,
+        )
+        rows = await cur.fetchall()
+        has_more = len(rows) > limit
+        return rows[:limit], False, has_more
+
+    b = _anchor(before, "before")
+    if b:
+        where.append(_anchor_cond(b, "<", "before", params))
+    # хвост истории: берём limit + 1 с конца и разворачиваем
+    await cur.execute(
+        f"select * from (select {columns}, m.created_at as _ord_ts, m.id as _ord_id"
+        f" from request_messages m where {' and '.join(where)}"
+        " order by m.created_at desc, m.id desc limit %(lim)s) t"
+        " order by t._ord_ts asc, t._ord_id asc",
+        params,
+    )
+    rows = await cur.fetchall()
+    has_older = len(rows) > limit
+    if has_older:
+        rows = rows[1:]
+    # служебные колонки сортировки: у кортежей они в хвосте, у dict_row убираем
+    for r in rows:
+        if isinstance(r, dict):
+            r.pop("_ord_ts", None)
+            r.pop("_ord_id", None)
+    return rows, has_older, False
+
+
+def set_sync_headers(response: Response, has_older: bool, has_more: bool) -> None:
+    response.headers[HAS_OLDER_HEADER] = "1" if has_older else "0"
+    response.headers[HAS_MORE_HEADER] = "1" if has_more else "0"
+
+
+# ─── прочитанность (request_chat_state, migrations/011_request_chat_state.sql) ──
+# сторона → (колонка отметки, счётчик непрочитанных, чьи сообщения она читает)
+_READ_SIDES = {
+    "staff": ("staff_read_at", "unread_by_staff", "m.author_role = 'resident'"),
+    "resident": ("resident_read_at", "unread_by_resident", "m.author_role <> 'resident'"),
+}
+
+
+async def mark_read(cur, request_id: Any, side: str, upto: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Отметить прочитанным всё до upto (iso-время или id сообщения; по умолчанию — сейчас).
+    Отметка только двигается вперёд; счётчик пересчитывается по индексу
+    (request_id, created_at, id) — это хвост после отметки, а не весь чат.
+    """
+    read_col, unread_col, theirs = _READ_SIDES[side]
+    params: Dict[str, Any] = {"rid": request_id, "upto": None}
+    a = _anchor(upto, "upto")
+    if a and a[0] == "id":
+        await cur.execute(
+            "select created_at from request_messages where id = %s and request_id = %s",
+            (a[1], request_id),
+        )
+        found = await cur.fetchone()
+        if not found:
+            # чужой/удалённый id: не отмечаем молча «всё до сейчас»
+            raise HTTPException(404, "upto: message not found in this request")
+        params["upto"] = found["created_at"] if isinstance(found, dict) else found[0]
+    elif a:
+        params["upto"] = a[1]
+    await cur.execute(
+        f"""
+        with mark as (
+            select coalesce(%(upto)s::timestamptz, now()) as ts
+        )
+        insert into request_chat_state as cs (request_id, {read_col}, {unread_col})
+        select %(rid)s, mark.ts,
+               (select count(*) from request_messages m
+                 where m.request_id = %(rid)s and {theirs} and m.created_at > mark.ts)
+        from mark
+        on conflict (request_id) do update set
+            {read_col} = greatest(cs.{read_col}, excluded.{read_col}),
+            {unread_col} = (
+                select count(*) from request_messages m
+                 where m.request_id = cs.request_id and {theirs}
+                   and m.created_at > greatest(cs.{read_col}, excluded.{read_col})
+            ),
+            updated_at = now()
+        returning {read_col}, {unread_col}
+        """,
+        params,
+    )
+    row = await cur.fetchone()
+    read_at, unread = (row[read_col], row[unread_col]) if isinstance(row, dict) else row
+    return {"request_id": str(request_id), "read_at": read_at, "unread": unread}
@@ -1,8 +1,68 @@
 from __future__ import annotations
+import os
 import psycopg
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+from typing import AsyncIterator, Optional
+from psycopg_pool import AsyncConnectionPool
 from config import settings
 
+# ─── async pool (создаётся в lifespan приложения) ──────────────────────────────
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# соединения старше этого возраста пересоздаются (Supabase рвёт долгие коннекты)
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+
+_pool: Optional[AsyncConnectionPool] = None
+
+
+async def open_pool() -> AsyncConnectionPool:
+    """Открыть общий пул соединений. Вызывается один раз на старте воркера."""
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            settings()["DB_URL"],
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            # health check: перед выдачей соединения делаем лёгкий ping
+            check=AsyncConnectionPool.check_connection,
+            # pgbouncer (Supabase pooler, transaction mode) не дружит с prepared statements
+            kwargs={"prepare_threshold": None},
+            open=False,
+        )
+        await _pool.open(wait=True)
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool() -> AsyncConnectionPool:
+    if _pool is None:
+        raise RuntimeError("DB pool is not initialized (app lifespan not started)")
+    return _pool
+
+
+@asynccontextmanager
+async def db_acursor(row_factory=None) -> AsyncIterator[psycopg.AsyncCursor]:
+    """
+    Асинхронный аналог db_cursor(): берёт соединение из пула,
+    коммитит по выходу из блока, при исключении — rollback.
+    row_factory — например psycopg.rows.dict_row (по умолчанию кортежи).
+    """
+    async with get_pool().connection() as conn:
+        cur = conn.cursor(row_factory=row_factory) if row_factory else conn.cursor()
+        async with cur:
+            yield cur
+
+
+# ─── sync (для скриптов/CLI, где нет event loop) ───────────────────────────────
 def get_conn() -> psycopg.Connection:
     return psycopg.connect(settings()["DB_URL"])
 
@@ -0,0 +1,151 @@
+# backend/event_hub.py
+from __future__ import annotations
+
+import asyncio, json, logging, os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import psycopg
+
+from config import settings
+
+log = logging.getLogger("event_hub")
+
+# Один LISTEN-коннект на воркер, сколько бы клиентов ни было подписано.
+# Триггеры (migrations/005_realtime_notify.sql) шлют pg_notify в EVENTS_CHANNEL,
+# событие раздаётся подписчикам SSE с фильтром по роли/владельцу.
+EVENTS_CHANNEL = "uv_events"
+SUBSCRIBER_QUEUE_SIZE = 256
+# LISTEN не работает через pgbouncer в transaction mode (Supabase pooler :6543) —
+# для слушателя можно указать прямой адрес БД
+REALTIME_DB_URL = os.getenv("REALTIME_DB_URL", "").strip()
+RECONNECT_DELAY_MAX = 30.0
+
+Handler = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class Subscriber:
+    """
+    Очередь событий одного SSE-клиента.
+    tg_id=None — админ (видит всё), иначе резидент (только свои заявки).
+    """
+
+    def __init__(self, tg_id: Optional[int] = None):
+        self.tg_id = tg_id
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        if self.tg_id is None:
+            return True
+        owner = event.get("tg_id")
+        return owner is not None and int(owner) == self.tg_id
+
+    def push(self, event: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # клиент не успевает читать: выкидываем хвост и просим его перечитать списки
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"kind": "resync"})
+
+
+_subscribers: Set[Subscriber] = set()
+_handlers: Dict[str, List[Handler]] = {}
+_task: Optional[asyncio.Task] = None
+
+
+def subscribe(tg_id: Optional[int] = None) -> Subscriber:
+    sub = Subscriber(tg_id)
+    _subscribers.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    _subscribers.discard(sub)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def _fan_out(event: Dict[str, Any]) -> None:
+    for sub in list(_subscribers):
+        if sub.wants(event):
+            sub.push(event)
+
+
+def add_channel_handler(channel: str, handler: Handler) -> None:
+    """
+    Подписать обработчик на NOTIFY-канал. Регистрировать до start_listener()
+    (новые каналы подхватываются при переподключении).
+    """
+    _handlers.setdefault(channel, []).append(handler)
+
+
+async def notify(cur, channel: str, payload: Dict[str, Any]) -> None:
+    """pg_notify из текущей транзакции (уйдёт слушателям после commit)."""
+    await cur.execute("select pg_notify(%s, %s)", (channel, json.dumps(payload, default=str)))
+
+
+async def _dispatch(channel: str, raw: str) -> None:
+    try:
+        payload = json.loads(raw) if raw else {}
+    except Exception:
+        log.warning("bad NOTIFY payload on %s: %r", channel, raw[:200])
+        return
+    for handler in _handlers.get(channel, ()):
+        try:
+            res = handler(payload)
+            if asyncio.iscoroutine(res):
+                await res
+        except Exception:
+            log.exception("NOTIFY handler failed (channel=%s)", channel)
+
+
+async def _listen_forever() -> None:
+    delay = 1.0
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                REALTIME_DB_URL or settings()["DB_URL"], autocommit=True
+            ) as conn:
+                for channel in _handlers:
+                    await conn.execute(f'LISTEN "{channel}"')
+                log.info("realtime listener connected: %s", ", ".join(_handlers))
+                delay = 1.0
+                async for n in conn.notifies():
+                    await _dispatch(n.channel, n.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning("realtime listener dropped (%s), reconnect in %.0fs", e, delay)
+            # за время простоя события могли потеряться — клиенты перечитают данные
+            _fan_out({"kind": "resync"})
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+
+async def start_listener() -> None:
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_listen_forever(), name="realtime-listener")
+
+
+async def stop_listener() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+add_channel_handler(EVENTS_CHANNEL, _fan_out)
+
+
+__all__ = [
+    "EVENTS_CHANNEL", "Subscriber", "subscribe", "unsubscribe", "subscriber_count",
+    "add_channel_handler", "notify", "start_listener", "stop_listener",
+]
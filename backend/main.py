@@ -2,6 +2,8 @@
 from __future__ import annotations
 
 import os
+import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -10,6 +12,15 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from dotenv import load_dotenv
 
+from db import open_pool, close_pool
+from supabase_client import open_supabase, close_supabase
+from schema_cache import load_schema
+from event_hub import start_listener, stop_listener
+from nonce_store import get_nonce_store
+from notifier import get_notifier
+from storage import get_storage
+from media import shutdown_media_pool
+
 # --- Middleware ---
 # Telegram WebApp initData проверяем ТОЛЬКО для /api/* (логика внутри мидлвари)
 from middleware.middleware_initdata import TelegramInitDataMiddleware
@@ -19,10 +30,13 @@ from middleware.middleware_initdata import TelegramInitDataMiddleware
 # --- Routers ---
 from admin_requests import router as admin_requests_router            # /admin/requests/*
 from admin_auth import router as admin_auth_router                    # /admin/auth/*
+from admin_system import router as admin_system_router                # /admin/system/*
+from admin_stats import router as admin_stats_router, start_stats_folder, stop_stats_folder  # /admin/stats
 from api.auth_api import router as auth_router                        # /api/auth/*
 from api.requests_api import router as requests_router                # /api/requests/*
 from routes.profile import router as profile_router                   # /api/profile/*
-from routes.tg_webhook import router as tg_router                     # /tg/*
+from routes.events import router as events_router, admin_router as admin_events_router  # /api/events, /admin/events
+from routes.tg_webhook import router as tg_router, start_webhook, stop_webhook  # /tg/*
 from routes.uploads import router as uploads_router                   # /api/uploads, /api/files, /api/admin/uploads
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -37,7 +51,41 @@ CORS_ORIGINS = [o.strip() for o in _raw_origins.split(",") if o.strip()] or [
     "http://localhost:5173",
 ]
 
-app = FastAPI(debug=DEBUG, title="MiniUrban API")
+
+
+# ────────────────────────────────────────────────────────────────────────────────
+# Lifespan: общий пул соединений к Postgres и async-клиент Supabase на весь воркер
+# ────────────────────────────────────────────────────────────────────────────────
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pool()
+    await open_supabase()
+    try:
+        await load_schema()
+    except Exception as e:
+        # не валим старт: get_schema() перечитает схему при первом обращении
+        logging.getLogger("main").warning("schema cache preload failed: %s", e)
+    await start_listener()
+    await get_nonce_store().start()
+    await get_notifier().start()
+    await get_storage().start()
+    await start_stats_folder()
+    await start_webhook()
+    try:
+        yield
+    finally:
+        await stop_webhook()
+        await stop_stats_folder()
+        await get_storage().stop()
+        shutdown_media_pool()
+        await get_notifier().stop()
+        await get_nonce_store().stop()
+        await stop_listener()
+        await close_supabase()
+        await close_pool()
+
+
+app = FastAPI(debug=DEBUG, title="MiniUrban API", lifespan=lifespan)
 
 # ────────────────────────────────────────────────────────────────────────────────
 # CORS (до роутеров и мидлварей)
@@ -55,6 +103,7 @@ app.add_middleware(
         "X-TELEGRAM-INIT-DATA",
         "X-Requested-With",
     ],
+    expose_headers=["X-Next-Cursor", "X-Has-Older", "X-Has-More"],
 )
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -73,10 +122,20 @@ app.include_router(admin_auth_router)
 # Админ-заявки: /admin/requests/*
 app.include_router(admin_requests_router)
 
+# Служебное: /admin/system/*
+app.include_router(admin_system_router)
+
+# Дашборд: /admin/stats
+app.include_router(admin_stats_router)
+
+# SSE: /admin/events
+app.include_router(admin_events_router)
+
 # Остальные API под префиксом /api
 app.include_router(auth_router,     prefix=API_PREFIX)   # /api/auth/*
 app.include_router(requests_router, prefix=API_PREFIX)   # /api/requests/*
 app.include_router(profile_router,  prefix=API_PREFIX)   # /api/profile/*
+app.include_router(events_router,   prefix=API_PREFIX)   # /api/events (SSE)
 app.include_router(uploads_router,  prefix=API_PREFIX)   # /api/uploads, /api/files, /api/admin/uploads
 
 # Telegram webhook: /tg/*
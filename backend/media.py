@@ -0,0 +1,173 @@
+# backend/media.py
+from __future__ import annotations
+
+import asyncio, io, json, logging, os, re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage import get_storage
+
+log = logging.getLogger("media")
+
+# Производные картинки для фото заявок: thumb (список в админке) и medium (карточка).
+# Считаются в пуле процессов (Pillow держит GIL на ресайзе), сразу после загрузки
+# и лениво при первом запросе; лежат в том же хранилище под derived/<id>/<size>.webp.
+# Содержимое определяется id оригинала (sha256) и параметрами ниже, поэтому
+# URL неизменяем: при смене параметров поднимаем DERIVATIVE_VERSION.
+API_PREFIX = os.getenv("API_PREFIX", "/api")
+DERIVATIVE_SIZES = {"thumb": 240, "medium": 1024}
+DERIVATIVE_QUALITY = {"thumb": 70, "medium": 80}
+DERIVATIVE_VERSION = "v1"
+DERIVATIVE_TYPE = "image/webp"
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+# что Pillow умеет открыть без плагинов
+RESIZABLE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+_FILE_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_FILE_URL_RE = re.compile(r"/files/([0-9a-f]{64})(?:/\w+)?/?$")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[Tuple[str, str], "asyncio.Future[str]"] = {}
+_background: set = set()
+
+
+def is_file_id(value: str) -> bool:
+    return bool(_FILE_ID_RE.match(value or ""))
+
+
+def file_url(file_id: str, size: Optional[str] = None) -> str:
+    base = f"{API_PREFIX}/files/{file_id}"
+    return f"{base}/{size}" if size else base
+
+
+def derivative_key(file_id: str, size: str) -> str:
+    return f"derived/{file_id}/{size}-{DERIVATIVE_VERSION}.webp"
+
+
+def derivative_etag(file_id: str, size: str) -> str:
+    return f'"{file_id}-{size}-{DERIVATIVE_VERSION}"'
+
+
+def photo_file_id(item: Any) -> Optional[str]:
+    # ссылки из /api/uploads ({id,url,...}); старые записи ({url|path,name} / строки)
+    # превью не имеют, если только url не указывает на /files/<id>
+    if isinstance(item, dict):
+        fid = str(item.get("id") or "")
+        if is_file_id(fid):
+            return fid
+        item = item.get("url") or item.get("path") or ""
+    if isinstance(item, str):
+        m = _FILE_URL_RE.search(item)
+        if m:
+            return m.group(1)
+    return None
+
+
+def thumb_urls(photos: Any, size: str = "thumb") -> List[str]:
+    """URL превью для значения requests.photos (любой исторический формат)."""
+    if isinstance(photos, str):
+        # jsonb мог прийти строкой через PostgREST / старые вьюхи
+        try:
+            photos = json.loads(photos)
+        except ValueError:
+            photos = [photos]
+    if isinstance(photos, dict):
+        photos = [photos]
+    if not isinstance(photos, list):
+        return []
+    out = []
+    for item in photos:
+        fid = photo_file_id(item)
+        if fid:
+            out.append(file_url(fid, size))
+    return out
+
+
+# ─── рендер (в дочернем процессе) ───────────────────────────────────────────────
+def _render(data: bytes, max_side: int, quality: int) -> bytes:
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "transparency" in im.info or im.mode in ("LA", "P") else "RGB")
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        im.save(buf, "WEBP", quality=quality, method=4)
+        return buf.getvalue()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS)
+    return _pool
+
+
+def shutdown_media_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _read_all(key: str) -> bytes:
+    # оригинал ограничен UPLOAD_MAX_FILE_BYTES, держать его в памяти на время ресайза можно
+    parts = []
+    async for chunk in get_storage().read(key):
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+async def _generate(file_id: str, source_key: str, size: str) -> str:
+    storage = get_storage()
+    key = derivative_key(file_id, size)
+    if await storage.exists(key):
+        return key
+    data = await _read_all(source_key)
+    loop = asyncio.get_running_loop()
+    out = await loop.run_in_executor(
+        _get_pool(), _render, data, DERIVATIVE_SIZES[size], DERIVATIVE_QUALITY[size]
+    )
+    writer = storage.writer(key)
+    try:
+        await writer.write(out)
+        await writer.commit(DERIVATIVE_TYPE)
+    except Exception:
+        await writer.abort()
+        raise
+    return key
+
+
+async def ensure_derivative(file_id: str, source_key: str, content_type: str, size: str) -> Optional[str]:
+    """
+    Ключ производной в хранилище; None — если для этого типа превью не делаем
+    (pdf, heic без плагина) или Pillow недоступен.
+    Параллельные запросы одной и той же производной ждут одну задачу.
+    """
+    if size not in DERIVATIVE_SIZES or content_type not in RESIZABLE_TYPES:
+        return None
+    task_key = (file_id, size)
+    fut = _inflight.get(task_key)
+    if fut is None:
+        fut = asyncio.ensure_future(_generate(file_id, source_key, size))
+        _inflight[task_key] = fut
+        fut.add_done_callback(lambda _f: _inflight.pop(task_key, None))
+    try:
+        return await asyncio.shield(fut)
+    except ImportError:
+        log.warning("Pillow is not installed, derivatives disabled")
+        return None
+    except Exception as e:
+        log.warning("derivative %s/%s failed: %s", file_id, size, e)
+        return None
+
+
+def schedule_derivatives(file_id: str, source_key: str, content_type: str) -> None:
+    """Фоновая генерация всех размеров сразу после загрузки (ошибки только в лог)."""
+    if content_type not in RESIZABLE_TYPES:
+        return
+    for size in DERIVATIVE_SIZES:
+        task = asyncio.ensure_future(ensure_derivative(file_id, source_key, content_type, size))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
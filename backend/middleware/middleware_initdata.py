@@ -1,37 +1,43 @@
 from __future__ import annotations
 
-import os, hmac, json, urllib.parse, logging
-from hashlib import sha256
+import os, logging
 from fastapi import HTTPException, Request, status
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 
+from utils.tg_webapp_verify import verify_init_data as _verify, InitDataError
+from utils.stream_token import read_stream_token
+
 log = logging.getLogger("initdata")
 
-BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "").strip()
+BOT_TOKEN = (os.environ.get("TELEGRAM_BOT_TOKEN") or os.environ.get("BOT_TOKEN") or "").strip()
+INIT_DATA_MAX_AGE = 24 * 3600
 DEV_TG_ID = os.environ.get("DEV_TG_ID", "").strip()
 
+# EventSource не умеет слать заголовки: для этих путей вместо initData принимаем
+# ?token= из POST /api/events/token (utils/stream_token.py); initData в URL не берём —
+# он оседал бы в access-логах
+QUERY_TOKEN_PATHS = ("/api/events",)
+
 
 def verify_init_data(init_data: str) -> dict:
+    """
+    Тонкая обёртка над utils.tg_webapp_verify (общий кэш секрета и проверенных initData),
+    ошибки переводим в HTTPException.
+    """
     if not BOT_TOKEN:
         raise HTTPException(status_code=500, detail="TELEGRAM_BOT_TOKEN is not set")
 
-    qs = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True))
-    hash_str = qs.pop("hash", None)
-    if not hash_str:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="hash missing")
-
-    data_check_string = "\n".join(f"{k}={qs[k]}" for k in sorted(qs.keys()))
-    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), sha256).digest()
-    calc_hash = hmac.new(secret, data_check_string.encode(), sha256).hexdigest()
-    if calc_hash != hash_str:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="bad init data")
-
     try:
-        user = json.loads(qs.get("user", "{}"))
-    except Exception:
+        data = _verify(init_data, BOT_TOKEN, max_age_seconds=INIT_DATA_MAX_AGE)
+    except InitDataError as e:
+        detail = "hash missing" if str(e) == "Missing hash" else "bad init data"
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+    user = data.get("user_obj")
+    if not isinstance(user, dict):
         user = {}
-    return {"user": user, "raw": qs}
+    return {"user": user, "raw": data}
 
 
 class TelegramInitDataMiddleware(BaseHTTPMiddleware):
@@ -101,8 +107,17 @@ class TelegramInitDataMiddleware(BaseHTTPMiddleware):
             or request.headers.get("X-INIT-DATA")
             or ""
         ).strip()
-
         request.state.tg_id = None
+        request.state.tg_user = None
+        request.state.init_data = None
+
+        if not init and path in QUERY_TOKEN_PATHS and request.query_params.get("token"):
+            tg_id = read_stream_token(request.query_params["token"])
+            if tg_id is None:
+                return JSONResponse({"detail": "stream token invalid or expired"}, status_code=401)
+            request.state.tg_id = tg_id
+            request.state.tg_user = {"id": tg_id}
+            return await call_next(request)
 
         # дев-режим
         if not init and DEV_TG_ID:
@@ -118,6 +133,10 @@ class TelegramInitDataMiddleware(BaseHTTPMiddleware):
         try:
             data = verify_init_data(init)
             request.state.tg_id = int(data["user"]["id"])
+            # хендлеры (extract_user_from_request) берут пользователя отсюда,
+            # не перепроверяя ту же строку
+            request.state.tg_user = data["user"]
+            request.state.init_data = init
         except HTTPException as e:
             return JSONResponse({"detail": e.detail}, status_code=e.status_code)
         except Exception:
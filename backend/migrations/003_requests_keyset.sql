@@ -0,0 +1,9 @@
+-- keyset-пагинация по (created_at, id): /admin/requests и /api/requests/my
+create index if not exists idx_requests_created_id
+  on public.requests (created_at desc, id desc);
+
+create index if not exists idx_requests_user_created_id
+  on public.requests (user_id, created_at desc, id desc);
+
+-- покрывается idx_requests_user_created_id
+drop index if exists public.idx_requests_user_created;
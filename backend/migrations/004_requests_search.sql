@@ -0,0 +1,67 @@
+-- Поиск по заявкам для админки: отдельная таблица request_search
+-- (чтобы не трогать requests.updated_at), поддерживается триггерами.
+create extension if not exists pg_trgm;
+
+create table if not exists public.request_search (
+  request_id uuid primary key references public.requests(id) on delete cascade,
+  created_at timestamptz not null,
+  doc        text not null default '',      -- lower(): категория, юнит, детали, резидент
+  tsv        tsvector not null default ''::tsvector
+);
+
+-- ILIKE '%q%' по doc — через trigram GIN, префиксы слов — через tsvector
+create index if not exists idx_request_search_doc_trgm on public.request_search using gin (doc gin_trgm_ops);
+create index if not exists idx_request_search_tsv on public.request_search using gin (tsv);
+create index if not exists idx_request_search_created on public.request_search (created_at desc);
+
+create or replace function public.request_search_refresh(p_request_id uuid) returns void as $$
+begin
+  insert into public.request_search (request_id, created_at, doc, tsv)
+  select r.id,
+         r.created_at,
+         lower(concat_ws(' ', r.category, r.unit, r.details,
+                         u.name, u.username, u.phone, u.unit, 'tg_' || u.tg_id)),
+         setweight(to_tsvector('simple', concat_ws(' ', r.category, r.unit, u.unit)), 'A')
+           || setweight(to_tsvector('simple', concat_ws(' ', u.name, u.username, u.phone, 'tg_' || u.tg_id)), 'A')
+           || setweight(to_tsvector('simple', coalesce(r.details, '')), 'B')
+  from public.requests r
+  left join public.users u on u.id = r.user_id
+  where r.id = p_request_id
+  on conflict (request_id) do update
+    set created_at = excluded.created_at,
+        doc        = excluded.doc,
+        tsv        = excluded.tsv;
+end; $$ language plpgsql;
+
+create or replace function public.trg_request_search_requests() returns trigger as $$
+begin
+  perform public.request_search_refresh(new.id);
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_requests_search on public.requests;
+create trigger trg_requests_search
+after insert or update of category, unit, details, user_id on public.requests
+for each row execute function public.trg_request_search_requests();
+
+create or replace function public.trg_request_search_users() returns trigger as $$
+declare
+  rid uuid;
+begin
+  for rid in select id from public.requests where user_id = new.id loop
+    perform public.request_search_refresh(rid);
+  end loop;
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_users_request_search on public.users;
+create trigger trg_users_request_search
+after update of name, username, phone, unit on public.users
+for each row
+when (old.name, old.username, old.phone, old.unit) is distinct from (new.name, new.username, new.phone, new.unit)
+execute function public.trg_request_search_users();
+
+-- backfill
+select public.request_search_refresh(r.id)
+from public.requests r
+where not exists (select 1 from public.request_search s where s.request_id = r.id);
@@ -0,0 +1,56 @@
+-- Push-события для SSE (/admin/events, /api/events): один канал uv_events,
+-- payload — небольшой JSON, данные клиенты дочитывают сами.
+create or replace function public.notify_request_event() returns trigger as $$
+declare
+  owner_tg bigint;
+  rec record;
+begin
+  if tg_op = 'DELETE' then
+    rec := old;
+  else
+    rec := new;
+  end if;
+  select u.tg_id into owner_tg from public.users u where u.id = rec.user_id;
+
+  perform pg_notify('uv_events', json_build_object(
+    'kind', 'request',
+    'op', lower(tg_op),
+    'id', rec.id,
+    'status', rec.status,
+    'old_status', case when tg_op = 'UPDATE' then old.status end,
+    'tg_id', owner_tg,
+    'updated_at', rec.updated_at
+  )::text);
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_requests_notify on public.requests;
+create trigger trg_requests_notify
+after insert or update or delete on public.requests
+for each row execute function public.notify_request_event();
+
+create or replace function public.notify_request_message_event() returns trigger as $$
+declare
+  owner_tg bigint;
+begin
+  select u.tg_id into owner_tg
+  from public.requests r
+  join public.users u on u.id = r.user_id
+  where r.id = new.request_id;
+
+  perform pg_notify('uv_events', json_build_object(
+    'kind', 'message',
+    'op', 'insert',
+    'id', new.id,
+    'request_id', new.request_id,
+    'author_role', new.author_role,
+    'tg_id', owner_tg,
+    'created_at', new.created_at
+  )::text);
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_request_messages_notify on public.request_messages;
+create trigger trg_request_messages_notify
+after insert on public.request_messages
+for each row execute function public.notify_request_message_event();
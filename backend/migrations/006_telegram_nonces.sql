@@ -0,0 +1,16 @@
+-- Nonce для входа в админку через Telegram (NONCE_STORE=postgres, см. nonce_store.py)
+create table if not exists public.telegram_nonces (
+  nonce          text primary key,
+  expires_at     timestamptz not null,
+  used           boolean not null default false,
+  tg_id          bigint,
+  admin_user_id  uuid,
+  exchange_token text,
+  created_at     timestamptz not null default now()
+);
+
+alter table public.telegram_nonces add column if not exists admin_user_id uuid;
+alter table public.telegram_nonces add column if not exists exchange_token text;
+
+-- фоновая чистка просроченных
+create index if not exists idx_telegram_nonces_expires on public.telegram_nonces (expires_at);
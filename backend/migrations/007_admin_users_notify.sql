@@ -0,0 +1,35 @@
+-- Сброс кэша admin_users в API (admin_auth._admin_cache) через NOTIFY uv_admin_users.
+-- admin_users может жить в public/admin/private (ADMIN_SCHEMAS) — вешаем триггер там, где таблица есть.
+create or replace function public.notify_admin_users_change() returns trigger as $$
+declare
+  rec record;
+begin
+  if tg_op = 'DELETE' then
+    rec := old;
+  else
+    rec := new;
+  end if;
+  perform pg_notify('uv_admin_users', json_build_object(
+    'op', lower(tg_op),
+    'id', rec.id,
+    'email', rec.email,
+    'tg_id', rec.tg_id
+  )::text);
+  return null;
+end; $$ language plpgsql;
+
+do $$
+declare
+  s text;
+begin
+  for s in
+    select table_schema from information_schema.tables
+    where table_name = 'admin_users' and table_schema in ('public', 'admin', 'private')
+  loop
+    execute format('drop trigger if exists trg_admin_users_notify on %I.admin_users', s);
+    execute format(
+      'create trigger trg_admin_users_notify
+         after insert or delete or update of is_active, role, email, tg_id on %I.admin_users
+         for each row execute function public.notify_admin_users_change()', s);
+  end loop;
+end$$;
@@ -0,0 +1,18 @@
+-- Очередь исходящих сообщений бота (NOTIFY_OUTBOX=1, см. notifier.py)
+create table if not exists public.telegram_outbox (
+  id              bigserial primary key,
+  chat_id         bigint not null,
+  text            text not null,
+  parse_mode      text,
+  status          text not null default 'pending' check (status in ('pending','sent','failed')),
+  attempts        int not null default 0,
+  last_error      text,
+  next_attempt_at timestamptz not null default now(),
+  created_at      timestamptz not null default now(),
+  sent_at         timestamptz
+);
+
+-- поллер берёт только pending с истёкшим lease
+create index if not exists idx_telegram_outbox_pending
+  on public.telegram_outbox (next_attempt_at)
+  where status = 'pending';
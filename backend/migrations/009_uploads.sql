@@ -0,0 +1,24 @@
+-- Загруженные файлы (routes/uploads.py): id = sha256 содержимого, одна запись на содержимое
+create table if not exists public.uploads (
+  id           text primary key check (id ~ '^[0-9a-f]{64}$'),
+  storage_key  text not null,
+  size         bigint not null,
+  content_type text not null,
+  uploaded_by  bigint,
+  created_at   timestamptz not null default now()
+);
+
+create index if not exists idx_uploads_uploaded_by on public.uploads (uploaded_by, created_at desc);
+
+-- Кто загружал файл: содержимое общее (dedup по sha256), а ссылаться на него в заявке
+-- может каждый, кто его загрузил (проверка в POST /api/requests/create)
+create table if not exists public.upload_owners (
+  upload_id  text not null references public.uploads(id) on delete cascade,
+  tg_id      bigint not null,
+  created_at timestamptz not null default now(),
+  primary key (upload_id, tg_id)
+);
+
+insert into public.upload_owners (upload_id, tg_id, created_at)
+select id, uploaded_by, created_at from public.uploads where uploaded_by is not null
+on conflict do nothing;
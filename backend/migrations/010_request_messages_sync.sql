@@ -0,0 +1,3 @@
+-- инкрементальная выдача чата (chat_sync.py): range scan по (request_id, created_at, id)
+create index if not exists idx_request_messages_request_created_id
+  on public.request_messages (request_id, created_at, id);
@@ -0,0 +1,132 @@
+-- Состояние чата по заявке: последнее сообщение и непрочитанные по сторонам.
+-- Ведётся триггерами на request_messages, читается одним join в списках
+-- (/admin/requests, /api/requests/my). «Сторона» сообщения: author_role = 'resident'
+-- или персонал (admin/manager/operator). Своё сообщение = прочитано всё до него.
+create table if not exists public.request_chat_state (
+  request_id           uuid primary key references public.requests(id) on delete cascade,
+  last_message_at      timestamptz,
+  last_author_role     text,
+  last_message_preview text,
+  message_count        int not null default 0,
+  unread_by_staff      int not null default 0,
+  unread_by_resident   int not null default 0,
+  staff_read_at        timestamptz,
+  resident_read_at     timestamptz,
+  updated_at           timestamptz not null default now()
+);
+
+-- «есть непрочитанные» в админке
+create index if not exists idx_request_chat_state_unread_staff
+  on public.request_chat_state (last_message_at desc)
+  where unread_by_staff > 0;
+
+-- Полный пересчёт строки (backfill, удаление сообщений).
+-- Если отметки о прочтении нет — считаем прочитанным всё до последнего сообщения этой стороны.
+create or replace function public.request_chat_state_recompute(rid uuid) returns void as $$
+declare
+  s_read timestamptz;
+  r_read timestamptz;
+begin
+  if not exists (select 1 from public.requests where id = rid) then
+    -- каскадное удаление заявки
+    delete from public.request_chat_state where request_id = rid;
+    return;
+  end if;
+
+  select staff_read_at, resident_read_at into s_read, r_read
+  from public.request_chat_state where request_id = rid;
+  if s_read is null then
+    select max(created_at) into s_read from public.request_messages
+    where request_id = rid and author_role <> 'resident';
+  end if;
+  if r_read is null then
+    select max(created_at) into r_read from public.request_messages
+    where request_id = rid and author_role = 'resident';
+  end if;
+
+  insert into public.request_chat_state as cs (
+    request_id, last_message_at, last_author_role, last_message_preview, message_count,
+    unread_by_staff, unread_by_resident, staff_read_at, resident_read_at, updated_at
+  )
+  select
+    rid, l.created_at, l.author_role, left(l.body, 140),
+    (select count(*) from public.request_messages m where m.request_id = rid),
+    (select count(*) from public.request_messages m
+      where m.request_id = rid and m.author_role = 'resident'
+        and m.created_at > coalesce(s_read, '-infinity')),
+    (select count(*) from public.request_messages m
+      where m.request_id = rid and m.author_role <> 'resident'
+        and m.created_at > coalesce(r_read, '-infinity')),
+    s_read, r_read, now()
+  from (select 1) one
+  left join lateral (
+    select created_at, author_role, body from public.request_messages
+    where request_id = rid order by created_at desc, id desc limit 1
+  ) l on true
+  on conflict (request_id) do update set
+    last_message_at      = excluded.last_message_at,
+    last_author_role     = excluded.last_author_role,
+    last_message_preview = excluded.last_message_preview,
+    message_count        = excluded.message_count,
+    unread_by_staff      = excluded.unread_by_staff,
+    unread_by_resident   = excluded.unread_by_resident,
+    staff_read_at        = excluded.staff_read_at,
+    resident_read_at     = excluded.resident_read_at,
+    updated_at           = now();
+end; $$ language plpgsql;
+
+-- Новое сообщение: O(1) upsert без пересчёта
+create or replace function public.request_chat_state_on_insert() returns trigger as $$
+declare
+  is_res boolean;
+  newer boolean;
+begin
+  is_res := new.author_role = 'resident';
+
+  insert into public.request_chat_state as cs (
+    request_id, last_message_at, last_author_role, last_message_preview, message_count,
+    unread_by_staff, unread_by_resident, staff_read_at, resident_read_at
+  ) values (
+    new.request_id, new.created_at, new.author_role, left(new.body, 140), 1,
+    case when is_res then 1 else 0 end,
+    case when is_res then 0 else 1 end,
+    case when is_res then null else new.created_at end,
+    case when is_res then new.created_at else null end
+  )
+  on conflict (request_id) do update set
+    last_message_at      = greatest(cs.last_message_at, excluded.last_message_at),
+    last_author_role     = case when excluded.last_message_at >= coalesce(cs.last_message_at, '-infinity')
+                                then excluded.last_author_role else cs.last_author_role end,
+    last_message_preview = case when excluded.last_message_at >= coalesce(cs.last_message_at, '-infinity')
+                                then excluded.last_message_preview else cs.last_message_preview end,
+    message_count        = cs.message_count + 1,
+    unread_by_staff      = case when is_res then cs.unread_by_staff + 1 else 0 end,
+    unread_by_resident   = case when is_res then 0 else cs.unread_by_resident + 1 end,
+    staff_read_at        = case when is_res then cs.staff_read_at
+                                else greatest(cs.staff_read_at, excluded.staff_read_at) end,
+    resident_read_at     = case when is_res then greatest(cs.resident_read_at, excluded.resident_read_at)
+                                else cs.resident_read_at end,
+    updated_at           = now();
+  return null;
+end; $$ language plpgsql;
+
+create or replace function public.request_chat_state_on_delete() returns trigger as $$
+begin
+  perform public.request_chat_state_recompute(old.request_id);
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_request_messages_chat_state on public.request_messages;
+create trigger trg_request_messages_chat_state
+after insert on public.request_messages
+for each row execute function public.request_chat_state_on_insert();
+
+drop trigger if exists trg_request_messages_chat_state_del on public.request_messages;
+create trigger trg_request_messages_chat_state_del
+after delete on public.request_messages
+for each row execute function public.request_chat_state_on_delete();
+
+-- backfill
+select public.request_chat_state_recompute(t.request_id)
+from (select distinct request_id from public.request_messages) t
+where not exists (select 1 from public.request_chat_state cs where cs.request_id = t.request_id);
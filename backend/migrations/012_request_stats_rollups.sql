@@ -0,0 +1,159 @@
+-- Роллапы для /admin/stats (admin_stats.py): события по часам и дням (UTC) в разрезе категории
+-- и текущее число заявок по (категория, статус). Запросы статистики не сканируют requests.
+-- event: created | confirmed (confirmed/in_progress) | done | cancelled (cancelled/cancelled_by_user)
+--
+-- Триггер на requests не обновляет роллапы сам: строки текущего часа/дня и
+-- request_status_counts горячие, и конкурентные записи одной категории стояли бы в очереди
+-- на их блокировках до коммита. Вместо этого триггер дописывает дельты в
+-- unlogged request_stats_delta (вставки не конфликтуют), а request_stats_fold() сворачивает
+-- их в роллапы — периодически из API (admin_stats.STATS_FOLD_INTERVAL) и перед чтением.
+-- Unlogged-таблица очищается при аварийном рестарте Postgres: после него —
+-- POST /admin/stats/rebuild.
+create table if not exists public.request_stats_hourly (
+  bucket   timestamptz not null,
+  category text not null,
+  event    text not null,
+  n        int not null default 0,
+  primary key (bucket, category, event)
+);
+
+create table if not exists public.request_stats_daily (
+  bucket   date not null,
+  category text not null,
+  event    text not null,
+  n        int not null default 0,
+  primary key (bucket, category, event)
+);
+
+create table if not exists public.request_status_counts (
+  category text not null,
+  status   text not null,
+  n        int not null default 0,
+  primary key (category, status)
+);
+
+create or replace function public.request_status_event(s text) returns text as $$
+  select case
+    when s in ('confirmed', 'in_progress') then 'confirmed'
+    when s = 'done' then 'done'
+    when s in ('cancelled', 'cancelled_by_user') then 'cancelled'
+  end
+$$ language sql immutable;
+
+create unlogged table if not exists public.request_stats_delta (
+  ts       timestamptz not null,
+  category text not null,
+  event    text,          -- дельта события (hourly/daily)
+  status   text,          -- или дельта request_status_counts
+  delta    int not null
+);
+
+create or replace function public.request_stats_bump(ts timestamptz, cat text, ev text, delta int)
+returns void as $$
+begin
+  if ev is null then
+    return;
+  end if;
+  insert into public.request_stats_delta (ts, category, event, delta)
+  values (ts, coalesce(cat, ''), ev, delta);
+end; $$ language plpgsql;
+
+create or replace function public.request_status_count_bump(cat text, st text, delta int)
+returns void as $$
+begin
+  insert into public.request_stats_delta (ts, category, status, delta)
+  values (now(), coalesce(cat, ''), st, delta);
+end; $$ language plpgsql;
+
+-- Свернуть накопленные дельты; параллельный вызов просто выходит (0)
+create or replace function public.request_stats_fold() returns int as $$
+declare
+  n int;
+begin
+  if not pg_try_advisory_xact_lock(hashtextextended('request_stats_fold', 0)) then
+    return 0;
+  end if;
+  with d as (
+    delete from public.request_stats_delta returning *
+  ), h as (
+    insert into public.request_stats_hourly as h (bucket, category, event, n)
+    select date_trunc('hour', ts, 'UTC'), category, event, sum(delta)
+    from d where event is not null group by 1, 2, 3
+    on conflict (bucket, category, event) do update set n = h.n + excluded.n
+  ), dd as (
+    insert into public.request_stats_daily as dd (bucket, category, event, n)
+    select (ts at time zone 'UTC')::date, category, event, sum(delta)
+    from d where event is not null group by 1, 2, 3
+    on conflict (bucket, category, event) do update set n = dd.n + excluded.n
+  ), c as (
+    insert into public.request_status_counts as c (category, status, n)
+    select category, status, sum(delta)
+    from d where status is not null group by 1, 2
+    on conflict (category, status) do update set n = c.n + excluded.n
+  )
+  select count(*) into n from d;
+  return n;
+end; $$ language plpgsql;
+
+create or replace function public.request_stats_on_change() returns trigger as $$
+begin
+  if tg_op = 'INSERT' then
+    perform public.request_stats_bump(new.created_at, new.category, 'created', 1);
+    -- заявка может появиться сразу не в pending (импорт, админка)
+    perform public.request_stats_bump(new.created_at, new.category, public.request_status_event(new.status::text), 1);
+    perform public.request_status_count_bump(new.category, new.status::text, 1);
+  elsif tg_op = 'UPDATE' then
+    if new.status is distinct from old.status then
+      perform public.request_stats_bump(now(), new.category, public.request_status_event(new.status::text), 1);
+    end if;
+    if new.status is distinct from old.status or new.category is distinct from old.category then
+      perform public.request_status_count_bump(old.category, old.status::text, -1);
+      perform public.request_status_count_bump(new.category, new.status::text, 1);
+    end if;
+  else
+    perform public.request_status_count_bump(old.category, old.status::text, -1);
+  end if;
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_requests_stats on public.requests;
+create trigger trg_requests_stats
+after insert or update of status, category or delete on public.requests
+for each row execute function public.request_stats_on_change();
+
+-- Полная пересборка (первичное заполнение, POST /admin/stats/rebuild).
+-- Истории статусов нет, поэтому время перехода для уже закрытых заявок — updated_at.
+create or replace function public.request_stats_rebuild() returns void as $$
+begin
+  lock table public.requests in share mode;
+  perform pg_advisory_xact_lock(hashtextextended('request_stats_fold', 0));
+  truncate public.request_stats_hourly, public.request_stats_daily, public.request_status_counts;
+  -- всё, что в дельтах, уже есть в requests
+  delete from public.request_stats_delta;
+
+  with ev as (
+    select created_at as ts, coalesce(category, '') as category, 'created' as event from public.requests
+    union all
+    select updated_at, coalesce(category, ''), public.request_status_event(status::text)
+    from public.requests
+    where public.request_status_event(status::text) is not null
+  )
+  insert into public.request_stats_hourly (bucket, category, event, n)
+  select date_trunc('hour', ts, 'UTC'), category, event, count(*)
+  from ev group by 1, 2, 3;
+
+  insert into public.request_stats_daily (bucket, category, event, n)
+  select (bucket at time zone 'UTC')::date, category, event, sum(n)
+  from public.request_stats_hourly group by 1, 2, 3;
+
+  insert into public.request_status_counts (category, status, n)
+  select coalesce(category, ''), status::text, count(*)
+  from public.requests group by 1, 2;
+end; $$ language plpgsql;
+
+do $$
+begin
+  if not exists (select 1 from public.request_stats_daily) then
+    perform public.request_stats_rebuild();
+  end if;
+end$$;
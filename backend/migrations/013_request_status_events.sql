@@ -0,0 +1,111 @@
+-- История статусов заявок (append-only) и посчитанные по ней длительности.
+-- Событие пишет триггер на requests в той же транзакции, что и смена статуса,
+-- поэтому его не обойти ни пулом, ни PostgREST. Кто сменил — из
+-- set_config('app.actor', ..., true) в транзакции (status_history.set_actor), иначе null.
+-- category/assignee — снимок на момент перехода; assignee читаем через to_jsonb,
+-- т.к. колонки может не быть в схеме.
+create table if not exists public.request_status_events (
+  id          bigserial primary key,
+  request_id  uuid not null references public.requests(id) on delete cascade,
+  from_status text,
+  to_status   text not null,
+  changed_at  timestamptz not null default now(),
+  actor       text,
+  category    text,
+  assignee    text
+);
+
+create index if not exists idx_request_status_events_request
+  on public.request_status_events (request_id, changed_at, id);
+
+create or replace function public.request_status_events_immutable() returns trigger as $$
+begin
+  raise exception 'request_status_events is append-only';
+end; $$ language plpgsql;
+
+drop trigger if exists trg_request_status_events_immutable on public.request_status_events;
+create trigger trg_request_status_events_immutable
+before update on public.request_status_events
+for each row execute function public.request_status_events_immutable();
+
+-- Длительности по заявке (секунды от created_at), обновляются тем же триггером.
+-- confirmed_at — первый переход в работу (confirmed/in_progress) или сразу в done;
+-- done_at — последнее закрытие, сбрасывается при переоткрытии.
+create table if not exists public.request_status_durations (
+  request_id        uuid primary key references public.requests(id) on delete cascade,
+  category          text,
+  assignee          text,
+  created_at        timestamptz not null,
+  confirmed_at      timestamptz,
+  done_at           timestamptz,
+  cancelled_at      timestamptz,
+  time_to_confirm_s double precision generated always as (extract(epoch from confirmed_at - created_at)) stored,
+  time_to_done_s    double precision generated always as (extract(epoch from done_at - created_at)) stored
+);
+
+create index if not exists idx_request_status_durations_created
+  on public.request_status_durations (created_at);
+
+create or replace function public.request_status_history_on_change() returns trigger as $$
+declare
+  actor text := nullif(current_setting('app.actor', true), '');
+  st text := new.status::text;
+  prev text;
+  asg text := to_jsonb(new)->>'assignee';
+  ts timestamptz;
+begin
+  if tg_op = 'INSERT' then
+    prev := null;
+    ts := new.created_at;
+  else
+    prev := old.status::text;
+    ts := now();
+  end if;
+
+  if prev is distinct from st then
+    insert into public.request_status_events (request_id, from_status, to_status, changed_at, actor, category, assignee)
+    values (new.id, prev, st, ts, actor, new.category, asg);
+  end if;
+
+  insert into public.request_status_durations as d (request_id, category, assignee, created_at, confirmed_at, done_at, cancelled_at)
+  values (
+    new.id, new.category, asg, new.created_at,
+    case when st in ('confirmed', 'in_progress', 'done') then ts end,
+    case when st = 'done' then ts end,
+    case when st in ('cancelled', 'cancelled_by_user') then ts end
+  )
+  on conflict (request_id) do update set
+    category     = excluded.category,
+    assignee     = excluded.assignee,
+    confirmed_at = coalesce(d.confirmed_at, case when prev is distinct from st then excluded.confirmed_at end),
+    done_at      = case when prev is not distinct from st then d.done_at else excluded.done_at end,
+    cancelled_at = case when prev is not distinct from st then d.cancelled_at else excluded.cancelled_at end;
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_requests_status_history on public.requests;
+create trigger trg_requests_status_history
+after insert on public.requests
+for each row execute function public.request_status_history_on_change();
+
+-- только то, что влияет на историю/длительности; прочие update (updated_at, детали) не трогаем
+drop trigger if exists trg_requests_status_history_upd on public.requests;
+create trigger trg_requests_status_history_upd
+after update on public.requests
+for each row
+when (
+  old.status is distinct from new.status
+  or old.category is distinct from new.category
+  or to_jsonb(old)->>'assignee' is distinct from to_jsonb(new)->>'assignee'
+)
+execute function public.request_status_history_on_change();
+
+-- backfill длительностей: истории нет, момент текущего статуса берём из updated_at
+insert into public.request_status_durations (request_id, category, assignee, created_at, confirmed_at, done_at, cancelled_at)
+select
+  r.id, r.category, to_jsonb(r)->>'assignee', r.created_at,
+  case when r.status::text in ('confirmed', 'in_progress', 'done') then r.updated_at end,
+  case when r.status::text = 'done' then r.updated_at end,
+  case when r.status::text in ('cancelled', 'cancelled_by_user') then r.updated_at end
+from public.requests r
+on conflict (request_id) do nothing;
@@ -0,0 +1,198 @@
+-- admin_requests_mat — хранимая копия admin_requests_v, из неё читает админка (admin_requests.py).
+-- Строки пересчитываются через саму вьюху (select * from admin_requests_v where id = any(...)),
+-- так что логика алиасов остаётся в одном месте — во вьюхе.
+--   requests      — statement-триггеры с transition tables: bulk на 500 строк = один пересчёт;
+--   users и прочие таблицы вьюхи — пересчёт заявок, ссылающихся (по FK из requests) на строки,
+--   где поменялись колонки, которые читает вьюха; без FK — полный пересчёт.
+-- Проверка расхождений: python -m admin_requests_mat (или GET /admin/system/admin-requests-mat/check).
+-- Если вьюху пересоздали с другими колонками — drop table admin_requests_mat и прогнать миграцию заново.
+do $$
+begin
+  if to_regclass('public.admin_requests_mat') is null then
+    create table public.admin_requests_mat as select * from public.admin_requests_v with no data;
+    alter table public.admin_requests_mat add primary key (id);
+  end if;
+end$$;
+
+-- keyset /admin/requests (как 003_requests_keyset.sql)
+create index if not exists idx_admin_requests_mat_created_id
+  on public.admin_requests_mat (created_at desc, id desc);
+create index if not exists idx_admin_requests_mat_status_created_id
+  on public.admin_requests_mat (status, created_at desc, id desc);
+
+-- Блокировки: полный пересчёт берёт ключ 'admin_requests_mat' эксклюзивно, пересчёт по id —
+-- разделяемо + эксклюзивно свои id (в одном порядке во всех транзакциях, без deadlock).
+-- Так delete + insert разных пересчётов одной строки никогда не пересекаются (нет duplicate key).
+create or replace function public.admin_requests_mat_refresh_ids(ids uuid[]) returns void as $$
+begin
+  if ids is null or cardinality(ids) = 0 then
+    return;
+  end if;
+  perform pg_advisory_xact_lock_shared(hashtextextended('admin_requests_mat', 0));
+  perform pg_advisory_xact_lock(hashtextextended(x::text, 0))
+  from (select distinct unnest(ids) as x order by 1) t;
+  delete from public.admin_requests_mat where id = any(ids);
+  insert into public.admin_requests_mat select * from public.admin_requests_v where id = any(ids);
+end; $$ language plpgsql;
+
+create or replace function public.admin_requests_mat_refresh_all() returns void as $$
+begin
+  perform pg_advisory_xact_lock(hashtextextended('admin_requests_mat', 0));
+  -- delete, а не truncate: читатели видят старые строки до коммита
+  delete from public.admin_requests_mat;
+  insert into public.admin_requests_mat select * from public.admin_requests_v;
+end; $$ language plpgsql;
+
+-- Вьюху пересоздали с другими колонками — insert ... select * падает. Из триггеров такую
+-- ошибку не пробрасываем: запись в requests/users важнее копии, строка останется
+-- старой, а расхождение покажет сверка (admin_requests_mat.py).
+create or replace function public.admin_requests_mat_safe_refresh(ids uuid[]) returns void as $$
+begin
+  if ids is null then
+    perform public.admin_requests_mat_refresh_all();
+  else
+    perform public.admin_requests_mat_refresh_ids(ids);
+  end if;
+exception when syntax_error or datatype_mismatch or undefined_column or cannot_coerce then
+  raise warning 'admin_requests_mat refresh skipped (view/table columns differ?): %', sqlerrm;
+end; $$ language plpgsql;
+
+-- ─── requests ──────────────────────────────────────────────────────────────────
+create or replace function public.admin_requests_mat_on_requests() returns trigger as $$
+begin
+  if tg_op = 'DELETE' then
+    delete from public.admin_requests_mat m using old_rows o where m.id = o.id;
+  else
+    perform public.admin_requests_mat_safe_refresh(array(select id from new_rows));
+  end if;
+  return null;
+end; $$ language plpgsql;
+
+drop trigger if exists trg_admin_requests_mat_ins on public.requests;
+create trigger trg_admin_requests_mat_ins
+after insert on public.requests
+referencing new table as new_rows
+for each statement execute function public.admin_requests_mat_on_requests();
+
+drop trigger if exists trg_admin_requests_mat_upd on public.requests;
+create trigger trg_admin_requests_mat_upd
+after update on public.requests
+referencing new table as new_rows
+for each statement execute function public.admin_requests_mat_on_requests();
+
+drop trigger if exists trg_admin_requests_mat_del on public.requests;
+create trigger trg_admin_requests_mat_del
+after delete on public.requests
+referencing old table as old_rows
+for each statement execute function public.admin_requests_mat_on_requests();
+
+-- ─── users и прочие таблицы, от которых зависит вьюха ──────────────────────────
+-- Аргументы триггера: колонки таблицы, которые читает вьюха (через запятую, из pg_depend),
+-- затем пары (колонка requests, колонка таблицы) по FK из requests. Пересчитываются только
+-- заявки, ссылающиеся на строки, где поменялась хоть одна из этих колонок; обновление
+-- прочих колонок (users.updated_at на каждом /api/auth/me) до пересчёта не доходит.
+-- Без FK из requests не понять, какие заявки затронуты, — тогда полный пересчёт.
+create or replace function public.admin_requests_mat_on_ref() returns trigger as $$
+declare
+  proj text;
+  key_col text;
+  src text;
+  changed boolean;
+  part uuid[];
+  ids uuid[] := '{}';
+  i int := 1;
+begin
+  select coalesce(string_agg(format('x.%I::text', c), ', '), 'to_jsonb(x)::text') into proj
+  from unnest(string_to_array(nullif(tg_argv[0], ''), ',')) c;
+
+  if tg_nargs < 3 then
+    if tg_op = 'UPDATE' then
+      execute format('select exists (select %1$s from new_rows x except all select %1$s from old_rows x)', proj)
+      into changed;
+      if not changed then
+        return null;
+      end if;
+    end if;
+    perform public.admin_requests_mat_safe_refresh(null);
+    return null;
+  end if;
+
+  while i + 1 < tg_nargs loop
+    key_col := format('x.%I', tg_argv[i + 1]);
+    if tg_op = 'INSERT' then
+      src := format('select %s from new_rows x', key_col);
+    elsif tg_op = 'DELETE' then
+      src := format('select %s from old_rows x', key_col);
+    else
+      src := format(
+        'select k from ((select %1$s, %2$s from new_rows x except all select %1$s, %2$s from old_rows x)'
+        ' union all (select %1$s, %2$s from old_rows x except all select %1$s, %2$s from new_rows x)) d(k)',
+        key_col, proj);
+    end if;
+    execute format('select array(select r.id from public.requests r where r.%I in (%s))', tg_argv[i], src)
+    into part;
+    ids := ids || part;
+    i := i + 2;
+  end loop;
+
+  perform public.admin_requests_mat_safe_refresh(ids);
+  return null;
+end; $$ language plpgsql;
+
+-- триггеры прежних версий миграции
+drop trigger if exists trg_admin_requests_mat_users on public.users;
+drop function if exists public.admin_requests_mat_on_users();
+
+do $$
+declare
+  dep regclass;
+  cols text;
+  args text;
+begin
+  for dep, cols in
+    select d.refobjid::regclass,
+           string_agg(distinct a.attname::text, ',')
+    from pg_rewrite rw
+    join pg_depend d on d.classid = 'pg_rewrite'::regclass and d.objid = rw.oid
+    join pg_class c on c.oid = d.refobjid
+    left join pg_attribute a on a.attrelid = d.refobjid and a.attnum = d.refobjsubid and d.refobjsubid > 0
+    where rw.ev_class = 'public.admin_requests_v'::regclass
+      and d.refobjid <> rw.ev_class
+      and c.relkind in ('r', 'p')
+      and d.refobjid <> 'public.requests'::regclass
+    group by d.refobjid
+  loop
+    select string_agg(format(', %L, %L', l.attname, a.attname), '' order by c.conname) into args
+    from pg_constraint c
+    join pg_attribute l on l.attrelid = c.conrelid and l.attnum = c.conkey[1]
+    join pg_attribute a on a.attrelid = c.confrelid and a.attnum = c.confkey[1]
+    where c.contype = 'f'
+      and c.conrelid = 'public.requests'::regclass
+      and c.confrelid = dep
+      and cardinality(c.conkey) = 1;
+    -- requests.user_id ссылается на users.tg_id (002_requests.sql) или users.id (прод);
+    -- без FK считаем, что на id
+    if args is null and dep = 'public.users'::regclass then
+      args := format(', %L, %L', 'user_id', 'id');
+    end if;
+    args := format('%L', coalesce(cols, '')) || coalesce(args, '');
+
+    execute format('drop trigger if exists trg_admin_requests_mat_ref on %s', dep);
+    execute format('drop trigger if exists trg_admin_requests_mat_ref_ins on %s', dep);
+    execute format('drop trigger if exists trg_admin_requests_mat_ref_upd on %s', dep);
+    execute format('drop trigger if exists trg_admin_requests_mat_ref_del on %s', dep);
+    execute format(
+      'create trigger trg_admin_requests_mat_ref_ins after insert on %s referencing new table as new_rows'
+      ' for each statement execute function public.admin_requests_mat_on_ref(%s)', dep, args);
+    execute format(
+      'create trigger trg_admin_requests_mat_ref_upd after update on %s'
+      ' referencing old table as old_rows new table as new_rows'
+      ' for each statement execute function public.admin_requests_mat_on_ref(%s)', dep, args);
+    execute format(
+      'create trigger trg_admin_requests_mat_ref_del after delete on %s referencing old table as old_rows'
+      ' for each statement execute function public.admin_requests_mat_on_ref(%s)', dep, args);
+  end loop;
+end$$;
+
+-- первичное заполнение
+select public.admin_requests_mat_refresh_all();
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from pydantic import BaseModel, Field
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List, Union
 
 
 # ─── Requests (заявки) ─────────────────────────────────────────────────────────
@@ -15,9 +15,9 @@ class RequestCreate(BaseModel):
     # новое: предпочтительное время (ISO-строка, например "2025-11-19T15:30")
     preferred_time: Optional[str] = None
 
-    # новое: фото/вложения — любая JSON-совместимая структура
-    # (список объектов {url|path,name} или массив путей и т.п.)
-    photos: Optional[Any] = None
+    # фото/вложения: ссылки из POST /api/uploads ({id,url,name,size,type}) или их url;
+    # каждая должна быть загружена этим же пользователем (проверка в /requests/create)
+    photos: Optional[List[Union[Dict[str, Any], str]]] = Field(None, max_items=10)
 
 
 class RequestCancel(BaseModel):
@@ -44,6 +44,11 @@ class RequestItem(BaseModel):
     preferred_time: Optional[str] = None
     photos: Optional[Any] = None
 
+    # состояние чата (request_chat_state): заполняется в /requests/my
+    last_message_at: Optional[str] = None
+    last_author_role: Optional[str] = None
+    unread_count: int = 0
+
 
 # ─── Chat / request_messages ───────────────────────────────────────────────────
 
@@ -71,6 +76,11 @@ class RequestMessageItem(BaseModel):
     created_at: str
 
 
+class RequestMarkRead(BaseModel):
+    """Отметка прочтения чата: id или iso-время последнего показанного сообщения."""
+    upto: Optional[str] = None
+
+
 # На всякий случай алиасы, если где-то уже используются другие имена
 RequestMessageOut = RequestMessageItem
 RequestMessage = RequestMessageItem
\ No newline at end of file
@@ -0,0 +1,218 @@
+# backend/nonce_store.py
+from __future__ import annotations
+
+import os, asyncio, logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from psycopg.rows import dict_row
+
+from db import db_acursor
+from schema_cache import get_schema
+
+log = logging.getLogger("nonce_store")
+
+# Хранилище одноразовых nonce для входа в админку через Telegram.
+#   NONCE_STORE=memory   — in-process (один воркер/один инстанс)
+#   NONCE_STORE=postgres — таблица telegram_nonces (несколько воркеров)
+NONCE_STORE = os.getenv("NONCE_STORE", "postgres").strip().lower()
+NONCE_SWEEP_INTERVAL = int(os.getenv("NONCE_SWEEP_INTERVAL", "60"))
+# использованные/просроченные nonce держим ещё немного — для понятных ошибок
+NONCE_RETENTION = timedelta(minutes=int(os.getenv("NONCE_RETENTION_MIN", "60")))
+
+
+class NonceError(Exception):
+    """mark_used не прошёл: reason = not_found | used | expired."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass(frozen=True)
+class NonceRecord:
+    nonce: str
+    expires_at: datetime
+    used: bool = False
+    tg_id: Optional[int] = None
+    admin_user_id: Optional[Any] = None
+    exchange_token: Optional[str] = None
+
+    def expired(self, now: Optional[datetime] = None) -> bool:
+        return self.expires_at < (now or datetime.now(timezone.utc))
+
+
+class NonceStore(ABC):
+    _sweeper: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def create(self, nonce: str, ttl: timedelta) -> NonceRecord: ...
+
+    @abstractmethod
+    async def get(self, nonce: str) -> Optional[NonceRecord]: ...
+
+    @abstractmethod
+    async def mark_used(
+        self,
+        nonce: str,
+        tg_id: int,
+        admin_user_id: Any = None,
+        exchange_token: Optional[str] = None,
+    ) -> NonceRecord:
+        """Атомарно: not used и не просрочен → used. Иначе NonceError."""
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """Удалить давно просроченные записи, вернуть их количество."""
+
+    async def start(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(), name="nonce-sweeper")
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(NONCE_SWEEP_INTERVAL)
+            try:
+                n = await self.sweep()
+                if n:
+                    log.info("nonce sweep: removed %d", n)
+            except Exception as e:
+                log.warning("nonce sweep failed: %s", e)
+
+
+# ─── in-process ────────────────────────────────────────────────────────────────
+class MemoryNonceStore(NonceStore):
+    def __init__(self):
+        self._items: Dict[str, NonceRecord] = {}
+        # mark_used — проверка и запись без await между ними, но лок оставляет
+        # это верным и если реализация обрастёт I/O
+        self._lock = asyncio.Lock()
+
+    async def create(self, nonce: str, ttl: timedelta) -> NonceRecord:
+        rec = NonceRecord(nonce=nonce, expires_at=datetime.now(timezone.utc) + ttl)
+        self._items[nonce] = rec
+        return rec
+
+    async def get(self, nonce: str) -> Optional[NonceRecord]:
+        return self._items.get(nonce)
+
+    async def mark_used(self, nonce, tg_id, admin_user_id=None, exchange_token=None) -> NonceRecord:
+        async with self._lock:
+            rec = self._items.get(nonce)
+            if rec is None:
+                raise NonceError("not_found")
+            if rec.used:
+                raise NonceError("used")
+            if rec.expired():
+                raise NonceError("expired")
+            rec = replace(
+                rec, used=True, tg_id=tg_id,
+                admin_user_id=admin_user_id, exchange_token=exchange_token,
+            )
+            self._items[nonce] = rec
+            return rec
+
+    async def sweep(self) -> int:
+        cutoff = datetime.now(timezone.utc) - NONCE_RETENTION
+        dead = [k for k, r in self._items.items() if r.expires_at < cutoff]
+        for k in dead:
+            self._items.pop(k, None)
+        return len(dead)
+
+
+# ─── postgres (telegram_nonces) ───────────────────────────────────────────────
+class PostgresNonceStore(NonceStore):
+    TABLE = "telegram_nonces"
+
+    @staticmethod
+    def _record(row: Dict[str, Any]) -> NonceRecord:
+        return NonceRecord(
+            nonce=row["nonce"],
+            expires_at=row["expires_at"],
+            used=bool(row.get("used")),
+            tg_id=row.get("tg_id"),
+            admin_user_id=row.get("admin_user_id"),
+            exchange_token=row.get("exchange_token"),
+        )
+
+    async def create(self, nonce: str, ttl: timedelta) -> NonceRecord:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                f"insert into {self.TABLE} (nonce, expires_at, used) "
+                "values (%s, now() + %s, false) returning *",
+                (nonce, ttl),
+            )
+            return self._record(await cur.fetchone())
+
+    async def get(self, nonce: str) -> Optional[NonceRecord]:
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(f"select * from {self.TABLE} where nonce = %s", (nonce,))
+            row = await cur.fetchone()
+        return self._record(row) if row else None
+
+    async def mark_used(self, nonce, tg_id, admin_user_id=None, exchange_token=None) -> NonceRecord:
+        # admin_user_id / exchange_token есть не во всех инсталляциях таблицы
+        snap = await get_schema()
+        sets, params = ["used = true", "tg_id = %(tg_id)s"], {"nonce": nonce, "tg_id": tg_id}
+        if snap.has_column(self.TABLE, "admin_user_id"):
+            sets.append("admin_user_id = %(admin_user_id)s")
+            params["admin_user_id"] = admin_user_id
+        if snap.has_column(self.TABLE, "exchange_token"):
+            sets.append("exchange_token = %(exchange_token)s")
+            params["exchange_token"] = exchange_token
+
+        async with db_acursor(row_factory=dict_row) as cur:
+            await cur.execute(
+                f"update {self.TABLE} set {', '.join(sets)} "
+                "where nonce = %(nonce)s and not used and expires_at > now() "
+                "returning *",
+                params,
+            )
+            row = await cur.fetchone()
+            if row:
+                return self._record(row)
+            await cur.execute(f"select used from {self.TABLE} where nonce = %(nonce)s", params)
+            cur_row = await cur.fetchone()
+        if not cur_row:
+            raise NonceError("not_found")
+        raise NonceError("used" if cur_row["used"] else "expired")
+
+    async def sweep(self) -> int:
+        async with db_acursor() as cur:
+            await cur.execute(
+                f"delete from {self.TABLE} where expires_at < now() - %s",
+                (NONCE_RETENTION,),
+            )
+            return cur.rowcount or 0
+
+
+_store: Optional[NonceStore] = None
+
+
+def get_nonce_store() -> NonceStore:
+    global _store
+    if _store is None:
+        if NONCE_STORE == "memory":
+            _store = MemoryNonceStore()
+        elif NONCE_STORE in ("postgres", "pg"):
+            _store = PostgresNonceStore()
+        else:
+            raise RuntimeError(f"Unknown NONCE_STORE={NONCE_STORE!r} (memory|postgres)")
+    return _store
+
+
+__all__ = [
+    "NonceError", "NonceRecord", "NonceStore", "MemoryNonceStore",
+    "PostgresNonceStore", "get_nonce_store",
+]
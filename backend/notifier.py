@@ -0,0 +1,407 @@
+# backend/notifier.py
+from __future__ import annotations
+
+import asyncio, logging, os, random, time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from db import db_acursor
+
+log = logging.getLogger("notifier")
+
+# Исходящие сообщения бота идут через одну очередь на воркер:
+# общий httpx-клиент (keep-alive к api.telegram.org), несколько воркер-задач,
+# глобальный лимит (Telegram режет примерно на 30 msg/s) и пауза между сообщениями в один чат.
+# При NOTIFY_OUTBOX=1 каждое сообщение сначала пишется в telegram_outbox
+# (migrations/008_telegram_outbox.sql), и неотправленное подхватывается после рестарта.
+TELEGRAM_BOT_TOKEN = (os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("BOT_TOKEN") or "").strip()
+TG_API_BASE = os.getenv("TG_API_BASE", "https://api.telegram.org").rstrip("/")
+
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))       # msg/s на процесс
+NOTIFY_CHAT_INTERVAL = float(os.getenv("NOTIFY_CHAT_INTERVAL", "1.0"))  # сек между сообщениями в один чат
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_OUTBOX = os.getenv("NOTIFY_OUTBOX", "0") == "1"
+NOTIFY_OUTBOX_POLL = float(os.getenv("NOTIFY_OUTBOX_POLL", "5"))
+NOTIFY_OUTBOX_BATCH = int(os.getenv("NOTIFY_OUTBOX_BATCH", "100"))
+# пока строка «в работе» у воркера, другие процессы её не берут
+OUTBOX_LEASE_SECONDS = 120
+
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+@dataclass
+class Outgoing:
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = "HTML"
+    attempts: int = 0
+    outbox_id: Optional[int] = None
+
+
+class _RateLimiter:
+    """Token bucket: не больше rate событий в секунду, всплеск до burst."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = max(rate, 0.1)
+        self.capacity = burst if burst is not None else self.rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _PermanentError(Exception):
+    pass
+
+
+class _RetryAfter(Exception):
+    def __init__(self, seconds: float):
+        super().__init__(f"retry after {seconds}s")
+        self.seconds = seconds
+
+
+class Notifier:
+    def __init__(self):
+        self._queue: "asyncio.Queue[Outgoing]" = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+        self._poller: Optional[asyncio.Task] = None
+        self._limiter = _RateLimiter(NOTIFY_GLOBAL_RATE)
+        # chat_id -> monotonic-время, раньше которого в этот чат не пишем
+        self._chat_next: Dict[int, float] = {}
+        self._inflight: set = set()
+        self._delayed: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(TELEGRAM_BOT_TOKEN)
+
+    # ─── lifecycle ──────────────────────────────────────────────────────────────
+    async def start(self) -> None:
+        if self._client is not None or not self.enabled:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=f"{TG_API_BASE}/bot{TELEGRAM_BOT_TOKEN}",
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=NOTIFY_WORKERS * 2, max_keepalive_connections=NOTIFY_WORKERS),
+        )
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(NOTIFY_WORKERS)]
+        if NOTIFY_OUTBOX:
+            self._poller = asyncio.create_task(self._poll_outbox())
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *([self._poller] if self._poller else []), *self._delayed]
+        for t in tasks:
+            t.cancel()
+        for t in tasks:
+            try:
+                await t
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._workers, self._poller = [], None
+        self._delayed.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if not self._queue.empty():
+            # в режиме outbox они останутся pending в БД и уйдут после рестарта
+            log.warning("notifier stopped with %d queued messages", self._queue.qsize())
+
+    # ─── public ─────────────────────────────────────────────────────────────────
+    async def enqueue(self, chat_id: Optional[int], text: str, parse_mode: Optional[str] = "HTML") -> None:
+        """Поставить сообщение в очередь; сама отправка — в фоне, вызывающего не ждём."""
+        await self.enqueue_many([(chat_id, text)], parse_mode)
+
+    async def enqueue_many(
+        self, items: List[Tuple[Optional[int], str]], parse_mode: Optional[str] = "HTML"
+    ) -> None:
+        """Пачка (chat_id, text) вне транзакции вызывающего: outbox — своим коротким insert."""
+        if NOTIFY_OUTBOX and self.enabled:
+            try:
+                async with db_acursor() as cur:
+                    msgs = await self.stage_many(cur, items, parse_mode)
+            except Exception as e:
+                log.warning("outbox insert failed, sending in-memory: %s", e)
+                msgs = self._outgoing(items, parse_mode)
+        else:
+            msgs = self._outgoing(items, parse_mode)
+        self.dispatch(msgs)
+
+    async def stage_many(
+        self, cur, items: List[Tuple[Optional[int], str]], parse_mode: Optional[str] = "HTML"
+    ) -> List[Outgoing]:
+        """
+        Подготовить пачку внутри транзакции вызывающего (cur — её курсор): в режиме outbox
+        строки telegram_outbox коммитятся вместе со сменой статуса, без отдельного похода в БД.
+        В очередь ставит dispatch() — после коммита.
+        """
+        msgs = self._outgoing(items, parse_mode)
+        if not msgs or not NOTIFY_OUTBOX:
+            return msgs
+        try:
+            # savepoint: сбой outbox не откатывает саму смену статуса
+            async with cur.connection.transaction():
+                await cur.execute(
+                    "insert into telegram_outbox (chat_id, text, parse_mode, next_attempt_at)"
+                    " select t.chat_id, t.text, %s, now() + make_interval(secs => %s)"
+                    " from unnest(%s::bigint[], %s::text[]) as t(chat_id, text)"
+                    " returning id, chat_id, text",
+                    (parse_mode, OUTBOX_LEASE_SECONDS, [m.chat_id for m in msgs], [m.text for m in msgs]),
+                )
+                rows = await cur.fetchall()
+        except Exception as e:
+            # outbox недоступен — не теряем сообщения, шлём из памяти
+            log.warning("outbox insert failed, sending in-memory: %s", e)
+            return msgs
+        # порядок returning не гарантирован — сопоставляем по (chat_id, text);
+        # одинаковые сообщения взаимозаменяемы
+        ids: Dict[Tuple[int, str], List[int]] = {}
+        for r in rows:
+            oid, chat_id, text = (r["id"], r["chat_id"], r["text"]) if isinstance(r, dict) else r
+            ids.setdefault((int(chat_id), text), []).append(oid)
+        for m in msgs:
+            bucket = ids.get((m.chat_id, m.text))
+            m.outbox_id = bucket.pop() if bucket else None
+        return msgs
+
+    def dispatch(self, msgs: List[Outgoing]) -> None:
+        """В очередь отправки; без ожидания. Если транзакция откатилась — не вызывать."""
+        for m in msgs:
+            self._put(m)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    # ─── internals ──────────────────────────────────────────────────────────────
+    def _outgoing(self, items: List[Tuple[Optional[int], str]], parse_mode: Optional[str]) -> List[Outgoing]:
+        if not self.enabled:
+            return []
+        return [
+            Outgoing(chat_id=int(chat_id), text=text, parse_mode=parse_mode)
+            for chat_id, text in items
+            if chat_id and text
+        ]
+
+    def _put(self, msg: Outgoing) -> None:
+        if msg.outbox_id is not None:
+            self._inflight.add(msg.outbox_id)
+        try:
+            self._queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            log.error("notify queue full, dropping message to chat %s", msg.chat_id)
+            if msg.outbox_id is not None:
+                # строка останется pending и будет подобрана поллером после истечения lease
+                self._inflight.discard(msg.outbox_id)
+
+    def _put_later(self, msg: Outgoing, delay: float) -> None:
+        async def _later():
+            try:
+                await asyncio.sleep(delay)
+                self._put(msg)
+            finally:
+                self._delayed.discard(task)
+
+        task = asyncio.create_task(_later())
+        self._delayed.add(task)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            msg = await self._queue.get()
+            try:
+                now = time.monotonic()
+                wait = self._chat_next.get(msg.chat_id, 0.0) - now
+                if wait > 0:
+                    # этот чат ещё «остывает» — откладываем, воркер не блокируем
+                    self._put_later(msg, wait)
+                    continue
+                self._chat_next[msg.chat_id] = now + NOTIFY_CHAT_INTERVAL
+                await self._limiter.acquire()
+                await self._deliver(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("notifier worker %d: unexpected error: %s", n, e)
+            finally:
+                self._queue.task_done()
+                if len(self._chat_next) > 10000:
+                    self._prune_chats()
+
+    def _prune_chats(self) -> None:
+        now = time.monotonic()
+        self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+
+    async def _deliver(self, msg: Outgoing) -> None:
+        msg.attempts += 1
+        try:
+            await self._send(msg)
+        except _PermanentError as e:
+            log.warning("telegram rejected message to %s: %s", msg.chat_id, e)
+            await self._outbox_done(msg, error=str(e))
+            return
+        except _RetryAfter as e:
+            delay = e.seconds
+            err = f"429 retry_after={e.seconds}"
+            # флуд-контроль Telegram: притормаживаем и этот чат
+            self._chat_next[msg.chat_id] = time.monotonic() + delay
+        except Exception as e:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (msg.attempts - 1)) * (0.5 + random.random())
+            err = str(e) or e.__class__.__name__
+        else:
+            await self._outbox_done(msg)
+            return
+
+        if msg.attempts >= NOTIFY_MAX_ATTEMPTS:
+            log.warning("giving up on message to %s after %d attempts: %s", msg.chat_id, msg.attempts, err)
+            await self._outbox_done(msg, error=err)
+            return
+        await self._outbox_retry(msg, delay, err)
+        self._put_later(msg, delay)
+
+    async def _send(self, msg: Outgoing) -> None:
+        payload = {"chat_id": msg.chat_id, "text": msg.text}
+        if msg.parse_mode:
+            payload["parse_mode"] = msg.parse_mode
+        r = await self._client.post("/sendMessage", json=payload)
+        if r.status_code == 200:
+            return
+        try:
+            body = r.json()
+        except ValueError:
+            body = {}
+        if r.status_code == 429:
+            retry_after = (body.get("parameters") or {}).get("retry_after") or 1
+            raise _RetryAfter(float(retry_after))
+        if 400 <= r.status_code < 500:
+            # чат не найден, бот заблокирован, битая разметка — повтор не поможет
+            raise _PermanentError(f"{r.status_code} {body.get('description', '')}".strip())
+        raise RuntimeError(f"telegram {r.status_code}")
+
+    # ─── outbox ─────────────────────────────────────────────────────────────────
+    async def _outbox_done(self, msg: Outgoing, error: Optional[str] = None) -> None:
+        if msg.outbox_id is None:
+            return
+        self._inflight.discard(msg.outbox_id)
+        try:
+            async with db_acursor() as cur:
+                await cur.execute(
+                    "update telegram_outbox set status = %s, attempts = %s, last_error = %s,"
+                    " sent_at = case when %s = 'sent' then now() end where id = %s",
+                    ("failed" if error else "sent", msg.attempts, error,
+                     "failed" if error else "sent", msg.outbox_id),
+                )
+        except Exception as e:
+            log.warning("outbox update failed for %s: %s", msg.outbox_id, e)
+
+    async def _outbox_retry(self, msg: Outgoing, delay: float, error: str) -> None:
+        if msg.outbox_id is None:
+            return
+        try:
+            async with db_acursor() as cur:
+                await cur.execute(
+                    "update telegram_outbox set attempts = %s, last_error = %s,"
+                    " next_attempt_at = now() + make_interval(secs => %s) where id = %s",
+                    (msg.attempts, error, delay + OUTBOX_LEASE_SECONDS, msg.outbox_id),
+                )
+        except Exception as e:
+            log.warning("outbox update failed for %s: %s", msg.outbox_id, e)
+
+    async def _claim_outbox(self) -> List[Outgoing]:
+        # забираем пачку просроченных pending-строк и продлеваем им lease,
+        # чтобы другой воркер/процесс не взял те же
+        async with db_acursor() as cur:
+            await cur.execute(
+                """
+                update telegram_outbox o
+                   set next_attempt_at = now() + make_interval(secs => %(lease)s)
+                 where o.id in (
+                        select id from telegram_outbox
+                         where status = 'pending' and next_attempt_at <= now()
+                           and not (id = any(%(inflight)s))
+                         order by next_attempt_at
+                         limit %(batch)s
+                         for update skip locked
+                 )
+             returning o.id, o.chat_id, o.text, o.parse_mode, o.attempts
+                """,
+                {"lease": OUTBOX_LEASE_SECONDS, "inflight": list(self._inflight), "batch": NOTIFY_OUTBOX_BATCH},
+            )
+            rows = await cur.fetchall()
+        return [
+            Outgoing(chat_id=r[1], text=r[2], parse_mode=r[3], attempts=r[4] or 0, outbox_id=r[0])
+            for r in rows
+        ]
+
+    async def _poll_outbox(self) -> None:
+        while True:
+            try:
+                if self._queue.qsize() < NOTIFY_QUEUE_SIZE // 2:
+                    for msg in await self._claim_outbox():
+                        self._put(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("outbox poll failed: %s", e)
+            await asyncio.sleep(NOTIFY_OUTBOX_POLL)
+
+
+_STATUS_HUMAN = {
+    "pending": "New",
+    "confirmed": "Confirmed",
+    "in_progress": "Confirmed",
+    "done": "Done",
+    "cancelled": "Canceled",
+    "cancelled_by_user": "Canceled by user",
+}
+
+
+def human_status(s: str) -> str:
+    s = (s or "").lower()
+    return _STATUS_HUMAN.get(s, s)
+
+
+def status_changed_text(status: str) -> str:
+    return f"Статус вашей заявки: <b>{human_status(status)}</b>"
+
+
+_notifier: Optional[Notifier] = None
+
+
+def get_notifier() -> Notifier:
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+    return _notifier
+
+
+async def notify_chat(chat_id: Optional[int], text: str, parse_mode: Optional[str] = "HTML") -> None:
+    await get_notifier().enqueue(chat_id, text, parse_mode)
+
+
+async def notify_chats(items: List[Tuple[Optional[int], str]], parse_mode: Optional[str] = "HTML") -> None:
+    await get_notifier().enqueue_many(items, parse_mode)
+
+
+async def stage_chats(
+    cur, items: List[Tuple[Optional[int], str]], parse_mode: Optional[str] = "HTML"
+) -> List[Outgoing]:
+    """Уведомления в транзакции cur; после коммита — dispatch_staged()."""
+    return await get_notifier().stage_many(cur, items, parse_mode)
+
+
+def dispatch_staged(msgs: List[Outgoing]) -> None:
+    get_notifier().dispatch(msgs)
@@ -0,0 +1,68 @@
+# backend/request_search.py
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Tuple
+
+# Поиск по заявкам поверх таблицы request_search (migrations/004_requests_search.sql):
+# слова запроса — префиксный tsquery (GIN по tsv), вся строка — ILIKE по doc (trigram GIN).
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_TOKENS = 8
+
+
+def build_tsquery(q: str) -> str:
+    """'иван 12' -> 'иван:* & 12:*' ('' если слов нет)."""
+    tokens = _TOKEN_RE.findall((q or "").lower())[:MAX_TOKENS]
+    return " & ".join(f"{t}:*" for t in tokens)
+
+
+def _like(q: str) -> str:
+    esc = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{esc}%"
+
+
+def match_sql(q: str, alias: str = "s") -> Tuple[str, Dict[str, Any]]:
+    """Условие совпадения по request_search <alias> и его параметры (именованные)."""
+    params: Dict[str, Any] = {"search_like": _like(q)}
+    cond = f"{alias}.doc like %(search_like)s"
+    tsq = build_tsquery(q)
+    if tsq:
+        params["search_tsq"] = tsq
+        cond = f"({alias}.tsv @@ to_tsquery('simple', %(search_tsq)s) or {cond})"
+    return cond, params
+
+
+def ids_filter_sql(q: str, id_column: str = "id") -> Tuple[str, Dict[str, Any]]:
+    """Фильтр для списков: <id_column> in (совпадения в request_search)."""
+    cond, params = match_sql(q)
+    return f"{id_column} in (select s.request_id from request_search s where {cond})", params
+
+
+def ranked_sql(q: str, source: str, limit: int, columns: str = "v.*") -> Tuple[str, Dict[str, Any]]:
+    """
+    Топ-N совпадений с рангом: ts_rank по словам + trigram similarity по всей строке.
+    source — вьюха/таблица со строками заявок (join по id, алиас v), columns — её колонки.
+    """
+    cond, params = match_sql(q)
+    rank = "similarity(s.doc, %(search_q)s)"
+    if "search_tsq" in params:
+        rank = f"ts_rank(s.tsv, to_tsquery('simple', %(search_tsq)s)) + {rank}"
+    params.update({"search_q": (q or "").lower(), "search_limit": limit})
+    sql = f"""
+        with hits as (
+            select s.request_id, s.created_at, {rank} as rank
+            from request_search s
+            where {cond}
+            order by rank desc, s.created_at desc
+            limit %(search_limit)s
+        )
+        select {columns}, h.rank as search_rank
+        from hits h
+        join {source} v on v.id = h.request_id
+        order by h.rank desc, h.created_at desc
+    """
+    return sql, params
+
+
+__all__ = ["build_tsquery", "match_sql", "ids_filter_sql", "ranked_sql"]
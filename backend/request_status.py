@@ -0,0 +1,25 @@
+# backend/request_status.py
+from __future__ import annotations
+
+# Переходы статусов заявки — единственная таблица для API бота (api/requests_api.py)
+# и админки (admin_requests.py: /bulk; одиночная смена статуса админом их не проверяет).
+# in_progress — то же, что confirmed, в схеме, где статус «в работе» назван так
+# (админка пишет confirmed как in_progress).
+TRANSITIONS = {
+    "pending": {"confirmed", "in_progress", "cancelled", "cancelled_by_user"},
+    "confirmed": {"in_progress", "done", "cancelled"},
+    "in_progress": {"done", "cancelled"},
+    "done": set(),
+    "cancelled": set(),
+    "cancelled_by_user": set(),
+}
+
+
+def can_transition(src: str, dst: str) -> bool:
+    """Переход src → dst разрешён (тот же статус — не переход, см. вызывающих)."""
+    return dst in TRANSITIONS.get(src, set())
+
+
+def sources_for(dst: str) -> list:
+    """Статусы, из которых можно прийти в dst (для атомарной проверки в WHERE)."""
+    return [src for src, targets in TRANSITIONS.items() if dst in targets]
@@ -0,0 +1,91 @@
+# backend/routes/events.py
+from __future__ import annotations
+
+import asyncio, json
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from admin_auth import require_admin
+from event_hub import subscribe, unsubscribe
+from utils.telegram import current_tg_user
+from utils.stream_token import issue_stream_token, STREAM_TOKEN_TTL
+
+# SSE-поток изменений заявок и сообщений чата (вместо пере-опроса списков).
+# router → /api/events (initData), admin_router → /admin/events (cookie)
+router = APIRouter(tags=["events"])
+admin_router = APIRouter(tags=["events"])
+
+HEARTBEAT_SECONDS = 15
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    kind = event.get("kind") or "message"
+    return f"event: {kind}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def _token_event(tg_id: int) -> str:
+    return _sse({"kind": "token", "token": issue_stream_token(tg_id), "expires_in": STREAM_TOKEN_TTL})
+
+
+async def _stream(request: Request, tg_id: Optional[int]):
+    # подписка внутри генератора: если ответ так и не начали стримить, подписчика нет
+    sub = subscribe(tg_id)
+    try:
+        yield "retry: 3000\n\n"
+        loop = asyncio.get_running_loop()
+        refresh_at = None
+        if tg_id is not None:
+            # токен проверяется только при подключении; свежий нужен для переподключения,
+            # поэтому шлём его заранее, до истечения прежнего
+            yield _token_event(tg_id)
+            refresh_at = loop.time() + STREAM_TOKEN_TTL / 2
+        while True:
+            if await request.is_disconnected():
+                break
+            if refresh_at is not None and loop.time() >= refresh_at:
+                yield _token_event(tg_id)
+                refresh_at = loop.time() + STREAM_TOKEN_TTL / 2
+            timeout = HEARTBEAT_SECONDS
+            if refresh_at is not None:
+                timeout = max(0.0, min(timeout, refresh_at - loop.time()))
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield _sse(event)
+    finally:
+        unsubscribe(sub)
+
+
+def _sse_response(request: Request, tg_id: Optional[int]) -> StreamingResponse:
+    return StreamingResponse(
+        _stream(request, tg_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@admin_router.get("/admin/events")
+async def admin_events(request: Request, user=Depends(require_admin)):
+    """Все события по заявкам и чатам (для админ-панели)."""
+    return _sse_response(request, None)
+
+
+@router.post("/events/token")
+async def resident_events_token(tg: Dict[str, Any] = Depends(current_tg_user)):
+    """Обмен initData (заголовок) на короткий токен для EventSource: GET /api/events?token=..."""
+    return {"token": issue_stream_token(int(tg["id"])), "expires_in": STREAM_TOKEN_TTL}
+
+
+@router.get("/events")
+async def resident_events(request: Request, tg: Dict[str, Any] = Depends(current_tg_user)):
+    """
+    События только по заявкам текущего резидента.
+    EventSource не умеет заголовки — ?token= из POST /api/events/token (проверяет мидлварь
+    при подключении). Поток сам присылает event: token со свежим токеном; переподключаться
+    (onerror → close + new EventSource) нужно с последним из них, а не с исходным URL.
+    """
+    return _sse_response(request, int(tg["id"]))
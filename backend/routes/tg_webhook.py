@@ -0,0 +1,95 @@
+# backend/routes/tg_webhook.py
+from __future__ import annotations
+
+import logging, os, secrets
+from functools import lru_cache
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, Request
+
+from admin_auth import confirm_telegram_login
+
+log = logging.getLogger("tg_webhook")
+
+# Бот в режиме webhook внутри процесса API (TG_MODE=webhook):
+# Telegram шлёт апдейты на /tg/webhook, они уходят в aiogram Dispatcher из tg_bot.py,
+# а nonce подтверждается прямым вызовом confirm_telegram_login — без API_CALLBACK.
+TG_MODE = os.getenv("TG_MODE", "polling").strip().lower()
+TG_WEBHOOK_URL = os.getenv("TG_WEBHOOK_URL", "").strip()          # публичный https://.../tg/webhook
+TG_WEBHOOK_SECRET = os.getenv("TG_WEBHOOK_SECRET", "").strip()    # X-Telegram-Bot-Api-Secret-Token
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WEBHOOK_ENABLED = (
+    TG_MODE == "webhook"
+    and bool(os.getenv("TELEGRAM_BOT_TOKEN", "").strip())
+    and bool(TG_WEBHOOK_SECRET)
+)
+
+router = APIRouter(prefix="/tg", tags=["telegram"])
+
+
+@lru_cache(maxsize=1)
+def _bot_module():
+    # aiogram и Bot(token) поднимаем только в webhook-режиме
+    import tg_bot
+    return tg_bot
+
+
+async def _confirm_in_process(nonce: str, tg_id: int, tg_username: str) -> bool:
+    try:
+        await confirm_telegram_login(nonce, tg_id, tg_username)
+    except HTTPException as e:
+        log.info("TG login rejected: tg_id=%s: %s", tg_id, e.detail)
+        return False
+    return True
+
+
+async def start_webhook() -> None:
+    if not WEBHOOK_ENABLED:
+        if TG_MODE == "webhook":
+            log.warning("TG_MODE=webhook, but TELEGRAM_BOT_TOKEN or TG_WEBHOOK_SECRET is missing")
+        return
+    if not TG_WEBHOOK_URL:
+        # вебхук уже зарегистрирован снаружи (деплой-скрипт / другой воркер)
+        return
+    m = _bot_module()
+    try:
+        await m.bot.set_webhook(
+            TG_WEBHOOK_URL,
+            secret_token=TG_WEBHOOK_SECRET,
+            allowed_updates=m.dp.resolve_used_update_types(),
+        )
+    except Exception as e:
+        log.warning("setWebhook failed: %s", e)
+
+
+async def stop_webhook() -> None:
+    # deleteWebhook не зовём: при rolling-деплое апдейты должен получать следующий инстанс
+    if WEBHOOK_ENABLED:
+        m = _bot_module()
+        await m.bot.session.close()
+        await m.http.aclose()
+
+
+@router.post("/webhook")
+async def tg_webhook(request: Request) -> Dict[str, Any]:
+    if not WEBHOOK_ENABLED:
+        raise HTTPException(404, "webhook disabled")
+    got = request.headers.get(SECRET_HEADER) or ""
+    if not secrets.compare_digest(got, TG_WEBHOOK_SECRET):
+        raise HTTPException(403, "bad secret token")
+
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(400, "bad update")
+
+    m = _bot_module()
+    from aiogram.types import Update
+    try:
+        update = Update.model_validate(data, context={"bot": m.bot})
+        await m.dp.feed_update(m.bot, update, confirm_login=_confirm_in_process)
+    except Exception:
+        # 200 всё равно: иначе Telegram будет повторять тот же апдейт
+        log.exception("webhook update %s failed", data.get("update_id") if isinstance(data, dict) else None)
+    return {"ok": True}
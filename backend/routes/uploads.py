@@ -0,0 +1,338 @@
+# backend/routes/uploads.py
+from __future__ import annotations
+
+import hashlib, logging, mimetypes, os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+
+from admin_auth import require_admin
+from db import db_acursor
+from storage import get_storage, new_object_key, StorageWriter
+from media import (
+    DERIVATIVE_SIZES, DERIVATIVE_TYPE, derivative_etag, ensure_derivative,
+    file_url, is_file_id, schedule_derivatives,
+)
+from utils.telegram import current_tg_user, init_data_from_headers
+from api.auth_api import SESSION_COOKIE
+
+log = logging.getLogger("uploads")
+
+# Загрузка фото к заявкам. multipart-тело читается потоком (request.stream()),
+# каждый файл по кускам уходит в хранилище (storage.py) и параллельно хэшируется;
+# повторная загрузка того же содержимого не создаёт второй объект (таблица uploads).
+# Мидлварь initData эти пути пропускает — авторизация в зависимостях роутов.
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(30 * 1024 * 1024)))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "10"))
+UPLOAD_ALLOWED_TYPES = {
+    t.strip().lower()
+    for t in os.getenv(
+        "UPLOAD_ALLOWED_TYPES",
+        "image/jpeg,image/png,image/webp,image/heic,image/heif,image/gif,application/pdf",
+    ).split(",")
+    if t.strip()
+}
+# запас на multipart-заголовки и границы сверх суммарного размера файлов
+_ENVELOPE_SLACK = 64 * 1024
+_MAX_FIELD_BYTES = 4 * 1024
+# файлы адресуются хэшем содержимого — ответ по URL никогда не меняется
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+router = APIRouter(tags=["uploads"])
+
+
+# ─── multipart ──────────────────────────────────────────────────────────────────
+class _FilePart:
+    def __init__(self, writer: StorageWriter, filename: str, content_type: str):
+        self.writer = writer
+        self.filename = filename
+        self.content_type = content_type
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+
+class _StreamingForm:
+    """
+    Колбэки python-multipart синхронные — они только складывают события в список,
+    а запись в хранилище (await) делается после каждого parser.write(chunk).
+    В памяти держится не больше одного чанка тела.
+    """
+
+    def __init__(self, boundary: bytes, uploaded_by: Optional[int]):
+        self.uploaded_by = uploaded_by
+        self.events: List[Tuple[str, bytes]] = []
+        self.files: List[Dict[str, Any]] = []
+        self.current: Optional[_FilePart] = None
+        self._field = b""
+        self._value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._skip_part = False
+        self._field_size = 0
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": lambda: self.events.append(("begin", b"")),
+            "on_part_data": lambda d, s, e: self.events.append(("data", d[s:e])),
+            "on_part_end": lambda: self.events.append(("end", b"")),
+            "on_header_field": lambda d, s, e: self.events.append(("hfield", d[s:e])),
+            "on_header_value": lambda d, s, e: self.events.append(("hvalue", d[s:e])),
+            "on_header_end": lambda: self.events.append(("hend", b"")),
+            "on_headers_finished": lambda: self.events.append(("headers", b"")),
+        })
+
+    async def feed(self, chunk: bytes) -> None:
+        self.parser.write(chunk)
+        await self._drain()
+
+    async def finish(self) -> None:
+        self.parser.finalize()
+        await self._drain()
+
+    async def abort(self) -> None:
+        if self.current is not None:
+            await self.current.writer.abort()
+            self.current = None
+
+    async def _drain(self) -> None:
+        events, self.events = self.events, []
+        for kind, data in events:
+            if kind == "begin":
+                self._headers, self._field, self._value = {}, b"", b""
+                self._skip_part, self._field_size = False, 0
+            elif kind == "hfield":
+                self._field += data
+            elif kind == "hvalue":
+                self._value += data
+            elif kind == "hend":
+                self._headers[self._field.lower()] = self._value
+                self._field, self._value = b"", b""
+            elif kind == "headers":
+                self._start_part()
+            elif kind == "data":
+                await self._part_data(data)
+            elif kind == "end":
+                await self._end_part()
+
+    def _start_part(self) -> None:
+        _, disp = parse_options_header(self._headers.get(b"content-disposition", b""))
+        filename = disp.get(b"filename")
+        if filename is None:
+            # обычные поля формы нам не нужны — только ограничиваем их размер
+            self._skip_part = True
+            return
+        if len(self.files) >= UPLOAD_MAX_FILES:
+            raise HTTPException(413, f"too many files (max {UPLOAD_MAX_FILES})")
+
+        name = os.path.basename(filename.decode("utf-8", "replace"))[:200]
+        ctype = self._headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+        if not ctype or ctype == "application/octet-stream":
+            ctype = (mimetypes.guess_type(name)[0] or "").lower()
+        if ctype not in UPLOAD_ALLOWED_TYPES:
+            raise HTTPException(415, f"unsupported file type '{ctype or 'unknown'}'")
+
+        ext = os.path.splitext(name)[1].lower()[:10] if "." in name else ""
+        self.current = _FilePart(get_storage().writer(new_object_key(ext)), name, ctype)
+
+    async def _part_data(self, data: bytes) -> None:
+        if self._skip_part:
+            self._field_size += len(data)
+            if self._field_size > _MAX_FIELD_BYTES:
+                raise HTTPException(413, "form field too large")
+            return
+        part = self.current
+        if part is None:
+            return
+        part.size += len(data)
+        if part.size > UPLOAD_MAX_FILE_BYTES:
+            raise HTTPException(413, f"file too large (max {UPLOAD_MAX_FILE_BYTES} bytes)")
+        part.hasher.update(data)
+        await part.writer.write(data)
+
+    async def _end_part(self) -> None:
+        part, self.current = self.current, None
+        if part is None:
+            return
+        if part.size == 0:
+            await part.writer.abort()
+            raise HTTPException(400, f"empty file '{part.filename}'")
+        await part.writer.commit(part.content_type)
+        file_id = part.hasher.hexdigest()
+        key, ctype = await _register(file_id, part, self.uploaded_by)
+        schedule_derivatives(file_id, key, ctype)
+        self.files.append({
+            "id": file_id,
+            "url": file_url(file_id),
+            "name": part.filename,
+            "size": part.size,
+            "type": ctype,
+        })
+
+
+async def _register(file_id: str, part: _FilePart, uploaded_by: Optional[int]) -> Tuple[str, str]:
+    """
+    Запись в uploads; если такое содержимое уже было — новый объект удаляем.
+    Возвращает (storage_key, content_type) той записи, что осталась.
+    """
+    async with db_acursor() as cur:
+        await cur.execute(
+            """
+            insert into uploads (id, storage_key, size, content_type, uploaded_by)
+            values (%s, %s, %s, %s, %s)
+            on conflict (id) do nothing
+            returning storage_key, content_type
+            """,
+            (file_id, part.writer.key, part.size, part.content_type, uploaded_by),
+        )
+        row = await cur.fetchone()
+        if not row:
+            await cur.execute("select storage_key, content_type from uploads where id = %s", (file_id,))
+            row = await cur.fetchone()
+        if uploaded_by is not None:
+            await cur.execute(
+                "insert into upload_owners (upload_id, tg_id) values (%s, %s) on conflict do nothing",
+                (file_id, uploaded_by),
+            )
+    if row[0] != part.writer.key:
+        try:
+            await get_storage().delete(part.writer.key)
+        except Exception as e:
+            log.warning("dedup: failed to delete duplicate object %s: %s", part.writer.key, e)
+    return row[0], row[1]
+
+
+async def _receive_files(request: Request, uploaded_by: Optional[int]) -> List[Dict[str, Any]]:
+    ctype, params = parse_options_header(request.headers.get("content-type") or "")
+    if ctype != b"multipart/form-data":
+        raise HTTPException(415, "multipart/form-data expected")
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(400, "multipart boundary missing")
+
+    limit = UPLOAD_MAX_REQUEST_BYTES + _ENVELOPE_SLACK
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > limit:
+        # отказываем до чтения тела
+        raise HTTPException(413, f"request too large (max {UPLOAD_MAX_REQUEST_BYTES} bytes)")
+
+    form = _StreamingForm(boundary, uploaded_by)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise HTTPException(413, f"request too large (max {UPLOAD_MAX_REQUEST_BYTES} bytes)")
+            await form.feed(chunk)
+        await form.finish()
+    except HTTPException:
+        await form.abort()
+        raise
+    except MultipartParseError as e:
+        await form.abort()
+        raise HTTPException(400, f"bad multipart body: {e}")
+    except Exception:
+        await form.abort()
+        raise
+    # уже сохранённые до ошибки файлы остаются в uploads: содержимое адресуется хэшем
+    # и при повторной попытке просто переиспользуется
+
+    if not form.files:
+        raise HTTPException(400, "no files")
+    return form.files
+
+
+async def _uploader_tg_id(request: Request) -> int:
+    """
+    initData из заголовка, иначе кука uv_sid (ставит POST /api/auth/me) —
+    FormData из WebApp часто уходит без наших заголовков.
+    """
+    if getattr(request.state, "tg_user", None) or init_data_from_headers(request):
+        return int((await current_tg_user(request))["id"])
+    raw = request.cookies.get(SESSION_COOKIE) or ""
+    if not raw.isdigit():
+        raise HTTPException(401, "Missing initData or session cookie")
+    return int(raw)
+
+
+# ─── endpoints ──────────────────────────────────────────────────────────────────
+@router.post("/uploads")
+async def upload_files(request: Request, tg_id: int = Depends(_uploader_tg_id)):
+    """Фото к заявке от резидента; ответ — ссылки для поля photos в /requests/create."""
+    files = await _receive_files(request, tg_id)
+    return {"files": files}
+
+
+@router.post("/admin/uploads", dependencies=[Depends(require_admin)])
+async def admin_upload_files(request: Request):
+    files = await _receive_files(request, None)
+    return {"files": files}
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match") or ""
+    return etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+
+
+def _send(request: Request, key: str, ctype: str, etag: str, size: Optional[int] = None):
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is not None:
+        if not path.exists():
+            raise HTTPException(404, "not found")
+        # свой ETag вместо mtime/size-варианта FileResponse
+        return FileResponse(path, media_type=ctype, headers=headers)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return StreamingResponse(storage.read(key), media_type=ctype, headers=headers)
+
+
+async def _lookup(file_id: str) -> Tuple[str, str, int, int]:
+    file_id = file_id.lower()
+    if not is_file_id(file_id):
+        raise HTTPException(404, "not found")
+    async with db_acursor() as cur:
+        await cur.execute(
+            "select storage_key, size, content_type from uploads where id = %s",
+            (file_id,),
+        )
+        row = await cur.fetchone()
+    if not row:
+        raise HTTPException(404, "not found")
+    return file_id, row[0], row[1], row[2]
+
+
+@router.get("/files/{file_id}")
+async def get_file(file_id: str, request: Request):
+    # id — sha256 содержимого: угадать его без самого файла нельзя,
+    # поэтому отдаём без initData (картинки грузятся через <img src>)
+    etag = f'"{file_id.lower()}"'
+    if _not_modified(request, etag):
+        # повторная проверка кэша браузером — даже в БД не ходим
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE})
+    file_id, key, size, ctype = await _lookup(file_id)
+    return _send(request, key, ctype, etag, size)
+
+
+@router.get("/files/{file_id}/{size}")
+async def get_file_derivative(file_id: str, size: str, request: Request):
+    """Превью (thumb) и средний размер (medium) в webp; создаются при первом запросе."""
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(404, "not found")
+    etag = derivative_etag(file_id.lower(), size)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE})
+    file_id, key, _, ctype = await _lookup(file_id)
+    dkey = await ensure_derivative(file_id, key, ctype, size)
+    if dkey is None:
+        # pdf/heic или Pillow нет — отдаём оригинал
+        return RedirectResponse(file_url(file_id), status_code=307)
+    return _send(request, dkey, DERIVATIVE_TYPE, etag)
@@ -0,0 +1,106 @@
+# backend/schema_cache.py
+from __future__ import annotations
+
+import os, time, asyncio, logging
+from typing import Dict, FrozenSet, Optional
+
+from db import db_acursor
+
+log = logging.getLogger("schema_cache")
+
+# Схема public меняется только миграциями: читаем information_schema один раз
+# на старте и дальше не чаще, чем раз в SCHEMA_CACHE_TTL секунд (или по /admin/system/schema/refresh).
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "600"))
+SCHEMA_RETRY_BACKOFF = float(os.getenv("SCHEMA_RETRY_BACKOFF", "30"))
+
+
+class SchemaSnapshot:
+    def __init__(self, columns: Dict[str, FrozenSet[str]], views: FrozenSet[str], loaded_at: float):
+        self.columns = columns
+        self.views = views
+        self.loaded_at = loaded_at
+
+    def has_table(self, name: str) -> bool:
+        return name in self.columns
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.columns.get(table, frozenset())
+
+    def table_columns(self, table: str) -> FrozenSet[str]:
+        return self.columns.get(table, frozenset())
+
+    def view_exists(self, name: str) -> bool:
+        return name in self.views
+
+    def as_dict(self) -> dict:
+        return {
+            "loaded_at": self.loaded_at,
+            "tables": {t: sorted(cols) for t, cols in sorted(self.columns.items())},
+            "views": sorted(self.views),
+        }
+
+
+_EMPTY = SchemaSnapshot({}, frozenset(), 0.0)
+_snapshot: SchemaSnapshot = _EMPTY
+_lock = asyncio.Lock()
+# после неудачной перезагрузки следующая попытка не раньше этого момента
+_retry_at = 0.0
+
+
+async def _load_locked() -> SchemaSnapshot:
+    global _snapshot
+    async with db_acursor() as cur:
+        await cur.execute(
+            """
+            select table_name, array_agg(column_name::text)
+            from information_schema.columns
+            where table_schema = 'public'
+            group by table_name
+            """
+        )
+        columns = {str(t): frozenset(cols or []) for t, cols in await cur.fetchall()}
+        await cur.execute(
+            "select table_name from information_schema.views where table_schema = 'public'"
+        )
+        views = frozenset(str(r[0]) for r in await cur.fetchall())
+    _snapshot = SchemaSnapshot(columns, views, time.time())
+    log.info("schema cache loaded: %d relations, %d views", len(columns), len(views))
+    return _snapshot
+
+
+async def load_schema() -> SchemaSnapshot:
+    """Перечитать колонки/вьюхи схемы public одним проходом."""
+    async with _lock:
+        return await _load_locked()
+
+
+def _fresh(snap: SchemaSnapshot) -> bool:
+    return bool(snap.loaded_at) and time.time() - snap.loaded_at < SCHEMA_CACHE_TTL
+
+
+async def get_schema() -> SchemaSnapshot:
+    """Текущий снимок схемы; перечитывается, если протух по TTL."""
+    global _retry_at
+    snap = _snapshot
+    if _fresh(snap) or time.time() < _retry_at:
+        return snap
+    async with _lock:
+        # пока ждали лок, снимок мог перечитать другой запрос
+        snap = _snapshot
+        if _fresh(snap) or time.time() < _retry_at:
+            return snap
+        try:
+            return await _load_locked()
+        except Exception as e:
+            # БД недоступна — работаем со старым снимком, повтор не раньше чем через backoff
+            _retry_at = time.time() + SCHEMA_RETRY_BACKOFF
+            log.warning("schema cache refresh failed (retry in %ss): %s", SCHEMA_RETRY_BACKOFF, e)
+            return snap
+
+
+def current_schema() -> Optional[SchemaSnapshot]:
+    """Снимок без обращения к БД (None, если ещё не загружен)."""
+    return _snapshot if _snapshot.loaded_at else None
+
+
+__all__ = ["SchemaSnapshot", "load_schema", "get_schema", "current_schema"]
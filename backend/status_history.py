@@ -0,0 +1,28 @@
+# backend/status_history.py
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+# История статусов (migrations/013_request_status_events.sql).
+# События пишет триггер на requests в транзакции смены статуса; отсюда только
+# подпись «кто» и чтение истории.
+
+
+async def set_actor(cur, actor: Optional[Any]) -> None:
+    """
+    Подписать смены статуса в текущей транзакции (попадает в request_status_events.actor).
+    Звать на том же курсоре до update requests; действует до конца транзакции.
+    """
+    if actor is None:
+        return
+    await cur.execute("select set_config('app.actor', %s, true)", (str(actor),))
+
+
+async def fetch_history(cur, request_id: Any) -> List[Any]:
+    await cur.execute(
+        "select id, from_status, to_status, changed_at, actor"
+        " from request_status_events where request_id = %s"
+        " order by changed_at asc, id asc",
+        (request_id,),
+    )
+    return await cur.fetchall()
@@ -0,0 +1,264 @@
+# backend/storage.py
+from __future__ import annotations
+
+import asyncio, contextlib, logging, os, uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+log = logging.getLogger("storage")
+
+# Хранилище файлов загрузок (routes/uploads.py).
+# UPLOAD_STORAGE=local — каталог UPLOAD_DIR; s3 — любое S3-совместимое (AWS, MinIO),
+# для него нужен aioboto3. Запись идёт потоково: писатель получает куски по мере
+# чтения multipart-тела, целиком файл в памяти не держится.
+UPLOAD_STORAGE = os.getenv("UPLOAD_STORAGE", "local").strip().lower()
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(__file__).resolve().parent / "var" / "uploads"))).resolve()
+
+S3_BUCKET = os.getenv("S3_BUCKET", "").strip()
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "").strip() or None   # напр. http://localhost:9000 для MinIO
+S3_REGION = os.getenv("S3_REGION", "us-east-1").strip()
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/").strip()
+# минимальный размер части multipart upload в S3 (кроме последней)
+S3_PART_SIZE = 5 * 1024 * 1024
+
+READ_CHUNK = 64 * 1024
+
+
+def new_object_key(ext: str = "") -> str:
+    # ключ объекта не зависит от содержимого: хэш известен только в конце потока,
+    # а дедупликация делается по таблице uploads
+    now = datetime.now(timezone.utc)
+    return f"{now:%Y/%m}/{uuid.uuid4().hex}{ext}"
+
+
+class StorageWriter(ABC):
+    key: str
+
+    @abstractmethod
+    async def write(self, chunk: bytes) -> None: ...
+
+    @abstractmethod
+    async def commit(self, content_type: Optional[str]) -> None: ...
+
+    @abstractmethod
+    async def abort(self) -> None: ...
+
+
+class Storage(ABC):
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    def writer(self, key: str) -> StorageWriter: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    async def read(self, key: str) -> AsyncIterator[bytes]: ...
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Путь на диске, если хранилище локальное (для FileResponse / sendfile)."""
+        return None
+
+
+# ─── local ──────────────────────────────────────────────────────────────────────
+class _LocalWriter(StorageWriter):
+    def __init__(self, root: Path, key: str):
+        self.key = key
+        self._final = root / key
+        self._tmp = root / "tmp" / f"{uuid.uuid4().hex}.part"
+        self._fh = None
+
+    async def write(self, chunk: bytes) -> None:
+        if self._fh is None:
+            self._tmp.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = await asyncio.to_thread(open, self._tmp, "wb")
+        await asyncio.to_thread(self._fh.write, chunk)
+
+    async def commit(self, content_type: Optional[str]) -> None:
+        if self._fh is None:
+            await self.write(b"")
+        await asyncio.to_thread(self._fh.close)
+        self._final.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(os.replace, self._tmp, self._final)
+
+    async def abort(self) -> None:
+        if self._fh is not None:
+            await asyncio.to_thread(self._fh.close)
+        try:
+            self._tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: Path = UPLOAD_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ValueError("bad storage key")
+        return path
+
+    def writer(self, key: str) -> StorageWriter:
+        self._path(key)
+        return _LocalWriter(self.root, key)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(self._path(key).unlink)
+        except FileNotFoundError:
+            pass
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._path(key).is_file)
+
+    async def read(self, key: str) -> AsyncIterator[bytes]:
+        fh = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(fh.read, READ_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            fh.close()
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+
+# ─── s3 ─────────────────────────────────────────────────────────────────────────
+class _S3Writer(StorageWriter):
+    """
+    Копим не больше S3_PART_SIZE байт и отправляем частью multipart upload.
+    Файл меньше одной части уходит одним put_object.
+    """
+
+    def __init__(self, storage: "S3Storage", key: str):
+        self.key = key
+        self._s = storage
+        self._buf = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: list = []
+
+    async def _flush_part(self) -> None:
+        s3 = self._s.s3
+        if self._upload_id is None:
+            r = await s3.create_multipart_upload(Bucket=S3_BUCKET, Key=self._s.full(self.key))
+            self._upload_id = r["UploadId"]
+        n = len(self._parts) + 1
+        r = await s3.upload_part(
+            Bucket=S3_BUCKET, Key=self._s.full(self.key),
+            UploadId=self._upload_id, PartNumber=n, Body=bytes(self._buf),
+        )
+        self._parts.append({"ETag": r["ETag"], "PartNumber": n})
+        self._buf.clear()
+
+    async def write(self, chunk: bytes) -> None:
+        self._buf.extend(chunk)
+        if len(self._buf) >= S3_PART_SIZE:
+            await self._flush_part()
+
+    async def commit(self, content_type: Optional[str]) -> None:
+        key = self._s.full(self.key)
+        if self._upload_id is None:
+            await self._s.s3.put_object(
+                Bucket=S3_BUCKET, Key=key, Body=bytes(self._buf),
+                ContentType=content_type or "application/octet-stream",
+            )
+            self._buf.clear()
+            return
+        if self._buf:
+            await self._flush_part()
+        await self._s.s3.complete_multipart_upload(
+            Bucket=S3_BUCKET, Key=key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    async def abort(self) -> None:
+        self._buf.clear()
+        if self._upload_id is None:
+            return
+        try:
+            await self._s.s3.abort_multipart_upload(
+                Bucket=S3_BUCKET, Key=self._s.full(self.key), UploadId=self._upload_id,
+            )
+        except Exception as e:
+            log.warning("s3 abort failed for %s: %s", self.key, e)
+
+
+class S3Storage(Storage):
+    def __init__(self):
+        try:
+            import aioboto3
+        except ImportError:
+            raise RuntimeError("UPLOAD_STORAGE=s3 requires aioboto3")
+        if not S3_BUCKET:
+            raise RuntimeError("S3_BUCKET is required for UPLOAD_STORAGE=s3")
+        self._session = aioboto3.Session()
+        self._stack: Optional[contextlib.AsyncExitStack] = None
+        self._client = None
+
+    async def start(self) -> None:
+        # один клиент (и пул соединений) на процесс
+        if self._client is None:
+            self._stack = contextlib.AsyncExitStack()
+            self._client = await self._stack.enter_async_context(
+                self._session.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+            )
+
+    async def stop(self) -> None:
+        if self._stack is not None:
+            await self._stack.aclose()
+        self._stack, self._client = None, None
+
+    @property
+    def s3(self):
+        if self._client is None:
+            raise RuntimeError("S3 storage is not started")
+        return self._client
+
+    def full(self, key: str) -> str:
+        return f"{S3_PREFIX}{key}"
+
+    def writer(self, key: str) -> StorageWriter:
+        return _S3Writer(self, key)
+
+    async def delete(self, key: str) -> None:
+        await self.s3.delete_object(Bucket=S3_BUCKET, Key=self.full(key))
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self.s3.head_object(Bucket=S3_BUCKET, Key=self.full(key))
+        except Exception as e:
+            code = str(getattr(e, "response", {}).get("Error", {}).get("Code", ""))
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def read(self, key: str) -> AsyncIterator[bytes]:
+        r = await self.s3.get_object(Bucket=S3_BUCKET, Key=self.full(key))
+        async for chunk in r["Body"].iter_chunks(READ_CHUNK):
+            yield chunk
+
+
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        _storage = S3Storage() if UPLOAD_STORAGE == "s3" else LocalStorage()
+    return _storage
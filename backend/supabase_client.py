@@ -0,0 +1,74 @@
+# backend/supabase_client.py
+from __future__ import annotations
+
+import os, logging
+from typing import Dict, Optional
+
+from postgrest import AsyncPostgrestClient
+from supabase import acreate_client, AsyncClient
+
+log = logging.getLogger("supabase_client")
+
+# -------- ENV --------
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip()
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "").strip()
+if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+    raise RuntimeError("SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY is not set")
+
+# Один async-клиент на воркер: PostgREST ходит через один httpx.AsyncClient (HTTP/2,
+# keep-alive), так что запросы не платят за новый TLS-хендшейк и не блокируют event loop.
+_client: Optional[AsyncClient] = None
+# sb.schema(x) переключает схему у общего клиента (или плодит новые сессии,
+# зависит от версии) — для не-public схем держим по отдельному PostgREST-клиенту
+_schema_clients: Dict[str, AsyncPostgrestClient] = {}
+
+
+async def open_supabase() -> AsyncClient:
+    global _client
+    if _client is None:
+        _client = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    return _client
+
+
+async def close_supabase() -> None:
+    global _client
+    clients = list(_schema_clients.values())
+    if _client is not None:
+        clients.append(_client.postgrest)
+    for c in clients:
+        try:
+            await c.aclose()
+        except Exception as e:
+            log.warning("supabase client close failed: %s", e)
+    _schema_clients.clear()
+    _client = None
+
+
+def get_sb() -> AsyncClient:
+    if _client is None:
+        raise RuntimeError("Supabase client is not initialized (app lifespan not started)")
+    return _client
+
+
+def sb_table(name: str, schema: Optional[str] = None):
+    """
+    Query builder для таблицы/вьюхи. Без schema — дефолтная схема клиента (public).
+    Не забывать await ...execute().
+    """
+    if not schema:
+        return get_sb().table(name)
+    pg = _schema_clients.get(schema)
+    if pg is None:
+        pg = AsyncPostgrestClient(
+            f"{SUPABASE_URL}/rest/v1",
+            schema=schema,
+            headers={
+                "apikey": SUPABASE_SERVICE_ROLE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+            },
+        )
+        _schema_clients[schema] = pg
+    return pg.table(name)
+
+
+__all__ = ["open_supabase", "close_supabase", "get_sb", "sb_table"]
@@ -0,0 +1,19 @@
+# backend/tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+# модули бэкенда импортируются плоско (from db import ...), как при запуске из backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.py / admin_auth.py / supabase_client.py читают env при импорте;
+# тесты в сеть и в БД не ходят, значения нужны только чтобы модули загрузились
+for key, value in {
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_SERVICE_ROLE_KEY": "test-service-role",
+    "SUPABASE_ANON_KEY": "test-anon",
+    "SUPABASE_DB_URL": "postgresql://localhost/test",
+    "BOT_TOKEN": "123456:test-bot-token",
+    "API_SECRET": "test-secret",
+}.items():
+    os.environ.setdefault(key, value)
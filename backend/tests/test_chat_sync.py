@@ -0,0 +1,171 @@
+# backend/tests/test_chat_sync.py
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from chat_sync import DEFAULT_LIMIT, MAX_LIMIT, _anchor, _anchor_cond, fetch_messages, mark_read
+
+RID = "11111111-1111-1111-1111-111111111111"
+
+
+class _FakeCursor:
+    """Запоминает запросы, отдаёт заранее заданные строки."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+
+    async def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+
+    async def fetchall(self):
+        return self.results.pop(0)
+
+    async def fetchone(self):
+        return self.results.pop(0)
+
+
+def _fetch(cur, **kw):
+    return asyncio.run(fetch_messages(cur, RID, "m.id", **kw))
+
+
+# ─── якоря ──────────────────────────────────────────────────────────────────────
+def test_anchor_message_id():
+    mid = uuid.uuid4()
+    assert _anchor(f" {str(mid).upper()} ", "after") == ("id", str(mid))
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ("2025-01-02T03:04:05Z", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ("2025-01-02T03:04:05+00:00", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)),
+    ("2025-01-02", datetime(2025, 1, 2)),
+])
+def test_anchor_timestamp(raw, expected):
+    assert _anchor(raw, "after") == ("ts", expected)
+
+
+@pytest.mark.parametrize("raw", [None, "", "   "])
+def test_anchor_empty(raw):
+    assert _anchor(raw, "after") is None
+
+
+def test_anchor_junk_is_400():
+    with pytest.raises(HTTPException) as e:
+        _anchor("yesterday", "before")
+    assert e.value.status_code == 400
+    assert "before" in e.value.detail
+
+
+def test_anchor_cond_id_is_scoped_to_request():
+    params = {}
+    sql = _anchor_cond(("id", "abc"), ">", "after", params)
+    assert params == {"after": "abc"}
+    assert "(m.created_at, m.id) >" in sql
+    assert "a.request_id = m.request_id" in sql
+
+
+def test_anchor_cond_timestamp():
+    params = {}
+    ts = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert _anchor_cond(("ts", ts), "<", "before", params) == "m.created_at < %(before)s"
+    assert params == {"before": ts}
+
+
+# ─── fetch_messages ─────────────────────────────────────────────────────────────
+def test_no_cursor_no_limit_returns_full_history():
+    cur = _FakeCursor([{"id": i} for i in range(1000)])
+    rows, has_older, has_more = _fetch(cur)
+    assert len(rows) == 1000 and not has_older and not has_more
+    sql, _ = cur.executed[0]
+    assert "limit" not in sql
+
+
+def test_after_and_before_together_is_400():
+    with pytest.raises(HTTPException) as e:
+        _fetch(_FakeCursor(), after="2025-01-01", before="2025-01-02")
+    assert e.value.status_code == 400
+
+
+def test_after_page_reports_has_more():
+    mid = str(uuid.uuid4())
+    cur = _FakeCursor([{"id": i} for i in range(4)])
+    rows, has_older, has_more = _fetch(cur, after=mid, limit=3)
+    assert [r["id"] for r in rows] == [0, 1, 2]
+    assert has_more and not has_older
+    sql, params = cur.executed[0]
+    assert params["lim"] == 4 and params["after"] == mid
+    assert "order by m.created_at asc, m.id asc" in sql
+
+
+def test_after_last_page():
+    cur = _FakeCursor([{"id": 0}])
+    rows, _, has_more = _fetch(cur, after="2025-01-01T00:00:00Z", limit=3)
+    assert len(rows) == 1 and not has_more
+
+
+def test_before_page_drops_oldest_extra_row():
+    rows_in = [{"id": i, "_ord_ts": i, "_ord_id": i} for i in range(4)]
+    cur = _FakeCursor(rows_in)
+    rows, has_older, has_more = _fetch(cur, before=str(uuid.uuid4()), limit=3)
+    assert rows == [{"id": 1}, {"id": 2}, {"id": 3}]
+    assert has_older and not has_more
+    sql, _ = cur.executed[0]
+    assert "order by m.created_at desc, m.id desc limit %(lim)s" in sql
+
+
+def test_limit_only_returns_tail():
+    cur = _FakeCursor([{"id": 1}, {"id": 2}])
+    rows, has_older, _ = _fetch(cur, limit=5)
+    assert rows == [{"id": 1}, {"id": 2}] and not has_older
+    _, params = cur.executed[0]
+    assert "before" not in params and "after" not in params
+
+
+@pytest.mark.parametrize("limit,expected", [(0, DEFAULT_LIMIT), (10_000, MAX_LIMIT), (-5, 1)])
+def test_limit_is_clamped(limit, expected):
+    cur = _FakeCursor([])
+    _fetch(cur, after="2025-01-01", limit=limit)
+    assert cur.executed[0][1]["lim"] == expected + 1
+
+
+# ─── mark_read ──────────────────────────────────────────────────────────────────
+def _mark(cur, upto):
+    return asyncio.run(mark_read(cur, RID, "staff", upto))
+
+
+def test_mark_read_by_message_id_uses_its_time():
+    mid = str(uuid.uuid4())
+    ts = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+    cur = _FakeCursor({"created_at": ts}, {"staff_read_at": ts, "unread_by_staff": 2})
+    out = _mark(cur, mid)
+    assert out == {"request_id": RID, "read_at": ts, "unread": 2}
+    (lookup_sql, lookup_params), (_, params) = cur.executed
+    assert "where id = %s and request_id = %s" in lookup_sql
+    assert lookup_params == (mid, RID)
+    assert params["upto"] == ts
+
+
+def test_mark_read_foreign_message_id_is_404():
+    cur = _FakeCursor(None)
+    with pytest.raises(HTTPException) as e:
+        _mark(cur, str(uuid.uuid4()))
+    assert e.value.status_code == 404
+    # отметку не трогали
+    assert len(cur.executed) == 1
+
+
+def test_mark_read_by_timestamp_and_default_now():
+    ts = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    cur = _FakeCursor((ts, 0))
+    assert _mark(cur, "2025-01-01T00:00:00Z")["read_at"] == ts
+    assert cur.executed[0][1]["upto"] == ts
+
+    cur = _FakeCursor((ts, 0))
+    _mark(cur, None)
+    sql, params = cur.executed[0]
+    assert params["upto"] is None
+    assert "coalesce(%(upto)s::timestamptz, now())" in sql
+    assert "greatest(cs.staff_read_at, excluded.staff_read_at)" in sql
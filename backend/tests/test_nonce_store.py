@@ -0,0 +1,140 @@
+# backend/tests/test_nonce_store.py
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+nonce_store = pytest.importorskip("nonce_store")  # psycopg
+from nonce_store import MemoryNonceStore, NonceError, PostgresNonceStore  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# ─── memory ────────────────────────────────────────────────────────────────────
+def test_mark_used_once():
+    async def go():
+        store = MemoryNonceStore()
+        await store.create("n1", timedelta(minutes=5))
+        rec = await store.mark_used("n1", 42, admin_user_id="u1", exchange_token="t")
+        assert (rec.used, rec.tg_id, rec.admin_user_id, rec.exchange_token) == (True, 42, "u1", "t")
+        with pytest.raises(NonceError) as e:
+            await store.mark_used("n1", 43)
+        assert e.value.reason == "used"
+        assert (await store.get("n1")).tg_id == 42
+
+    _run(go())
+
+
+def test_concurrent_mark_used_has_single_winner():
+    async def go():
+        store = MemoryNonceStore()
+        await store.create("n1", timedelta(minutes=5))
+        results = await asyncio.gather(
+            *(store.mark_used("n1", tg_id) for tg_id in range(50)), return_exceptions=True
+        )
+        winners = [r for r in results if not isinstance(r, Exception)]
+        losers = [r for r in results if isinstance(r, NonceError)]
+        assert len(winners) == 1
+        assert len(losers) == 49 and {e.reason for e in losers} == {"used"}
+        assert (await store.get("n1")).tg_id == winners[0].tg_id
+
+    _run(go())
+
+
+def test_mark_used_expired_and_unknown():
+    async def go():
+        store = MemoryNonceStore()
+        await store.create("old", timedelta(seconds=-1))
+        for nonce, reason in (("old", "expired"), ("missing", "not_found")):
+            with pytest.raises(NonceError) as e:
+                await store.mark_used(nonce, 1)
+            assert e.value.reason == reason
+        assert not (await store.get("old")).used
+
+    _run(go())
+
+
+def test_sweep_keeps_recent():
+    async def go():
+        store = MemoryNonceStore()
+        await store.create("fresh", timedelta(minutes=5))
+        await store.create("stale", -nonce_store.NONCE_RETENTION - timedelta(minutes=1))
+        assert await store.sweep() == 1
+        assert await store.get("fresh") is not None
+        assert await store.get("stale") is None
+
+    _run(go())
+
+
+# ─── postgres: одна условная запись, причина отказа — вторым запросом ─────────
+class _FakeCursor:
+    def __init__(self, results):
+        self.results = list(results)
+        self.executed = []
+
+    async def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    async def fetchone(self):
+        return self.results.pop(0)
+
+
+class _Schema:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def has_column(self, table, column):
+        return column in self.columns
+
+
+@pytest.fixture
+def pg(monkeypatch):
+    def setup(results, columns=()):
+        cur = _FakeCursor(results)
+
+        @asynccontextmanager
+        async def fake_cursor(**kwargs):
+            yield cur
+
+        async def fake_schema():
+            return _Schema(set(columns))
+
+        monkeypatch.setattr(nonce_store, "db_acursor", fake_cursor)
+        monkeypatch.setattr(nonce_store, "get_schema", fake_schema)
+        return cur
+
+    return setup
+
+
+def _row(**kw):
+    row = {"nonce": "n1", "expires_at": datetime.now(timezone.utc), "used": True, "tg_id": 42}
+    row.update(kw)
+    return row
+
+
+def test_pg_mark_used_is_single_conditional_update(pg):
+    cur = pg([_row(admin_user_id="u1")], columns=("admin_user_id",))
+    rec = _run(PostgresNonceStore().mark_used("n1", 42, admin_user_id="u1", exchange_token="t"))
+    assert rec.used and rec.tg_id == 42 and rec.admin_user_id == "u1"
+    assert len(cur.executed) == 1
+    sql, params = cur.executed[0]
+    assert sql.startswith("update telegram_nonces set")
+    assert "not used and expires_at > now()" in sql
+    assert "admin_user_id = %(admin_user_id)s" in sql
+    assert "exchange_token" not in sql and "exchange_token" not in params
+
+
+@pytest.mark.parametrize("lookup,reason", [
+    (None, "not_found"),
+    ({"used": True}, "used"),
+    ({"used": False}, "expired"),
+])
+def test_pg_mark_used_failure_reason(pg, lookup, reason):
+    cur = pg([None, lookup])
+    with pytest.raises(NonceError) as e:
+        _run(PostgresNonceStore().mark_used("n1", 42))
+    assert e.value.reason == reason
+    assert len(cur.executed) == 2
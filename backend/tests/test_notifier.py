@@ -0,0 +1,224 @@
+# backend/tests/test_notifier.py
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+notifier = pytest.importorskip("notifier")  # psycopg (db.py)
+from notifier import Notifier, Outgoing, _PermanentError, _RateLimiter, _RetryAfter  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+# ─── rate limiter ───────────────────────────────────────────────────────────────
+def test_rate_limiter_spaces_out_calls():
+    async def go():
+        limiter = _RateLimiter(20, burst=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    # первый сразу, остальные 4 — по 1/20 с
+    assert _run(go()) >= 0.18
+
+
+def test_rate_limiter_allows_burst():
+    async def go():
+        limiter = _RateLimiter(1, burst=5)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert _run(go()) < 0.1
+
+
+def test_rate_limiter_concurrent_callers():
+    async def go():
+        limiter = _RateLimiter(50, burst=1)
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+        return time.monotonic() - start
+
+    assert _run(go()) >= 0.09
+
+
+# ─── отправка и 429 ─────────────────────────────────────────────────────────────
+def _notifier_with(handler):
+    n = Notifier()
+    n._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.test/botX")
+    return n
+
+
+def _send(handler, msg=None):
+    async def go():
+        n = _notifier_with(handler)
+        try:
+            await n._send(msg or Outgoing(chat_id=1, text="hi"))
+        finally:
+            await n._client.aclose()
+
+    _run(go())
+
+
+def test_send_ok_payload():
+    seen = {}
+
+    def handler(request):
+        seen["path"] = request.url.path
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json={"ok": True})
+
+    _send(handler, Outgoing(chat_id=5, text="<b>x</b>"))
+    assert seen["path"] == "/botX/sendMessage"
+    assert seen["body"] == {"chat_id": 5, "text": "<b>x</b>", "parse_mode": "HTML"}
+
+
+def test_send_429_uses_retry_after():
+    def handler(request):
+        return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 7}})
+
+    with pytest.raises(_RetryAfter) as e:
+        _send(handler)
+    assert e.value.seconds == 7.0
+
+
+def test_send_429_without_parameters_defaults_to_one_second():
+    with pytest.raises(_RetryAfter) as e:
+        _send(lambda request: httpx.Response(429, text="slow down"))
+    assert e.value.seconds == 1.0
+
+
+def test_send_4xx_is_permanent_5xx_is_retryable():
+    with pytest.raises(_PermanentError, match="chat not found"):
+        _send(lambda r: httpx.Response(400, json={"description": "Bad Request: chat not found"}))
+    with pytest.raises(RuntimeError, match="502"):
+        _send(lambda r: httpx.Response(502))
+
+
+def _deliver(handler, msg):
+    later = []
+
+    async def go():
+        n = _notifier_with(handler)
+        n._put_later = lambda m, delay: later.append((m, delay))
+        try:
+            await n._deliver(msg)
+        finally:
+            await n._client.aclose()
+        return n
+
+    return _run(go()), later
+
+
+def test_deliver_429_cools_down_chat_and_retries_after_delay():
+    msg = Outgoing(chat_id=77, text="hi")
+    before = time.monotonic()
+    n, later = _deliver(
+        lambda r: httpx.Response(429, json={"parameters": {"retry_after": 30}}), msg
+    )
+    assert later == [(msg, 30.0)]
+    assert msg.attempts == 1
+    # в этот чат не пишем раньше retry_after
+    assert n._chat_next[77] >= before + 30
+
+
+def test_deliver_gives_up_after_max_attempts():
+    msg = Outgoing(chat_id=1, text="hi", attempts=notifier.NOTIFY_MAX_ATTEMPTS - 1)
+    _, later = _deliver(lambda r: httpx.Response(500), msg)
+    assert later == []
+    assert msg.attempts == notifier.NOTIFY_MAX_ATTEMPTS
+
+
+def test_deliver_permanent_error_is_not_retried():
+    msg = Outgoing(chat_id=1, text="hi")
+    _, later = _deliver(lambda r: httpx.Response(403, json={"description": "bot was blocked"}), msg)
+    assert later == []
+
+
+# ─── outbox в транзакции вызывающего ────────────────────────────────────────────
+class _FakeConnection:
+    def __init__(self):
+        self.savepoints = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.savepoints += 1
+        yield
+
+
+class _FakeCursor:
+    def __init__(self, rows=None, fail=False):
+        self.connection = _FakeConnection()
+        self.rows = rows or []
+        self.fail = fail
+        self.executed = []
+
+    async def execute(self, sql, params=None):
+        if self.fail:
+            raise RuntimeError("relation telegram_outbox does not exist")
+        self.executed.append((sql, params))
+
+    async def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    monkeypatch.setattr(notifier, "TELEGRAM_BOT_TOKEN", "123:x")
+    monkeypatch.setattr(notifier, "NOTIFY_OUTBOX", True)
+
+
+def test_stage_many_inserts_on_callers_cursor(outbox):
+    # returning в произвольном порядке, одинаковые сообщения взаимозаменяемы
+    cur = _FakeCursor(rows=[
+        {"id": 12, "chat_id": 2, "text": "b"},
+        {"id": 10, "chat_id": 1, "text": "a"},
+        {"id": 11, "chat_id": 1, "text": "a"},
+    ])
+    msgs = _run(Notifier().stage_many(cur, [(1, "a"), (2, "b"), (None, "skip"), (1, "a")]))
+    assert [(m.chat_id, m.text) for m in msgs] == [(1, "a"), (2, "b"), (1, "a")]
+    assert sorted(m.outbox_id for m in msgs) == [10, 11, 12]
+    assert msgs[1].outbox_id == 12
+    assert cur.connection.savepoints == 1
+    sql, params = cur.executed[0]
+    assert "insert into telegram_outbox" in sql
+    assert params[2:] == ([1, 2, 1], ["a", "b", "a"])
+
+
+def test_stage_many_falls_back_to_memory_when_outbox_fails(outbox):
+    msgs = _run(Notifier().stage_many(_FakeCursor(fail=True), [(1, "a")]))
+    assert [(m.chat_id, m.outbox_id) for m in msgs] == [(1, None)]
+
+
+def test_stage_many_without_outbox_does_not_touch_db(monkeypatch):
+    monkeypatch.setattr(notifier, "TELEGRAM_BOT_TOKEN", "123:x")
+    monkeypatch.setattr(notifier, "NOTIFY_OUTBOX", False)
+    cur = _FakeCursor()
+    msgs = _run(Notifier().stage_many(cur, [(1, "a")]))
+    assert len(msgs) == 1 and cur.executed == []
+
+
+def test_dispatch_queues_without_db(outbox):
+    async def go():
+        n = Notifier()
+        msgs = [Outgoing(chat_id=1, text="a", outbox_id=5), Outgoing(chat_id=2, text="b")]
+        n.dispatch(msgs)
+        return n
+
+    n = _run(go())
+    assert n.qsize() == 2
+    assert n._inflight == {5}
+
+
+def test_disabled_notifier_stages_nothing(monkeypatch):
+    monkeypatch.setattr(notifier, "TELEGRAM_BOT_TOKEN", "")
+    cur = _FakeCursor()
+    assert _run(Notifier().stage_many(cur, [(1, "a")])) == []
+    assert cur.executed == []
@@ -0,0 +1,81 @@
+# backend/tests/test_pagination.py
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from utils.pagination import decode_cursor, encode_cursor, next_cursor
+
+
+def test_cursor_roundtrip():
+    ts = datetime(2025, 11, 19, 15, 30, 12, 345678, tzinfo=timezone.utc)
+    rid = uuid.uuid4()
+    cursor = encode_cursor(ts, rid)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (ts, str(rid))
+
+
+def test_cursor_keeps_offset():
+    ts = datetime(2025, 1, 1, 12, 0, tzinfo=timezone(timedelta(hours=3)))
+    decoded_ts, _ = decode_cursor(encode_cursor(ts, "x"))
+    assert decoded_ts == ts
+    assert decoded_ts.utcoffset() == timedelta(hours=3)
+
+
+def test_empty_cursor():
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("bad", ["%%%", "bm90IGpzb24", encode_cursor("not-a-date", "x")])
+def test_bad_cursor_is_400(bad):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(bad)
+    assert e.value.status_code == 400
+
+
+def test_next_cursor_trims_extra_row():
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [{"created_at": base - timedelta(minutes=i), "id": str(i)} for i in range(4)]
+    cursor = next_cursor(rows, 3)
+    assert len(rows) == 3
+    assert decode_cursor(cursor) == (rows[-1]["created_at"], "2")
+
+
+def test_next_cursor_last_page():
+    rows = [{"created_at": datetime(2025, 1, 1, tzinfo=timezone.utc), "id": "a"}]
+    assert next_cursor(rows, 1) is None
+    assert len(rows) == 1
+
+
+def test_next_cursor_tuple_rows():
+    ts = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [("a", ts), ("b", ts)]
+    assert decode_cursor(next_cursor(rows, 1, created_key=1, id_key=0)) == (ts, "a")
+
+
+def _page(rows, cursor, limit):
+    """Keyset-выборка как в SQL: (created_at, id) < курсора, desc, limit + 1."""
+    after = decode_cursor(cursor)
+    picked = [r for r in rows if after is None or (r["created_at"], r["id"]) < after]
+    picked = picked[: limit + 1]
+    return picked, next_cursor(picked, limit)
+
+
+def test_paging_visits_every_row_once():
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    # по три строки на один created_at — граница страницы проходит внутри группы
+    rows = [
+        {"created_at": base + timedelta(seconds=i // 3), "id": str(uuid.UUID(int=i))}
+        for i in range(20)
+    ]
+    rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = _page(rows, cursor, 4)
+        seen.extend(r["id"] for r in page)
+        if cursor is None:
+            break
+    assert seen == [r["id"] for r in rows]
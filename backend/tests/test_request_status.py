@@ -0,0 +1,76 @@
+# backend/tests/test_request_status.py
+import pytest
+
+from request_status import TRANSITIONS, can_transition, sources_for
+
+
+@pytest.mark.parametrize("src,dst", [
+    ("pending", "confirmed"),
+    ("pending", "in_progress"),
+    ("pending", "cancelled_by_user"),
+    ("confirmed", "done"),
+    ("in_progress", "done"),
+    ("in_progress", "cancelled"),
+])
+def test_allowed(src, dst):
+    assert can_transition(src, dst)
+
+
+@pytest.mark.parametrize("src,dst", [
+    ("done", "pending"),
+    ("cancelled", "confirmed"),
+    ("cancelled_by_user", "pending"),
+    ("in_progress", "pending"),
+    ("confirmed", "cancelled_by_user"),
+    ("pending", "pending"),
+    ("unknown", "done"),
+])
+def test_refused(src, dst):
+    assert not can_transition(src, dst)
+
+
+def test_sources_for_matches_table():
+    for dst in {d for targets in TRANSITIONS.values() for d in targets}:
+        assert sorted(sources_for(dst)) == sorted(s for s, t in TRANSITIONS.items() if dst in t)
+    assert sources_for("pending") == []
+
+
+# ─── /admin/requests ────────────────────────────────────────────────────────────
+@pytest.fixture
+def admin_requests():
+    # тянет psycopg/supabase — без них проверяем только таблицу переходов
+    return pytest.importorskip("admin_requests")
+
+
+def test_bulk_plan_splits_ids(admin_requests):
+    current = {"a": "pending", "b": "done", "c": "confirmed", "d": "in_progress"}
+    unchanged, to_change, refused = admin_requests._plan_status(["a", "b", "c", "d"], current, "done")
+    assert unchanged == ["b"]
+    assert to_change == ["c", "d"]
+    assert refused == [{"id": "a", "error": "transition pending -> done not allowed"}]
+
+
+def test_bulk_plan_keeps_order_and_terminal_states(admin_requests):
+    current = {"x": "cancelled", "y": "pending", "z": "pending"}
+    unchanged, to_change, refused = admin_requests._plan_status(["z", "x", "y"], current, "confirmed")
+    assert unchanged == []
+    assert to_change == ["z", "y"]
+    assert [f["id"] for f in refused] == ["x"]
+
+
+def test_bulk_requires_status_for_status_op(admin_requests):
+    with pytest.raises(ValueError):
+        admin_requests.AdminBulkIn(ids=["a"], op="status")
+    assert admin_requests.AdminBulkIn(ids=["a"], op="delete").status is None
+
+
+def test_single_status_missing_body_field_is_422(admin_requests):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.include_router(admin_requests.router)
+    app.dependency_overrides[admin_requests.require_admin] = lambda: {"sub": "test"}
+    client = TestClient(app)
+    r = client.post("/admin/requests/00000000-0000-0000-0000-000000000001/status", json={})
+    assert r.status_code == 422
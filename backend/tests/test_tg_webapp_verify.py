@@ -0,0 +1,145 @@
+# backend/tests/test_tg_webapp_verify.py
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from utils import tg_webapp_verify as v
+from utils.tg_webapp_verify import InitDataError, verify_init_data
+
+BOT_TOKEN = "123456:test-bot-token"
+
+
+def _signed(fields: dict, token: str = BOT_TOKEN) -> str:
+    """initData, подписанный так же, как это делает Telegram."""
+    dcs = "\n".join(f"{k}={val}" for k, val in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    sig = hmac.new(secret, dcs.encode(), hashlib.sha256).hexdigest()
+    return urlencode({**fields, "hash": sig})
+
+
+def _user_fields(auth_date=None, **extra):
+    fields = {"user": json.dumps({"id": 42, "first_name": "Ann"}), "query_id": "q1", **extra}
+    if auth_date is not None:
+        fields["auth_date"] = str(auth_date)
+    return fields
+
+
+@pytest.fixture(autouse=True)
+def _clean_cache():
+    v._verified.clear()
+    yield
+    v._verified.clear()
+
+
+@pytest.fixture
+def dcs_calls(monkeypatch):
+    """Сколько раз строилась data_check_string, т.е. сколько было полных проверок."""
+    calls = []
+    real = v._build_data_check_string
+
+    def counting(pairs):
+        calls.append(pairs)
+        return real(pairs)
+
+    monkeypatch.setattr(v, "_build_data_check_string", counting)
+    return calls
+
+
+def test_valid_init_data():
+    data = verify_init_data(_signed(_user_fields(int(time.time()))), BOT_TOKEN)
+    assert data["user_obj"]["id"] == 42
+    assert data["query_id"] == "q1"
+
+
+def test_tampered_hash_rejected():
+    raw = _signed(_user_fields(int(time.time()))).replace("query_id=q1", "query_id=q2")
+    with pytest.raises(InitDataError, match="Hash mismatch"):
+        verify_init_data(raw, BOT_TOKEN)
+
+
+def test_wrong_bot_token_rejected():
+    raw = _signed(_user_fields(int(time.time())), token="999:other")
+    with pytest.raises(InitDataError):
+        verify_init_data(raw, BOT_TOKEN)
+
+
+def test_repeat_is_served_from_cache(dcs_calls):
+    raw = _signed(_user_fields(int(time.time())))
+    first = verify_init_data(raw, BOT_TOKEN)
+    second = verify_init_data(raw, BOT_TOKEN)
+    assert first == second
+    assert len(dcs_calls) == 1
+
+
+def test_cached_result_is_a_copy():
+    raw = _signed(_user_fields(int(time.time())))
+    verify_init_data(raw, BOT_TOKEN)["query_id"] = "mutated"
+    assert verify_init_data(raw, BOT_TOKEN)["query_id"] == "q1"
+
+
+def test_cache_is_per_bot_token(dcs_calls):
+    raw = _signed(_user_fields(int(time.time())))
+    verify_init_data(raw, BOT_TOKEN)
+    with pytest.raises(InitDataError):
+        verify_init_data(raw, "999:other")
+    assert len(dcs_calls) == 2
+
+
+def test_failures_are_not_cached(dcs_calls):
+    raw = _signed(_user_fields(int(time.time()))) + "0"
+    for _ in range(2):
+        with pytest.raises(InitDataError):
+            verify_init_data(raw, BOT_TOKEN)
+    assert len(dcs_calls) == 2
+
+
+def test_expired_auth_date_rejected():
+    raw = _signed(_user_fields(int(time.time()) - 7200))
+    with pytest.raises(InitDataError, match="expired"):
+        verify_init_data(raw, BOT_TOKEN, max_age_seconds=3600)
+
+
+def test_age_checked_on_cache_hit(monkeypatch):
+    now = time.time()
+    raw = _signed(_user_fields(int(now)))
+    verify_init_data(raw, BOT_TOKEN, max_age_seconds=3600)
+    monkeypatch.setattr(v.time, "time", lambda: now + 3601)
+    with pytest.raises(InitDataError, match="expired"):
+        verify_init_data(raw, BOT_TOKEN, max_age_seconds=3600)
+
+
+def test_cache_entry_expires_with_auth_date(monkeypatch, dcs_calls):
+    now = time.time()
+    raw = _signed(_user_fields(int(now)))
+    verify_init_data(raw, BOT_TOKEN, max_age_seconds=0)
+    monkeypatch.setattr(v.time, "time", lambda: now + v.VERIFIED_CACHE_MAX_AGE + 1)
+    verify_init_data(raw, BOT_TOKEN, max_age_seconds=0)
+    assert len(dcs_calls) == 2
+
+
+def test_cache_entry_without_auth_date_uses_short_ttl(monkeypatch, dcs_calls):
+    now = time.time()
+    raw = _signed(_user_fields())
+    verify_init_data(raw, BOT_TOKEN)
+    monkeypatch.setattr(v.time, "time", lambda: now + v.VERIFIED_CACHE_NO_AUTH_TTL - 1)
+    verify_init_data(raw, BOT_TOKEN)
+    assert len(dcs_calls) == 1
+    monkeypatch.setattr(v.time, "time", lambda: now + v.VERIFIED_CACHE_NO_AUTH_TTL + 1)
+    verify_init_data(raw, BOT_TOKEN)
+    assert len(dcs_calls) == 2
+
+
+def test_lru_evicts_oldest():
+    cache = v._VerifiedCache(maxsize=2)
+    auth = int(time.time())
+    cache.put("a", auth, {"n": 1})
+    cache.put("b", auth, {"n": 2})
+    assert cache.get("a") is not None  # a теперь свежее b
+    cache.put("c", auth, {"n": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == (auth, {"n": 1})
+    assert cache.get("c") == (auth, {"n": 3})
@@ -1,4 +1,8 @@
 # backend/tg_bot.py
+# Режимы:
+#   polling — отдельный процесс `python tg_bot.py`, nonce подтверждается HTTP-запросом на API_CALLBACK;
+#   webhook — бот живёт внутри API (routes/tg_webhook.py), который передаёт в хендлер
+#             confirm_login и подтверждение идёт без сетевого хопа.
 import os, asyncio
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message
@@ -9,24 +13,34 @@ API_CALLBACK = os.getenv("API_CALLBACK", "http://localhost:8000/admin/auth/teleg
 
 bot = Bot(BOT_TOKEN)
 dp = Dispatcher()
+# один клиент на процесс: keep-alive до API вместо нового соединения на каждый /start
+http = httpx.AsyncClient(timeout=10)
+
+
+async def _confirm_over_http(nonce: str, tg_id: int, tg_username: str) -> bool:
+    # Отправляем callback на бэкенд
+    r = await http.post(API_CALLBACK, json={
+        "nonce": nonce,
+        "tg_id": tg_id,
+        "tg_username": tg_username
+    })
+    return r.status_code == 200
+
 
 @dp.message(F.text.regexp(r"^/start\s+(.+)"))
-async def start_with_nonce(msg: Message):
+async def start_with_nonce(msg: Message, confirm_login=None):
     nonce = msg.text.split(maxsplit=1)[1]
-    # Отправляем callback на бэкенд
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.post(API_CALLBACK, json={
-            "nonce": nonce,
-            "tg_id": msg.from_user.id,
-            "tg_username": msg.from_user.username or ""
-        })
-    if r.status_code == 200:
+    confirm = confirm_login or _confirm_over_http
+    if await confirm(nonce, msg.from_user.id, msg.from_user.username or ""):
         await msg.answer("✅ Подтверждено. Вернись в браузер — вход завершится автоматически.")
     else:
         await msg.answer("❌ Не удалось подтвердить. Нонc недействителен или у вас нет доступа.")
 
 async def main():
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await http.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
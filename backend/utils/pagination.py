@@ -0,0 +1,43 @@
+# utils/pagination.py
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Заголовок ответа со следующим курсором (тело списков остаётся массивом)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: Any, id_: Any) -> str:
+    """Непрозрачный курсор по (created_at, id) последней отданной строки."""
+    ts = created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at)
+    raw = json.dumps([ts, str(id_)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    if not cursor:
+        return None
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        ts, id_ = json.loads(base64.urlsafe_b64decode(cursor + pad))
+        dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        return dt, str(id_)
+    except Exception:
+        raise HTTPException(status_code=400, detail="bad cursor")
+
+
+def next_cursor(rows: list, limit: int, created_key: Any = "created_at", id_key: Any = "id") -> Optional[str]:
+    """
+    Курсор для следующей страницы. rows выбраны с limit + 1:
+    лишняя строка означает, что дальше есть ещё (и обрезается здесь же).
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(last[created_key], last[id_key])
@@ -0,0 +1,39 @@
+# backend/utils/stream_token.py
+from __future__ import annotations
+
+import hashlib, hmac, os, time
+from typing import Optional
+
+# Короткоживущий токен для SSE резидента (/api/events). EventSource не умеет заголовки,
+# а initData в ?query= оседал бы в access-логах прокси. Клиент меняет initData на токен
+# через POST /api/events/token и открывает поток с ?token=. Токен stateless (HMAC),
+# поэтому годится на любом воркере. Проверяется только при подключении и живёт
+# STREAM_TOKEN_TTL секунд; открытый поток присылает свежий (event: token) до истечения.
+STREAM_TOKEN_TTL = int(os.getenv("STREAM_TOKEN_TTL", "60"))
+
+_BOT_TOKEN = (os.environ.get("TELEGRAM_BOT_TOKEN") or os.environ.get("BOT_TOKEN") or "").strip()
+_KEY = hashlib.sha256(b"uv-stream-token\n" + _BOT_TOKEN.encode("utf-8")).digest()
+
+
+def _sign(body: str) -> str:
+    return hmac.new(_KEY, body.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def issue_stream_token(tg_id: int) -> str:
+    body = f"{int(tg_id)}.{int(time.time()) + STREAM_TOKEN_TTL}"
+    return f"{body}.{_sign(body)}"
+
+
+def read_stream_token(token: str) -> Optional[int]:
+    """tg_id из валидного непросроченного токена, иначе None."""
+    if not _BOT_TOKEN:
+        # без секрета ключ предсказуем — такие токены не принимаем
+        return None
+    try:
+        tg_id, exp, sig = (token or "").strip().split(".")
+        body = f"{tg_id}.{exp}"
+        if not hmac.compare_digest(sig, _sign(body)) or int(exp) < time.time():
+            return None
+        return int(tg_id)
+    except ValueError:
+        return None
@@ -1,24 +1,61 @@
 from __future__ import annotations
 from typing import Optional, Dict, Any
-from fastapi import Header, HTTPException, Body, Request
+from fastapi import Header, HTTPException, Request
 from config import settings
 from utils.tg_webapp_verify import verify_init_data, InitDataError
 import json
 
-async def extract_user_from_request(
-    request: Request,
-    x_telegram_init_data: Optional[str] = Header(default=None, alias="X-Telegram-Init-Data"),
-):
-    # пробуем прочитать сырое тело (если фронт положил initData в body)
+# заголовки, в которых фронт может прислать initData (starlette сравнивает без учёта регистра)
+INIT_DATA_HEADERS = ("X-Telegram-Init-Data", "X-Init-Data")
+# тело смотрим только у методов, где оно вообще бывает
+_BODY_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+def init_data_from_headers(request: Request, explicit: Optional[str] = None) -> str:
+    raw = (explicit or "").strip()
+    if raw:
+        return raw
+    for name in INIT_DATA_HEADERS:
+        raw = (request.headers.get(name) or "").strip()
+        if raw:
+            return raw
+    return ""
+
+
+async def read_json_body(request: Request) -> Any:
+    """
+    JSON-тело запроса или None.
+    Request.json() кэширует результат на объекте запроса, и FastAPI валидирует
+    Body(...)-модели (RequestCreate, RequestMessageCreate) из того же кэша —
+    тело читается и парсится один раз.
+    """
+    if request.method not in _BODY_METHODS:
+        return None
+    ctype = (request.headers.get("content-type") or "").lower()
+    if "json" not in ctype:
+        return None
     try:
-        raw_body = await request.json()
+        return await request.json()
     except Exception:
-        raw_body = None
-    raw = (x_telegram_init_data or "").strip()
-    if not raw and isinstance(raw_body, dict):
-        raw = (raw_body.get("initData") or raw_body.get("__initData") or "").strip()
-    if not raw:
-        raise HTTPException(401, "Missing initData (header/body)")
+        return None
+
+
+async def resolve_init_data(request: Request, explicit: Optional[str] = None) -> str:
+    """initData: сначала заголовки, и только если их нет — поле initData/__initData в JSON-теле."""
+    raw = init_data_from_headers(request, explicit)
+    if raw:
+        return raw
+    body = await read_json_body(request)
+    if isinstance(body, dict):
+        return (body.get("initData") or body.get("__initData") or "").strip()
+    return ""
+
+
+def _user_from_init_data(request: Request, raw: str) -> Dict[str, Any]:
+    # мидлварь уже проверила эту же строку — берём готового пользователя
+    verified = getattr(request.state, "tg_user", None)
+    if verified and raw == getattr(request.state, "init_data", None):
+        return verified
 
     try:
         data = verify_init_data(raw, settings()["BOT_TOKEN"], max_age_seconds=24*3600)
@@ -34,3 +71,25 @@ async def extract_user_from_request(
     if not user_obj or "id" not in user_obj:
         raise HTTPException(401, "initData: user missing")
     return user_obj  # содержит как минимум id, username?, language_code?
+
+
+async def current_tg_user(request: Request) -> Dict[str, Any]:
+    """FastAPI-зависимость: проверенный Telegram-пользователь текущего запроса."""
+    verified = getattr(request.state, "tg_user", None)
+    if verified:
+        # мидлварь уже проверила initData (или ?token= для SSE)
+        return verified
+    raw = await resolve_init_data(request)
+    if not raw:
+        raise HTTPException(401, "Missing initData (header/body)")
+    return _user_from_init_data(request, raw)
+
+
+async def extract_user_from_request(
+    request: Request,
+    x_telegram_init_data: Optional[str] = Header(default=None, alias="X-Telegram-Init-Data"),
+):
+    raw = await resolve_init_data(request, x_telegram_init_data)
+    if not raw:
+        raise HTTPException(401, "Missing initData (header/body)")
+    return _user_from_init_data(request, raw)
@@ -3,10 +3,20 @@ from __future__ import annotations
 import hashlib
 import hmac
 import json
+import threading
 import time
-from typing import Any, Dict, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 from urllib.parse import parse_qsl
 
+# Кэш уже проверенных initData: mini app шлёт одну и ту же строку в каждом запросе,
+# поэтому повторно парсить и хешировать её незачем. Ключ — sha256(bot_token + initData),
+# запись живёт до auth_date + VERIFIED_CACHE_MAX_AGE (или VERIFIED_CACHE_NO_AUTH_TTL без auth_date).
+VERIFIED_CACHE_SIZE = 2048
+VERIFIED_CACHE_MAX_AGE = 24 * 3600
+VERIFIED_CACHE_NO_AUTH_TTL = 300
+
 # Исключение для удобства
 class InitDataError(Exception):
     pass
@@ -20,6 +30,7 @@ def _build_data_check_string(pairs: Tuple[Tuple[str, str], ...]) -> str:
     filtered.sort(key=lambda kv: kv[0])  # лексикографическая сортировка по ключу
     return "\n".join(f"{k}={v}" for k, v in filtered)
 
+@lru_cache(maxsize=8)
 def _compute_secret_key(bot_token: str) -> bytes:
     # ВАЖНО: секрет для WebApp = HMAC_SHA256(key="WebAppData", data=BOT_TOKEN)
     return hmac.new(b"WebAppData", bot_token.encode("utf-8"), hashlib.sha256).digest()
@@ -27,14 +38,69 @@ def _compute_secret_key(bot_token: str) -> bytes:
 def _compute_signature(secret_key: bytes, data_check_string: str) -> str:
     return hmac.new(secret_key, data_check_string.encode("utf-8"), hashlib.sha256).hexdigest()
 
+class _VerifiedCache:
+    """Маленький потокобезопасный LRU с TTL: key -> (expires_at, auth_ts, data)."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, Tuple[float, Optional[int], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Optional[int], Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, auth_ts, data = item
+            if expires_at <= now:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return auth_ts, data
+
+    def put(self, key: str, auth_ts: Optional[int], data: Dict[str, Any]) -> None:
+        if auth_ts is not None:
+            expires_at = auth_ts + VERIFIED_CACHE_MAX_AGE
+        else:
+            expires_at = time.time() + VERIFIED_CACHE_NO_AUTH_TTL
+        with self._lock:
+            self._items[key] = (expires_at, auth_ts, data)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+_verified = _VerifiedCache(VERIFIED_CACHE_SIZE)
+
+
+def _check_age(auth_ts: Optional[int], max_age_seconds: int) -> None:
+    if auth_ts is None or not max_age_seconds:
+        return
+    if (int(time.time()) - auth_ts) > max_age_seconds:
+        raise InitDataError("initData expired")
+
+
 def verify_init_data(init_data_raw: str, bot_token: str, max_age_seconds: int = 24 * 3600) -> Dict[str, Any]:
     """
     Проверяет подпись initData и возвращает распарсенный словарь.
     Бросает InitDataError при любой проблеме.
+    Успешные проверки кэшируются (см. _VerifiedCache), срок auth_date проверяется всегда.
     """
     if not init_data_raw:
         raise InitDataError("Empty initData")
 
+    cache_key = hashlib.sha256(f"{bot_token}\n{init_data_raw}".encode("utf-8")).hexdigest()
+    hit = _verified.get(cache_key)
+    if hit is not None:
+        auth_ts, cached = hit
+        _check_age(auth_ts, max_age_seconds)
+        return dict(cached)
+
     # parse_qsl ДЕКОДИРУЕТ %xx и '+', НО не трогай результат повторно
     pairs = tuple(parse_qsl(init_data_raw, keep_blank_values=True, strict_parsing=False))
     data = {k: v for k, v in pairs}
@@ -54,14 +120,13 @@ def verify_init_data(init_data_raw: str, bot_token: str, max_age_seconds: int =
         raise InitDataError("Hash mismatch")
 
     # Проверяем возраст auth_date (если есть)
+    auth_ts: Optional[int] = None
     if "auth_date" in data:
         try:
             auth_ts = int(data["auth_date"])
         except ValueError:
             raise InitDataError("Invalid auth_date")
-        now = int(time.time())
-        if max_age_seconds and (now - auth_ts) > max_age_seconds:
-            raise InitDataError("initData expired")
+        _check_age(auth_ts, max_age_seconds)
 
     # Можно распарсить user (НЕ для подписи, только для удобства)
     if "user" in data:
@@ -71,4 +136,5 @@ def verify_init_data(init_data_raw: str, bot_token: str, max_age_seconds: int =
             # не критично для подписи; оставим как строку
             pass
 
-    return data
+    _verified.put(cache_key, auth_ts, data)
+    return dict(data)
@@ -68,15 +68,18 @@ export async function startTelegram(): Promise<TelegramStartResponse> {
   return r.json();
 }
 
-export async function waitTelegram(nonce: string, tries = 60): Promise<TelegramWaitResponse> {
-  for (let i = 0; i < tries; i++) {
+// Long-poll: сервер держит запрос до подтверждения в боте (или ~25 с),
+// поэтому обычно это один запрос на весь логин.
+export async function waitTelegram(nonce: string, maxWaitMs = 5 * 60 * 1000): Promise<TelegramWaitResponse> {
+  const deadline = Date.now() + maxWaitMs;
+  while (Date.now() < deadline) {
     const r = await authedFetch("/admin/auth/telegram/wait", {
       method: "POST",
-      body: JSON.stringify({ nonce }),
+      body: JSON.stringify({ nonce, timeout: 25 }),
     });
-    const data: TelegramWaitResponse = await r.json();
+    const data: TelegramWaitResponse & { expired?: boolean } = await r.json();
     if (data.ready) return data;
-    await new Promise((res) => setTimeout(res, 1000));
+    if (data.expired) break;
   }
   throw new Error("Timeout waiting for Telegram confirmation");
 }
@@ -131,7 +134,9 @@ export interface AdminRequest {
   internal_only?: boolean | null;
   auto_assign?: boolean | null;
   assignee?: string | null;
-  photos?: Array<{ url?: string; path?: string; name?: string }> | null;
+  photos?: Array<{ id?: string; url?: string; path?: string; name?: string }> | null;
+  // только в projection=list: URL превью вместо полноразмерных photos
+  thumbs?: string[];
   photo_paths?: string[] | null;
   photo_urls?: string[] | null;
   attachments?: any[] | null;
@@ -139,6 +144,12 @@ export interface AdminRequest {
   image?: string | null;
   created_at: string;
   updated_at: string;
+  // состояние чата (request_chat_state)
+  last_message_at?: string | null;
+  last_author_role?: string | null;
+  last_message_preview?: string | null;
+  unread_by_staff?: number;
+  unread_by_resident?: number;
 }
 
 export interface AdminRequestMessage {
@@ -152,71 +163,69 @@ export interface AdminRequestMessage {
 
 export type RequestMessage = AdminRequestMessage;
 
-const FULL_SELECT = [
-  "id",
-  "status",
-  "category",
-  "service",
-  "service_code",
-  "service_title",
-  "name",
-  "username",
-  "resident",
-  "phone",
-  "resident_phone",
-  "contact_name",
-  "contact_phone",
-  "unit",
-  "resident_unit_text",
-  "unit_number",
-  "address",
-  "property_name",
-  "title",
-  "description",
-  "details",
-  "desritption",
-  "desc",
-  "preferred_time",
-  "due_at",
-  "priority",
-  "internal_only",
-  "auto_assign",
-  "assignee",
-  "photos",
-  "photo_paths",
-  "photo_urls",
-  "attachments",
-  "photo",
-  "image",
-  "created_at",
-  "updated_at",
-].join(",");
-
-export async function adminListRequests(params?: {
+// Набор колонок выбирает бэкенд: "list" — компактный для таблицы,
+// "detail" — всё (whitelist SELECTABLE_COLUMNS в admin_requests.py).
+// Явный select= по-прежнему можно передать, лишние колонки сервер отбросит.
+export type AdminProjection = "list" | "detail";
+
+export interface AdminListParams {
   status?: DbStatus | "all";
   q?: string;
   limit?: number;
   offset?: number;
+  // курсор из предыдущей страницы (next_cursor); вместо offset
+  cursor?: string | null;
   select?: string;
-}): Promise<AdminRequest[]> {
+  projection?: AdminProjection;
+}
+
+export interface AdminRequestsPage {
+  items: AdminRequest[];
+  // null — дальше страниц нет
+  next_cursor: string | null;
+}
+
+function adminListUrl(params?: AdminListParams): string {
   const url = new URL("/admin/requests", window.location.origin);
-  url.searchParams.set("select", params?.select || FULL_SELECT);
+  if (params?.select) url.searchParams.set("select", params.select);
+  else url.searchParams.set("projection", params?.projection || "list");
   if (params?.status && params.status !== "all") {
     url.searchParams.set("status", params.status);
   }
   if (params?.q) url.searchParams.set("q", params.q);
   if (params?.limit) url.searchParams.set("limit", String(params.limit));
-  if (params?.offset) url.searchParams.set("offset", String(params.offset));
+  if (params?.cursor) url.searchParams.set("cursor", params.cursor);
+  else if (params?.offset) url.searchParams.set("offset", String(params.offset));
+  return url.toString();
+}
 
-  const r = await authedFetch(url.toString());
+export async function adminListRequests(params?: AdminListParams): Promise<AdminRequest[]> {
+  const r = await authedFetch(adminListUrl(params));
+  return r.json();
+}
+
+// Keyset-пагинация: следующий курсор приходит в заголовке X-Next-Cursor
+export async function adminListRequestsPage(params?: AdminListParams): Promise<AdminRequestsPage> {
+  const r = await authedFetch(adminListUrl(params));
+  const items: AdminRequest[] = await r.json();
+  return { items, next_cursor: r.headers.get("X-Next-Cursor") };
+}
+
+// Поиск для command palette (ранжированный, префиксный); звать с debounce
+export async function adminSearchRequests(
+  q: string,
+  opts?: { limit?: number; signal?: AbortSignal }
+): Promise<AdminRequest[]> {
+  const url = new URL("/admin/requests/search", window.location.origin);
+  url.searchParams.set("q", q);
+  if (opts?.limit) url.searchParams.set("limit", String(opts.limit));
+  const r = await authedFetch(url.toString(), { signal: opts?.signal });
   return r.json();
 }
 
 export async function adminGetRequest(id: string): Promise<AdminRequest> {
   const url = new URL(`/admin/requests/${id}`, window.location.origin);
-  if (!url.searchParams.get("select")) {
-    url.searchParams.set("select", FULL_SELECT);
-  }
+  url.searchParams.set("projection", "detail");
   const r = await authedFetch(url.toString());
   return r.json();
 }
@@ -242,6 +251,25 @@ export async function adminDeleteRequest(id: string): Promise<{ ok: boolean; id:
   return r.json();
 }
 
+export type AdminBulkOp =
+  | { op: "status"; status: DbStatus }
+  | { op: "assign"; assignee?: string | null }
+  | { op: "delete" };
+
+export type AdminBulkResult = {
+  updated: AdminRequest[];
+  deleted: string[];
+  failed: { id: string; error: string }[];
+};
+
+export async function adminBulk(ids: string[], op: AdminBulkOp): Promise<AdminBulkResult> {
+  const r = await authedFetch(`/admin/requests/bulk`, {
+    method: "POST",
+    body: JSON.stringify({ ids, ...op }),
+  });
+  return r.json();
+}
+
 // ===== Admin: Request messages (чат) =====
 export async function adminListRequestMessages(
   requestId: string
@@ -250,6 +278,32 @@ export async function adminListRequestMessages(
   return r.json();
 }
 
+export interface AdminMessagesPage {
+  items: AdminRequestMessage[];
+  // есть сообщения старше первого в items (грузить через before)
+  has_older: boolean;
+  // after-страница обрезана по limit — запросить ещё раз с последним id
+  has_more: boolean;
+}
+
+// Инкрементальная синхронизация чата: after — id последнего полученного
+// сообщения (только новые), before — id первого (страница истории).
+export async function adminSyncRequestMessages(
+  requestId: string,
+  opts?: { after?: string; before?: string; limit?: number }
+): Promise<AdminMessagesPage> {
+  const url = new URL(`/admin/requests/${requestId}/messages`, window.location.origin);
+  if (opts?.after) url.searchParams.set("after", opts.after);
+  if (opts?.before) url.searchParams.set("before", opts.before);
+  if (opts?.limit) url.searchParams.set("limit", String(opts.limit));
+  const r = await authedFetch(url.toString());
+  return {
+    items: await r.json(),
+    has_older: r.headers.get("X-Has-Older") === "1",
+    has_more: r.headers.get("X-Has-More") === "1",
+  };
+}
+
 export async function adminCreateRequestMessage(
   requestId: string,
   body: string
@@ -259,4 +313,136 @@ export async function adminCreateRequestMessage(
     body: JSON.stringify({ body }),
   });
   return r.json();
-}
\ No newline at end of file
+}
+
+// Отметить чат прочитанным персоналом до upto (id/iso сообщения; по умолчанию — всё)
+export async function adminMarkMessagesRead(
+  requestId: string,
+  upto?: string
+): Promise<{ request_id: string; read_at: string; unread: number }> {
+  const r = await authedFetch(`/admin/requests/${requestId}/messages/read`, {
+    method: "POST",
+    body: JSON.stringify({ upto: upto ?? null }),
+  });
+  return r.json();
+}
+
+// ===== Admin: статистика (дашборд) =====
+export type StatsGranularity = "hour" | "day";
+
+export interface StatsCounts {
+  created: number;
+  confirmed: number;
+  done: number;
+  cancelled: number;
+}
+
+export interface AdminStats {
+  granularity: StatsGranularity;
+  from: string;
+  to: string;
+  category: string | null;
+  // бакеты без пропусков, по возрастанию
+  series: Array<StatsCounts & { bucket: string }>;
+  totals: StatsCounts;
+  by_category: Array<StatsCounts & { category: string }>;
+  // текущее число заявок по (категория, статус)
+  status_counts: Array<{ category: string; status: DbStatus; n: number }>;
+}
+
+export async function adminStats(params?: {
+  granularity?: StatsGranularity;
+  from?: string;
+  to?: string;
+  buckets?: number;
+  category?: string;
+}): Promise<AdminStats> {
+  const url = new URL("/admin/stats", window.location.origin);
+  if (params?.granularity) url.searchParams.set("granularity", params.granularity);
+  if (params?.from) url.searchParams.set("from", params.from);
+  if (params?.to) url.searchParams.set("to", params.to);
+  if (params?.buckets) url.searchParams.set("buckets", String(params.buckets));
+  if (params?.category) url.searchParams.set("category", params.category);
+  const r = await authedFetch(url.toString());
+  return r.json();
+}
+
+// Время реакции: секунды от создания; null — нет закрытых заявок в группе
+export interface SlaRow {
+  requests: number;
+  confirmed: number;
+  done: number;
+  confirm_p50_s: number | null;
+  confirm_p90_s: number | null;
+  done_p50_s: number | null;
+  done_p90_s: number | null;
+}
+
+export interface AdminSla {
+  from: string;
+  to: string;
+  category: string | null;
+  overall: SlaRow;
+  by_category: Array<SlaRow & { category: string }>;
+  by_assignee: Array<SlaRow & { assignee: string | null }>;
+}
+
+export async function adminSla(params?: {
+  from?: string;
+  to?: string;
+  days?: number;
+  category?: string;
+}): Promise<AdminSla> {
+  const url = new URL("/admin/stats/sla", window.location.origin);
+  if (params?.from) url.searchParams.set("from", params.from);
+  if (params?.to) url.searchParams.set("to", params.to);
+  if (params?.days) url.searchParams.set("days", String(params.days));
+  if (params?.category) url.searchParams.set("category", params.category);
+  const r = await authedFetch(url.toString());
+  return r.json();
+}
+
+export interface AdminStatusEvent {
+  id: number;
+  from_status: DbStatus | null;
+  to_status: DbStatus;
+  changed_at: string;
+  actor: string | null;
+}
+
+export async function adminRequestHistory(id: string): Promise<AdminStatusEvent[]> {
+  const r = await authedFetch(`/admin/requests/${id}/history`);
+  return r.json();
+}
+
+// ===== Admin: push-события (SSE) =====
+export type AdminEventKind = "request" | "message" | "resync";
+
+export interface AdminEvent {
+  kind: AdminEventKind;
+  op?: "insert" | "update" | "delete";
+  id?: string;
+  request_id?: string;
+  status?: DbStatus;
+  old_status?: DbStatus | null;
+  author_role?: string;
+  created_at?: string;
+  updated_at?: string;
+}
+
+// Подписка на /admin/events; "resync" — перечитать списки целиком.
+// Возвращает функцию отписки.
+export function adminSubscribeEvents(onEvent: (e: AdminEvent) => void): () => void {
+  const es = new EventSource("/admin/events", { withCredentials: true });
+  const handler = (msg: MessageEvent) => {
+    try {
+      onEvent(JSON.parse(msg.data));
+    } catch {
+      // ignore malformed payloads
+    }
+  };
+  (["request", "message", "resync"] as AdminEventKind[]).forEach((k) =>
+    es.addEventListener(k, handler as EventListener)
+  );
+  return () => es.close();
+}
@@ -0,0 +1,41 @@
+import { useEffect, useState } from "react";
+import { adminSearchRequests } from "../api";
+import type { AdminRequest } from "../api";
+
+const DEBOUNCE_MS = 250;
+
+// Debounced-поиск заявок для command palette: один запрос после паузы в наборе,
+// предыдущий незавершённый запрос отменяется.
+export function useRequestSearch(query: string, limit = 20) {
+  const [results, setResults] = useState<AdminRequest[]>([]);
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults([]);
+      setLoading(false);
+      return;
+    }
+
+    const controller = new AbortController();
+    const timer = window.setTimeout(() => {
+      setLoading(true);
+      adminSearchRequests(q, { limit, signal: controller.signal })
+        .then(setResults)
+        .catch((err) => {
+          if (err?.name !== "AbortError") setResults([]);
+        })
+        .finally(() => {
+          if (!controller.signal.aborted) setLoading(false);
+        });
+    }, DEBOUNCE_MS);
+
+    return () => {
+      window.clearTimeout(timer);
+      controller.abort();
+    };
+  }, [query, limit]);
+
+  return { results, loading };
+}